@@ -0,0 +1,127 @@
+from typing import Dict, Any, List, Optional
+from collections import OrderedDict
+import hashlib
+import json
+import random
+import re
+import time
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivially different inputs share a key"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+class ResponseCache:
+    """
+    Two-tier cache for agent LLM results shared by all agents
+    An in-process LRU sits in front of Redis. Each key holds a small list
+    of variants: deterministic calls need one, sampled calls (temperature
+    above LLM_CACHE_DETERMINISTIC_TEMPERATURE) are only served from cache
+    once LLM_CACHE_SAMPLED_VARIANTS different answers have been collected,
+    so replies keep some variety
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or get_redis()
+        self._local = OrderedDict()  # key -> (expires_at, [variants])
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+            "errors": 0
+        }
+
+    def make_key(self, namespace: str, **parts) -> str:
+        digest = hashlib.sha256(
+            json.dumps(parts, sort_keys=True, default=str).encode()
+        ).hexdigest()
+        return f"llmcache:{namespace}:{digest}"
+
+    def variants_for(self, temperature: float) -> int:
+        """How many variants a key needs before it is served, 0 = never cache"""
+        if not settings.LLM_CACHE_ENABLED or temperature > settings.LLM_CACHE_MAX_TEMPERATURE:
+            return 0
+        if temperature <= settings.LLM_CACHE_DETERMINISTIC_TEMPERATURE:
+            return 1
+        return settings.LLM_CACHE_SAMPLED_VARIANTS
+
+    async def get(self, key: str, temperature: float) -> Optional[Any]:
+        """Return a cached result, or None on a miss"""
+        needed = self.variants_for(temperature)
+        if not needed:
+            self.stats["bypassed"] += 1
+            return None
+
+        variants = self._get_local(key)
+        if variants is not None and len(variants) >= needed:
+            self.stats["local_hits"] += 1
+            return random.choice(variants)
+
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.lrange(key, 0, -1)
+                pipe.ttl(key)
+                entries, ttl = await pipe.execute()
+        except RedisError:
+            self.stats["errors"] += 1
+            entries, ttl = [], -1
+        variants = [json.loads(entry) for entry in entries]
+        if len(variants) >= needed:
+            self.stats["redis_hits"] += 1
+            self._set_local(key, variants, ttl if ttl > 0 else settings.LLM_CACHE_LOCAL_TTL_SECONDS)
+            return random.choice(variants)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, temperature: float, ttl: int):
+        """Store a freshly generated result as one more variant of key"""
+        needed = self.variants_for(temperature)
+        if not needed:
+            return
+
+        variants = (self._get_local(key) or []) + [value]
+        self._set_local(key, variants[-needed:], ttl)
+        try:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.rpush(key, json.dumps(value))
+                pipe.ltrim(key, -needed, -1)
+                pipe.expire(key, ttl)
+                await pipe.execute()
+            self.stats["stores"] += 1
+        except RedisError:
+            self.stats["errors"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        hits = self.stats["local_hits"] + self.stats["redis_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "local_entries": len(self._local),
+            "hit_rate": hits / lookups if lookups else 0.0
+        }
+
+    def _get_local(self, key: str) -> Optional[List[Any]]:
+        entry = self._local.get(key)
+        if entry is None:
+            return None
+        expires_at, variants = entry
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return variants
+
+    def _set_local(self, key: str, variants: List[Any], ttl: int):
+        ttl = min(ttl, settings.LLM_CACHE_LOCAL_TTL_SECONDS)
+        self._local[key] = (time.monotonic() + ttl, variants)
+        self._local.move_to_end(key)
+        while len(self._local) > settings.LLM_CACHE_LOCAL_MAX_ENTRIES:
+            self._local.popitem(last=False)
+
+# Shared by every agent in the process
+response_cache = ResponseCache()
@@ -1,65 +1,34 @@
-from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+from app.core.model_provider import chat_model
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
 from app.core.config import settings
-import json
+from app.agents.cache import normalize_text
+from app.agents.context import build_context
+from app.agents.structured import CoachFeedback, invoke_structured
+from app.agents.usage import prompt_cache_stats
+import asyncio
 
-class CoachAgent:
-    """
-    Coach/Feedback Agent
-    Evaluates physician responses and provides constructive feedback
-    """
-    
-    def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.4,
-            openai_api_key=settings.OPENAI_API_KEY
-        )
-    
-    def evaluate_conversation(
-        self,
-        conversation_history: List[Dict[str, Any]],
-        scenario_context: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Generate comprehensive feedback for the conversation"""
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self._build_coach_prompt()),
-            ("human", self._build_evaluation_input(conversation_history, scenario_context))
-        ])
-        
-        chain = prompt | self.llm
-        response = chain.invoke({})
-        
-        try:
-            result = json.loads(response.content)
-            return result
-        except:
-            return self._get_default_feedback()
-    
-    def evaluate_single_response(
-        self,
-        user_message: str,
-        context: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """Provide real-time feedback on a single response"""
-        
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", "You are a medical communication coach. Evaluate this doctor's response."),
-            ("human", f"Context: {context}\n\nDoctor said: {user_message}\n\nProvide brief feedback (2-3 sentences).")
-        ])
-        
-        chain = prompt | self.llm
-        response = chain.invoke({})
-        
-        return {
-            "feedback": response.content,
-            "quality": "good"  # Simple rating
-        }
-    
-    def _build_coach_prompt(self) -> str:
-        return """You are an expert medical communication coach specializing in end-of-life conversations.
+# Filled in when a reply that missed the schema is repaired; scores have no default
+FEEDBACK_DEFAULTS = {
+    "strengths": [],
+    "areas_for_improvement": [],
+    "suggested_responses": [],
+    "summary": ""
+}
+
+# Numeric fields of the feedback JSON, averaged when partial results are merged
+SCORE_FIELDS = (
+    "empathy_score",
+    "clarity_score",
+    "emotional_alignment_score",
+    "ethical_appropriateness_score",
+    "cultural_sensitivity_score",
+    "overall_score"
+)
+
+COACH_RUBRIC = SystemMessage(content="""You are an expert medical communication coach specializing in end-of-life conversations.
 
 Evaluate the physician's performance based on:
 
@@ -92,25 +61,212 @@ Output JSON format:
         }
     ],
     "summary": "2-3 sentence overall assessment"
-}"""
+}""")
 
+# The rubric leads every scoring prompt, so chunk and turn calls share a prefix
+CHUNK_PROMPT = ChatPromptTemplate.from_messages([
+    COACH_RUBRIC,
+    ("human", "{evaluation_input}")
+])
+
+TURN_PROMPT = ChatPromptTemplate.from_messages([
+    COACH_RUBRIC,
+    ("human", """Scenario: {scenario}
+
+Earlier in the conversation:
+{context}
+
+Physician's latest turn:
+USER: {user_message}
+AGENT: {agent_response}
+
+Score only the physician's latest turn. Keep the lists to at most one or two points and the summary to one sentence.""")
+])
+
+MERGE_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="You are a medical communication coach. Combine partial assessments of one conversation into a single 2-3 sentence overall assessment. Reply with the assessment only."),
+    ("human", "Overall score: {overall_score}\n\nPartial assessments, in conversation order:\n{summaries}")
+])
+
+HINT_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="You are a medical communication coach. Evaluate this doctor's response."),
+    ("human", "Context: {context}\n\nDoctor said: {user_message}\n\nProvide brief feedback (2-3 sentences).")
+])
+
+class CoachAgent:
+    """
+    Coach/Feedback Agent
+    Evaluates physician responses and provides constructive feedback
+    """
+    
+    def __init__(self):
+        self.llm = chat_model(
+            "coach_agent",
+            model="gpt-4o",
+            temperature=0.4
+        )
+    
+    async def evaluate_chunks(
+        self,
+        chunks: List[Tuple[int, List[Dict[str, Any]]]],
+        scenario_context: Dict[str, Any]
+    ) -> List[Optional[Dict[str, Any]]]:
+        """Score (first_turn, messages) chunks concurrently, results in chunk order"""
+        limit = asyncio.Semaphore(settings.COACH_MAX_PARALLEL_CHUNKS)
+        
+        async def score(first_turn, messages):
+            async with limit:
+                return await self.evaluate_chunk(messages, scenario_context, first_turn)
+        
+        return await asyncio.gather(*[
+            score(first_turn, messages) for first_turn, messages in chunks
+        ])
+    
+    async def evaluate_chunk(
+        self,
+        history: List[Dict[str, Any]],
+        scenario_context: Dict[str, Any],
+        first_turn: int = 1
+    ) -> Optional[Dict[str, Any]]:
+        """Score part of a transcript; None if no usable feedback came back"""
+        
+        return await self._score(CHUNK_PROMPT, {
+            "evaluation_input": self._build_evaluation_input(history, scenario_context, first_turn)
+        })
+    
+    async def evaluate_turn(
+        self,
+        previous: List[Dict[str, Any]],
+        user_message: str,
+        agent_response: str,
+        scenario_context: Dict[str, Any],
+        summary: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Rubric note for a single turn, collected in the background while
+        the conversation runs; same fields as the full feedback
+        previous and summary are the earlier messages and the running
+        summary, cut to CONTEXT_COACH_TOKENS
+        """
+        
+        context = build_context(
+            previous,
+            summary,
+            settings.CONTEXT_COACH_TOKENS,
+            lambda msg: f"{msg['role'].upper()}: {msg['content']}"
+        )
+        return await self._score(TURN_PROMPT, {
+            "scenario": scenario_context.get("description", "End-of-life conversation"),
+            "context": context or "(start of the conversation)",
+            "user_message": user_message,
+            "agent_response": agent_response
+        })
+    
+    async def merge_feedback(
+        self,
+        partials: List[Tuple[Dict[str, Any], int]]
+    ) -> Dict[str, Any]:
+        """
+        Reduce step: combine (feedback, turns covered) partial results
+        Scores are averaged weighted by turns, recurring points ranked first;
+        only the summary needs a (short) model call
+        """
+        if not partials:
+            return self._get_default_feedback()
+        if len(partials) == 1:
+            return partials[0][0]
+        
+        total = sum(weight for _, weight in partials)
+        merged = {
+            field: round(sum(
+                float(feedback.get(field, 0)) * weight for feedback, weight in partials
+            ) / total, 1)
+            for field in SCORE_FIELDS
+        }
+        for field in ("strengths", "areas_for_improvement"):
+            merged[field] = self._rank_points(
+                point for feedback, _ in partials for point in feedback.get(field, [])
+            )
+        suggestions = {}
+        for feedback, _ in partials:
+            for suggestion in feedback.get("suggested_responses", []):
+                suggestions.setdefault(normalize_text(suggestion.get("situation", "")), suggestion)
+        merged["suggested_responses"] = list(suggestions.values())[:settings.COACH_MAX_LIST_ITEMS]
+        merged["summary"] = await self._merge_summaries(
+            [feedback.get("summary", "") for feedback, _ in partials], merged
+        )
+        return merged
+    
+    async def evaluate_single_response(
+        self,
+        user_message: str,
+        context: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Provide real-time feedback on a single response"""
+        
+        chain = HINT_PROMPT | self.llm
+        response = await chain.ainvoke({"context": str(context), "user_message": user_message})
+        prompt_cache_stats.record("coach_agent", response)
+        
+        return {
+            "feedback": response.content,
+            "quality": "good"  # Simple rating
+        }
+    
     def _build_evaluation_input(
         self,
         history: List[Dict[str, Any]],
-        scenario: Dict[str, Any]
+        scenario: Dict[str, Any],
+        first_turn: int = 1
     ) -> str:
         conversation_text = "\n".join([
             f"{msg['role'].upper()}: {msg['content']}"
             for msg in history
         ])
         
+        part = ""
+        if first_turn > 1:
+            last_turn = first_turn + (len(history) + 1) // 2 - 1
+            part = f" (turns {first_turn}-{last_turn} of a longer conversation)"
+        
         return f"""Scenario: {scenario.get('description', 'End-of-life conversation')}
 
-Conversation Transcript:
+Conversation Transcript{part}:
 {conversation_text}
 
 Provide comprehensive feedback for this physician."""
 
+    async def _merge_summaries(self, summaries: List[str], merged: Dict[str, Any]) -> str:
+        """One overall assessment from the partial summaries"""
+        summaries = [summary for summary in summaries if summary]
+        chain = MERGE_PROMPT | self.llm
+        try:
+            response = await chain.ainvoke({
+                "overall_score": merged["overall_score"],
+                "summaries": "\n".join(f"- {summary}" for summary in summaries)
+            })
+            prompt_cache_stats.record("coach_agent", response)
+            return response.content.strip()
+        except Exception:
+            return " ".join(summaries[:3])
+    
+    def _rank_points(self, points) -> List[str]:
+        """Deduplicate feedback points, most frequently raised first"""
+        counts = Counter()
+        first_seen = {}
+        for point in points:
+            key = normalize_text(point)
+            counts[key] += 1
+            first_seen.setdefault(key, point)
+        return [first_seen[key] for key, _ in counts.most_common(settings.COACH_MAX_LIST_ITEMS)]
+    
+    async def _score(self, prompt: ChatPromptTemplate, inputs: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Rubric scores as a feedback dict, schema-enforced"""
+        result = await invoke_structured(
+            "coach_agent", self.llm, prompt, inputs, CoachFeedback, defaults=FEEDBACK_DEFAULTS
+        )
+        return result.model_dump() if result else None
+    
     def _get_default_feedback(self) -> Dict[str, Any]:
         return {
             "empathy_score": 7.0,
@@ -0,0 +1,120 @@
+from typing import Dict, Any, List, Callable, Optional
+import asyncio
+import logging
+from app.core.model_provider import chat_model
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
+from app.agents.usage import prompt_cache_stats
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_encoding = None
+
+def _load_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+        return False
+
+async def load_tokenizer():
+    """
+    Load the gpt-4o tokenizer at startup, off the event loop
+    tiktoken may download its tables on first use; until it has loaded
+    (or if it cannot) counts are estimated at four characters per token
+    """
+    global _encoding
+    if _encoding is None:
+        _encoding = await asyncio.to_thread(_load_encoding)
+
+def count_tokens(text: str) -> int:
+    """Tokens in text under the gpt-4o tokenizer, estimated until it is loaded"""
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + 3) // 4
+
+def truncate_tokens(text: str, limit: int) -> str:
+    """The start of text, at most limit tokens of it ("" when limit is not positive)"""
+    if limit <= 0:
+        return ""
+    if count_tokens(text) <= limit:
+        return text
+    if _encoding:
+        return _encoding.decode(_encoding.encode(text)[:limit]) + "..."
+    return text[:limit * 4] + "..."
+
+def build_context(
+    history: List[Dict[str, Any]],
+    summary: Optional[str],
+    budget: int,
+    format_message: Callable[[Dict[str, Any]], str]
+) -> str:
+    """
+    Conversation context within a token budget
+    The latest message is always included in full. The running summary
+    of older turns comes first, cut short if it does not fit beside the
+    latest message, then as many of the earlier messages as still fit,
+    oldest to newest. Earlier messages are never cut in half
+    """
+    lines = []
+    if history:
+        latest = format_message(history[-1])
+        lines.append(latest)
+        budget -= count_tokens(latest) + 1  # Newline
+    
+    header = None
+    if summary:
+        prefix = "Summary of the conversation so far: "
+        text = truncate_tokens(summary, budget - count_tokens(prefix) - 1)
+        if text:
+            header = prefix + text
+            budget -= count_tokens(header) + 1
+    
+    for message in reversed(history[:-1]):
+        line = format_message(message)
+        cost = count_tokens(line) + 1
+        if cost > budget:
+            break
+        lines.append(line)
+        budget -= cost
+    
+    if header:
+        lines.append(header)
+    return "\n".join(reversed(lines))
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="""You maintain a running summary of a simulated end-of-life conversation between a physician (user) and a patient's family member (agent).
+
+Update the summary with the new messages. Keep facts that matter later: what the physician has disclosed about diagnosis and prognosis, questions the family member asked, options discussed, promises or decisions made, and how the family member's emotions have shifted.
+
+Write plain prose in the third person, no lists. Reply with the updated summary only."""),
+    ("human", "Current summary:\n{summary}\n\nNew messages:\n{messages}\n\nUpdated summary (at most {max_words} words):")
+])
+
+class ConversationSummarizer:
+    """
+    Folds older messages into a running summary
+    Called incrementally with only the messages not yet covered, so each
+    update costs about the same however long the conversation is
+    """
+
+    def __init__(self):
+        self.llm = chat_model(
+            "summarizer",
+            model="gpt-4o-mini",
+            temperature=0.2,
+            max_tokens=settings.CONTEXT_SUMMARY_MAX_TOKENS
+        )
+
+    async def summarize(self, summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        chain = SUMMARY_PROMPT | self.llm
+        response = await chain.ainvoke({
+            "summary": summary or "(none yet)",
+            "messages": "\n".join(f"{msg['role']}: {msg['content']}" for msg in messages),
+            # Words run about 0.75 tokens each
+            "max_words": settings.CONTEXT_SUMMARY_MAX_TOKENS * 3 // 4
+        })
+        prompt_cache_stats.record("summarizer", response)
+        return response.content.strip()
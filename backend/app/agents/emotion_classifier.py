@@ -0,0 +1,133 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import Counter
+import math
+import re
+
+# Labels match the keys of EmotionStateManager.transition_rules
+RESPONSE_TYPES = ("empathetic_response", "factual_response", "dismissive_response")
+
+TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?|\d+(?:\.\d+)?%?")
+
+# Linear model over sparse features: w:<word>, b:<bigram> and a few
+# shape features. Weights are hand-set from the coaching rubric;
+# benchmarks/emotion_agreement.py measures how well they track the LLM
+WEIGHTS: Dict[str, Dict[str, float]] = {
+    "empathetic_response": {
+        "bias": 0.0,
+        "w:sorry": 2.0, "w:understand": 1.2, "w:difficult": 1.2, "w:hard": 1.0,
+        "w:feel": 1.0, "w:feeling": 1.2, "w:together": 1.0, "w:support": 1.0,
+        "w:imagine": 1.2, "w:overwhelming": 1.4, "w:loves": 1.0, "w:love": 0.8,
+        "w:comfortable": 0.8, "w:comfort": 1.0, "w:wish": 1.2, "w:worried": 1.0,
+        "w:scared": 1.0, "w:here": 0.4, "w:questions": 0.6, "w:okay": 0.6,
+        "b:i'm sorry": 1.0, "b:i understand": 0.8, "b:take your": 1.2,
+        "b:your time": 0.8, "b:must be": 1.4, "b:i can": 0.6, "b:can see": 1.0,
+        "b:with you": 1.0, "b:for you": 0.6, "b:tell me": 1.0, "b:how are": 1.2,
+        "b:what matters": 1.4, "b:i hear": 1.4, "b:we will": 0.8, "b:we'll": 0.4,
+        "question": 0.4
+    },
+    "factual_response": {
+        "bias": 0.3,
+        "w:stage": 1.2, "w:prognosis": 1.4, "w:treatment": 1.0, "w:chemotherapy": 1.4,
+        "w:scan": 1.2, "w:scans": 1.2, "w:results": 1.0, "w:tumor": 1.2,
+        "w:cancer": 0.8, "w:weeks": 1.0, "w:months": 1.0, "w:survival": 1.4,
+        "w:options": 0.8, "w:hospice": 0.8, "w:ventilator": 1.2, "w:oxygen": 1.0,
+        "w:brain": 0.8, "w:damage": 0.8, "w:spread": 1.0, "w:metastatic": 1.4,
+        "w:medication": 1.0, "w:dose": 1.2, "w:procedure": 1.0, "w:data": 1.0,
+        "w:percent": 1.2, "w:statistically": 1.6, "w:diagnosis": 1.2,
+        "w:pneumonia": 1.0, "w:infection": 1.0, "w:kidney": 1.0, "w:function": 0.8,
+        "number": 1.4
+    },
+    "dismissive_response": {
+        "bias": -0.6,
+        "w:calm": 1.6, "w:overreacting": 2.5, "w:nothing": 1.0, "w:unfortunately": 0.4,
+        "w:whatever": 2.0, "w:busy": 1.6, "w:policy": 1.6, "w:anyway": 1.2,
+        "w:obviously": 1.6, "w:accept": 1.0, "w:deal": 1.0, "w:move": 0.6,
+        "w:enough": 1.0, "w:already": 0.8, "w:stop": 1.2, "w:need": 0.3,
+        "b:calm down": 1.5, "b:nothing more": 1.2, "b:nothing else": 1.0,
+        "b:you need": 1.0, "b:you have": 0.6, "b:it is": 0.4, "b:is what": 1.6,
+        "b:no point": 2.0, "b:not my": 2.0, "b:i don't": 0.6, "b:don't have": 1.0,
+        "b:have time": 1.6, "b:just accept": 1.6, "b:let's move": 1.4,
+        "b:as i": 1.0, "b:i said": 1.2, "b:next question": 2.0,
+        "short": 1.0
+    }
+}
+
+class ResponseTypeClassifier:
+    """
+    In-process classifier for the physician's message
+    Labels it empathetic, factual or dismissive with a small linear model
+    over lexical features; softmax probabilities give the confidence
+    """
+
+    def features(self, message: str) -> Counter:
+        text = message.lower().replace("’", "'")
+        words = TOKEN.findall(text)
+        features = Counter(f"w:{word}" for word in words)
+        features.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+        features["bias"] = 1
+        if any(word[0].isdigit() for word in words):
+            features["number"] = 1
+        if "?" in message:
+            features["question"] = 1
+        if len(words) <= 5:
+            features["short"] = 1
+        return features
+
+    def predict(self, message: str) -> Tuple[str, float, Dict[str, float]]:
+        """(label, confidence, probability per label)"""
+        features = self.features(message)
+        scores = {
+            label: sum(weights.get(name, 0.0) * value for name, value in features.items())
+            for label, weights in WEIGHTS.items()
+        }
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exp.values())
+        probabilities = {label: value / total for label, value in exp.items()}
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label], probabilities
+
+def dwell_turns(history: List[Dict[str, Any]], current_state: str) -> int:
+    """Agent messages at the end of the window spoken in current_state"""
+    turns = 0
+    for msg in reversed(history):
+        if msg["role"] != "agent":
+            continue
+        if msg.get("emotional_state") != current_state:
+            break
+        turns += 1
+    return turns
+
+def next_state(
+    rules: Dict[str, Dict[str, List[str]]],
+    current_state: str,
+    response_type: str,
+    intensity: int,
+    dwell: int,
+    min_dwell: int
+) -> Optional[Tuple[str, int]]:
+    """
+    Pick (state, intensity) from transition_rules
+    Empathy lowers intensity and, once it is low or the state has lasted
+    min_dwell turns, moves on to the next state in the rule; dismissal
+    raises intensity and escalates to the first state listed; facts keep
+    things as they are. None when the state has no rules
+    """
+    candidates = rules.get(current_state, {}).get(response_type)
+    if not candidates:
+        return None
+
+    if response_type == "empathetic_response":
+        intensity = max(intensity - 1, 1)
+        progress = intensity <= 4 or dwell >= min_dwell
+        moves = [state for state in candidates if state != current_state]
+        if current_state not in candidates or (progress and moves):
+            return moves[0], max(intensity, 4)
+        return current_state, intensity
+
+    if response_type == "dismissive_response":
+        return candidates[0], min(intensity + 2, 10)
+
+    if current_state in candidates:
+        return current_state, intensity
+    return candidates[0], intensity
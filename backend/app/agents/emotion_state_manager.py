@@ -1,8 +1,41 @@
-from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List, Optional
+from app.core.model_provider import chat_model
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
+from app.agents.cache import response_cache, normalize_text
+from app.agents.context import build_context
+from app.agents.emotion_classifier import ResponseTypeClassifier, dwell_turns, next_state
+from app.agents.structured import EmotionEvaluation, invoke_structured
 from app.core.config import settings
-import json
+
+EVALUATION_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content="""You are an emotion state manager for a medical conversation simulation.
+
+Your job is to evaluate if the family member's emotional state should change based on the doctor's response.
+
+Emotional States:
+- denial: Refusing to accept the situation
+- anger: Frustration, blame, raised emotions
+- bargaining: Seeking alternatives, "what if" thinking
+- sadness: Grief, tears, despair
+- acceptance: Coming to terms, practical focus
+
+Evaluation Criteria:
+1. Did the doctor show empathy? (Empathetic responses help transition from anger to sadness/acceptance)
+2. Was the doctor dismissive? (Can escalate to anger)
+3. Was the doctor overly clinical/factual? (Can maintain current state or cause anger)
+4. How long has the person been in current state? (Natural progression over time)
+
+Output JSON format:
+{
+    "new_state": "emotion_name",
+    "intensity": 1-10,
+    "reasoning": "Brief explanation"
+}
+
+Keep transitions realistic - people don't jump from anger to acceptance instantly."""),
+    ("human", "{evaluation_input}")
+])
 
 class EmotionStateManager:
     """
@@ -11,10 +44,10 @@ class EmotionStateManager:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
+        self.llm = chat_model(
+            "emotion_manager",
             model="gpt-4o-mini",
-            temperature=0.3,  # Lower temperature for more consistent state management
-            openai_api_key=settings.OPENAI_API_KEY
+            temperature=0.3  # Lower temperature for more consistent state management
         )
         
         # Emotion transition probabilities
@@ -45,86 +78,138 @@ class EmotionStateManager:
                 "dismissive_response": ["sadness", "acceptance"]
             }
         }
+        
+        # Local fast path; the LLM is only asked when it is unsure
+        self.classifier = ResponseTypeClassifier()
+        self.stats = {"local": 0, "llm": 0}
     
-    def evaluate_transition(
+    async def evaluate_transition(
         self,
         current_state: str,
         user_message: str,
         conversation_history: List[Dict[str, Any]],
-        scenario_context: Dict[str, Any]
+        scenario_context: Dict[str, Any],
+        history_length: Optional[int] = None,
+        summary: Optional[str] = None,
+        current_intensity: int = 5
     ) -> Dict[str, Any]:
         """
         Evaluate if emotional state should transition
         Returns new state and intensity
+        history_length is the full conversation length and summary the
+        running summary of older turns when conversation_history is only
+        its most recent window
         """
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self._build_evaluation_prompt()),
-            ("human", self._build_evaluation_input(
-                current_state, user_message, conversation_history, scenario_context
-            ))
-        ])
+        if settings.EMOTION_FAST_PATH:
+            evaluation = self.classify_transition(
+                current_state, user_message, conversation_history, current_intensity
+            )
+            if evaluation:
+                return evaluation
+        self.stats["llm"] += 1
         
-        chain = prompt | self.llm
-        response = chain.invoke({})
+        history_text = build_context(
+            conversation_history,
+            summary,
+            settings.CONTEXT_EMOTION_TOKENS,
+            lambda msg: f"{msg['role']}: {msg['content']}"
+        )
+        cache_key = response_cache.make_key(
+            "emotion",
+            model=self.llm.model_name,
+            scenario_id=scenario_context.get("id"),
+            current_state=current_state,
+            history=normalize_text(history_text),
+            history_length=len(conversation_history) if history_length is None else history_length,
+            message=normalize_text(user_message)
+        )
+        cached = await response_cache.get(cache_key, self.llm.temperature)
+        if cached is not None:
+            return dict(cached)
         
-        # Parse response
-        try:
-            result = json.loads(response.content)
-            return {
-                "new_state": result.get("new_state", current_state),
-                "intensity": result.get("intensity", 5),
-                "reasoning": result.get("reasoning", "")
-            }
-        except:
-            # Fallback if parsing fails
+        result = await invoke_structured(
+            "emotion_manager",
+            self.llm,
+            EVALUATION_PROMPT,
+            {
+                "evaluation_input": self._build_evaluation_input(
+                    current_state, user_message, conversation_history, history_text,
+                    history_length
+                )
+            },
+            EmotionEvaluation,
+            defaults={"new_state": current_state, "intensity": current_intensity, "reasoning": ""}
+        )
+        if result is None:
+            # Fallback if no usable evaluation came back (not cached)
             return {
                 "new_state": current_state,
-                "intensity": 5,
+                "intensity": current_intensity,
                 "reasoning": "Failed to parse evaluation"
             }
+        evaluation = result.model_dump()
+        
+        await response_cache.set(
+            cache_key, evaluation, self.llm.temperature,
+            ttl=settings.LLM_CACHE_EMOTION_TTL_SECONDS
+        )
+        return evaluation
+    
+    def classify_transition(
+        self,
+        current_state: str,
+        user_message: str,
+        conversation_history: List[Dict[str, Any]],
+        current_intensity: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Transition chosen in-process: classify the physician's message and
+        apply transition_rules. None when the classifier's confidence is
+        below EMOTION_FAST_PATH_CONFIDENCE or the state has no rules
+        """
+        response_type, confidence, _ = self.classifier.predict(user_message)
+        if confidence < settings.EMOTION_FAST_PATH_CONFIDENCE:
+            return None
+        
+        decision = next_state(
+            self.transition_rules,
+            current_state,
+            response_type,
+            current_intensity,
+            dwell_turns(conversation_history, current_state),
+            settings.EMOTION_FAST_PATH_MIN_DWELL
+        )
+        if decision is None:
+            return None
+        
+        new_state, intensity = decision
+        self.stats["local"] += 1
+        return {
+            "new_state": new_state,
+            "intensity": intensity,
+            "reasoning": f"Doctor's message read as {response_type.replace('_', ' ')} ({confidence:.0%} confidence)",
+            "source": "local"
+        }
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """How many transitions were decided locally vs by the LLM"""
+        total = self.stats["local"] + self.stats["llm"]
+        return {
+            **self.stats,
+            "local_rate": self.stats["local"] / total if total else 0.0
+        }
     
-    def _build_evaluation_prompt(self) -> str:
-        return """You are an emotion state manager for a medical conversation simulation.
-
-Your job is to evaluate if the family member's emotional state should change based on the doctor's response.
-
-Emotional States:
-- denial: Refusing to accept the situation
-- anger: Frustration, blame, raised emotions
-- bargaining: Seeking alternatives, "what if" thinking
-- sadness: Grief, tears, despair
-- acceptance: Coming to terms, practical focus
-
-Evaluation Criteria:
-1. Did the doctor show empathy? (Empathetic responses help transition from anger to sadness/acceptance)
-2. Was the doctor dismissive? (Can escalate to anger)
-3. Was the doctor overly clinical/factual? (Can maintain current state or cause anger)
-4. How long has the person been in current state? (Natural progression over time)
-
-Output JSON format:
-{
-    "new_state": "emotion_name",
-    "intensity": 1-10,
-    "reasoning": "Brief explanation"
-}
-
-Keep transitions realistic - people don't jump from anger to acceptance instantly."""
-
     def _build_evaluation_input(
         self,
         current_state: str,
         user_message: str,
         history: List[Dict[str, Any]],
-        scenario: Dict[str, Any]
+        history_text: str,
+        history_length: Optional[int] = None
     ) -> str:
-        history_text = "\n".join([
-            f"{msg['role']}: {msg['content']}" 
-            for msg in history[-3:]
-        ])
-        
         return f"""Current Emotional State: {current_state}
-Conversation turns so far: {len(history)}
+Conversation turns so far: {len(history) if history_length is None else history_length}
 
 Recent History:
 {history_text}
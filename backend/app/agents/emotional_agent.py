@@ -1,8 +1,68 @@
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, AsyncIterator, Optional
+from functools import lru_cache
+from app.core.model_provider import chat_model
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, SystemMessage
+from app.agents.cache import response_cache, normalize_text
+from app.agents.context import build_context, count_tokens
+from app.agents.usage import prompt_cache_stats, token_usage
 from app.core.config import settings
 
+# What the family member says when the conversation opens
+OPENING_LINE = "Doctor... thank you for taking the time to speak with me. I know you're busy."
+
+EMOTIONAL_INSTRUCTIONS = {
+    "denial": "You are in denial about the severity of the situation. You keep insisting there must be another option, another treatment. You interrupt with hope-seeking questions. You may become agitated when faced with bad news.",
+    "anger": "You are angry and frustrated. You may raise your voice, blame others, or question the competence of the medical team. You feel helpless and express that through anger.",
+    "bargaining": "You are trying to negotiate. You ask 'what if' questions, propose alternative timelines, and seek any possible way to change the outcome. You're willing to try anything.",
+    "sadness": "You are deeply sad and grieving. You speak slowly, may cry, and express feelings of loss and hopelessness. You need emotional support and understanding.",
+    "acceptance": "You are coming to terms with the situation. You ask practical questions about next steps, comfort care, and how to make the patient comfortable. You're more receptive to information.",
+    "neutral": "You are uncertain and seeking information. You're processing what's happening and need clarity from the doctor."
+}
+
+# Shared by every scenario and state, so it leads the system prompt
+ROLEPLAY_GUIDELINES = """You are roleplaying as a family member in an end-of-life conversation scenario.
+
+Important Guidelines:
+- Stay in character with your emotional state
+- Be realistic - emotions don't change instantly
+- React authentically to what the doctor says
+- Use natural, conversational Japanese or English
+- Show emotion through your words, not by stating "I feel X"
+- Keep responses concise (2-3 sentences typically)
+
+Remember: You are a real person in crisis, not a textbook example. Be human."""
+
+@lru_cache(maxsize=512)
+def compile_reply_prompt(
+    patient_condition: str,
+    family_relationship: str,
+    family_background: str,
+    emotional_state: str
+) -> ChatPromptTemplate:
+    """
+    Reply prompt for one scenario and emotional state
+    Ordered from most to least stable - guidelines, scenario, emotional
+    state, then the turn itself - so consecutive turns send a
+    byte-identical prefix the provider's prompt cache can match. The
+    system text is a fixed message, not a template, so braces in
+    scenario fields are sent as written
+    """
+    system = f"""{ROLEPLAY_GUIDELINES}
+
+Scenario Context:
+- Patient: {patient_condition}
+- Your relationship: {family_relationship}
+- Background: {family_background}
+
+Current Emotional State: {emotional_state}
+{EMOTIONAL_INSTRUCTIONS.get(emotional_state, EMOTIONAL_INSTRUCTIONS['neutral'])}"""
+    
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=system),
+        ("human", "{history}\n\nDoctor: {message}\n\nRespond as the family member:")
+    ])
+
 class EmotionalAgent:
     """
     Patient/Family Emotional Agent
@@ -10,79 +70,159 @@ class EmotionalAgent:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
+        self.llm = chat_model(
+            "emotional_agent",
             model="gpt-4o-mini",
             temperature=0.7,
-            openai_api_key=settings.OPENAI_API_KEY
+            stream_usage=True  # Token usage on streamed replies too
         )
         
-    def generate_response(
+    async def generate_response(
         self, 
         user_message: str,
         emotional_state: str,
         scenario_context: Dict[str, Any],
-        conversation_history: list
+        conversation_history: list,
+        summary: Optional[str] = None
     ) -> str:
-        """Generate emotionally consistent response"""
+        """
+        Generate emotionally consistent response
+        summary is the running summary of turns older than
+        conversation_history, if there is one
+        """
         
-        # Build context-aware prompt
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self._build_system_prompt(emotional_state, scenario_context)),
-            ("human", "{history}\n\nDoctor: {message}\n\nRespond as the family member:")
-        ])
+        response = await self.generate_message(
+            user_message, emotional_state, scenario_context, conversation_history, summary
+        )
         
-        # Format conversation history
-        history_text = self._format_history(conversation_history)
+        return response.content
+    
+    async def generate_message(
+        self,
+        user_message: str,
+        emotional_state: str,
+        scenario_context: Dict[str, Any],
+        conversation_history: list,
+        summary: Optional[str] = None
+    ):
+        """Generate the response, keeping the model message for token usage"""
         
-        # Generate response
-        chain = prompt | self.llm
-        response = chain.invoke({
-            "history": history_text,
-            "message": user_message
-        })
+        history_text = self._format_history(conversation_history, summary)
+        cache_key = self._cache_key(user_message, emotional_state, scenario_context, history_text)
+        cached = await response_cache.get(cache_key, self.llm.temperature)
+        if cached is not None:
+            return AIMessage(content=cached)
         
-        return response.content
+        chain, inputs = self._build_chain(
+            user_message, emotional_state, scenario_context, history_text
+        )
+        
+        response = await chain.ainvoke(inputs)
+        prompt_cache_stats.record("emotional_agent", response)
+        await response_cache.set(
+            cache_key, response.content, self.llm.temperature,
+            ttl=settings.LLM_CACHE_REPLY_TTL_SECONDS
+        )
+        return response
     
-    def _build_system_prompt(self, emotional_state: str, scenario: Dict[str, Any]) -> str:
-        """Build role-playing system prompt based on emotional state"""
+    async def stream_response(
+        self,
+        user_message: str,
+        emotional_state: str,
+        scenario_context: Dict[str, Any],
+        conversation_history: list,
+        summary: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generate the same response as generate_response, token by token
+        usage, if given, is kept up to date with the tokens spent so far:
+        estimated while streaming, replaced by the reported usage at the end
+        """
         
-        emotional_instructions = {
-            "denial": "You are in denial about the severity of the situation. You keep insisting there must be another option, another treatment. You interrupt with hope-seeking questions. You may become agitated when faced with bad news.",
-            "anger": "You are angry and frustrated. You may raise your voice, blame others, or question the competence of the medical team. You feel helpless and express that through anger.",
-            "bargaining": "You are trying to negotiate. You ask 'what if' questions, propose alternative timelines, and seek any possible way to change the outcome. You're willing to try anything.",
-            "sadness": "You are deeply sad and grieving. You speak slowly, may cry, and express feelings of loss and hopelessness. You need emotional support and understanding.",
-            "acceptance": "You are coming to terms with the situation. You ask practical questions about next steps, comfort care, and how to make the patient comfortable. You're more receptive to information.",
-            "neutral": "You are uncertain and seeking information. You're processing what's happening and need clarity from the doctor."
-        }
+        history_text = self._format_history(conversation_history, summary)
+        cache_key = self._cache_key(user_message, emotional_state, scenario_context, history_text)
+        cached = await response_cache.get(cache_key, self.llm.temperature)
+        if cached is not None:
+            yield cached
+            return
         
-        return f"""You are roleplaying as a family member in an end-of-life conversation scenario.
-
-Scenario Context:
-- Patient: {scenario.get('patient_condition', 'Serious condition')}
-- Your relationship: {scenario.get('family_relationship', 'Family member')}
-- Background: {scenario.get('family_background', 'You care deeply about the patient')}
-
-Current Emotional State: {emotional_state}
-{emotional_instructions.get(emotional_state, emotional_instructions['neutral'])}
-
-Important Guidelines:
-- Stay in character with your emotional state
-- Be realistic - emotions don't change instantly
-- React authentically to what the doctor says
-- Use natural, conversational Japanese or English
-- Show emotion through your words, not by stating "I feel X"
-- Keep responses concise (2-3 sentences typically)
-
-Remember: You are a real person in crisis, not a textbook example. Be human."""
-
-    def _format_history(self, history: list) -> str:
-        """Format conversation history for context"""
-        if not history:
-            return "Beginning of conversation."
+        chain, inputs = self._build_chain(
+            user_message, emotional_state, scenario_context, history_text
+        )
+        
+        if usage is not None:
+            usage["prompt_tokens"] = count_tokens(chain.first.format(**inputs))
+            usage["completion_tokens"] = 0
+        
+        chunks = []
+        message = None
+        async for chunk in chain.astream(inputs):
+            message = chunk if message is None else message + chunk
+            if chunk.content:
+                chunks.append(chunk.content)
+                if usage is not None:
+                    usage["completion_tokens"] += count_tokens(chunk.content)
+                yield chunk.content
+        if message is not None:
+            prompt_cache_stats.record("emotional_agent", message)
+            reported = token_usage(message)
+            if usage is not None and reported["prompt_tokens"]:
+                usage["prompt_tokens"] = reported["prompt_tokens"]
+                usage["completion_tokens"] = reported["completion_tokens"]
+        
+        # Only replies streamed to the end are cached
+        await response_cache.set(
+            cache_key, "".join(chunks), self.llm.temperature,
+            ttl=settings.LLM_CACHE_REPLY_TTL_SECONDS
+        )
+    
+    def _cache_key(
+        self,
+        user_message: str,
+        emotional_state: str,
+        scenario_context: Dict[str, Any],
+        history_text: str
+    ) -> str:
+        return response_cache.make_key(
+            "reply",
+            model=self.llm.model_name,
+            scenario_id=scenario_context.get("id"),
+            emotional_state=emotional_state,
+            history=normalize_text(history_text),
+            message=normalize_text(user_message)
+        )
+    
+    def _build_chain(
+        self,
+        user_message: str,
+        emotional_state: str,
+        scenario_context: Dict[str, Any],
+        history_text: str
+    ):
+        """Build the prompt chain and its inputs for one reply"""
         
-        formatted = []
-        for msg in history[-5:]:  # Last 5 messages for context
-            role = "Doctor" if msg["role"] == "user" else "Family"
-            formatted.append(f"{role}: {msg['content']}")
+        # Compiled once per scenario and emotional state
+        prompt = compile_reply_prompt(
+            scenario_context.get("patient_condition", "Serious condition"),
+            scenario_context.get("family_relationship", "Family member"),
+            scenario_context.get("family_background", "You care deeply about the patient"),
+            emotional_state
+        )
         
-        return "\n".join(formatted)
+        return prompt | self.llm, {
+            "history": history_text,
+            "message": user_message
+        }
+    
+    def _format_history(self, history: list, summary: Optional[str] = None) -> str:
+        """Summary plus the most recent messages that fit the reply budget"""
+        if not history and not summary:
+            return "Beginning of conversation."
+        
+        return build_context(
+            history,
+            summary,
+            settings.CONTEXT_REPLY_TOKENS,
+            lambda msg: f"{'Doctor' if msg['role'] == 'user' else 'Family'}: {msg['content']}"
+        )
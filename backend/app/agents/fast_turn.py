@@ -0,0 +1,104 @@
+from typing import Dict, Any, List, Optional
+from functools import lru_cache
+from app.core.model_provider import chat_model
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
+from app.agents.context import build_context
+from app.agents.emotional_agent import EMOTIONAL_INSTRUCTIONS, ROLEPLAY_GUIDELINES
+from app.agents.structured import FastTurn, invoke_structured
+from app.core.config import settings
+
+FAST_TURN_INSTRUCTIONS = f"""{ROLEPLAY_GUIDELINES}
+
+In one step, decide how the family member's emotional state changes in response to the doctor's latest message, write their reply in the new state, and check the reply.
+
+Emotional States:
+""" + "\n".join(f"- {state}: {instruction}" for state, instruction in EMOTIONAL_INSTRUCTIONS.items()) + """
+
+Transitions: empathy helps move from anger or denial towards sadness and acceptance, dismissiveness escalates to anger, purely clinical answers keep the current state. Keep transitions realistic - people don't jump from anger to acceptance instantly.
+
+Safety self-check: the reply must not contain false medical information, promise impossible outcomes, recommend unproven treatments, or use offensive or cruel language. Set "safe" to false if there is any doubt.
+
+Output fields: new_state (one of the emotional states above), intensity (1-10), reasoning (brief explanation of the transition), reply (what the family member says), safe, and safety_concern (empty unless safe is false)."""
+
+@lru_cache(maxsize=256)
+def compile_fast_turn_prompt(
+    patient_condition: str,
+    family_relationship: str,
+    family_background: str
+) -> ChatPromptTemplate:
+    """
+    Fast-turn prompt for one scenario: instructions, then scenario, with
+    everything that changes per turn in the human message
+    """
+    system = f"""{FAST_TURN_INSTRUCTIONS}
+
+Scenario Context:
+- Patient: {patient_condition}
+- Your relationship: {family_relationship}
+- Background: {family_background}"""
+
+    return ChatPromptTemplate.from_messages([
+        SystemMessage(content=system),
+        ("human", """Current Emotional State: {emotional_state} (intensity {intensity})
+
+Conversation so far:
+{history}
+
+Doctor: {message}""")
+    ])
+
+class FastTurnAgent:
+    """
+    Single-call turn: emotion transition, family member reply and a
+    self-assessed safety flag from one JSON response, instead of the
+    three sequential calls of the staged pipeline
+    """
+
+    def __init__(self):
+        self.llm = chat_model(
+            "fast_turn",
+            model="gpt-4o-mini",
+            temperature=0.7
+        )
+
+    async def run(
+        self,
+        user_message: str,
+        emotional_state: str,
+        intensity: int,
+        scenario_context: Dict[str, Any],
+        conversation_history: List[Dict[str, Any]],
+        summary: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """The FastTurn fields as a dict, or None if the response is not usable"""
+
+        prompt = compile_fast_turn_prompt(
+            scenario_context.get("patient_condition", "Serious condition"),
+            scenario_context.get("family_relationship", "Family member"),
+            scenario_context.get("family_background", "You care deeply about the patient")
+        )
+        # The latest message is the doctor's, passed separately
+        history = build_context(
+            conversation_history[:-1],
+            summary,
+            settings.CONTEXT_REPLY_TOKENS,
+            lambda msg: f"{'Doctor' if msg['role'] == 'user' else 'Family'}: {msg['content']}"
+        )
+
+        # No defaults: a turn missing its reply or safety flag goes staged
+        result = await invoke_structured(
+            "fast_turn",
+            self.llm,
+            prompt,
+            {
+                "emotional_state": emotional_state,
+                "intensity": intensity,
+                "history": history or "Beginning of conversation.",
+                "message": user_message
+            },
+            FastTurn
+        )
+        if result is None or not result.reply.strip():
+            return None
+        return {**result.model_dump(), "reply": result.reply.strip()}
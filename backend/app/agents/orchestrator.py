@@ -1,11 +1,38 @@
-from typing import Dict, Any, List
-import redis
+from typing import Dict, Any, List, AsyncIterator, Optional, Set
+import asyncio
+import hashlib
 import json
+import logging
+import time
 from app.agents.emotional_agent import EmotionalAgent
 from app.agents.emotion_state_manager import EmotionStateManager
 from app.agents.coach_agent import CoachAgent
 from app.agents.safety_agent import SafetyAgent
+from app.agents.speculation import SpeculativeGenerator
+from app.agents.fast_turn import FastTurnAgent
+from app.agents.context import ConversationSummarizer
+from app.agents.cache import response_cache
+from app.agents.usage import prompt_cache_stats
+from app.agents.structured import structured_output_stats
 from app.core.config import settings
+from app.core.model_provider import get_provider_stats
+from app.core.tracing import stage, trace
+from app.core.redis_client import get_redis
+from redis.exceptions import WatchError
+
+# Most history loaded per turn; agents cut it to their token budgets,
+# older turns reach them through the running summary
+HISTORY_WINDOW = settings.CONTEXT_RECENT_MESSAGES
+
+# Conversations changed in Redis but not yet written to Postgres,
+# scored by when they first changed (or, after a failed write, by when
+# the next attempt is due)
+PERSIST_QUEUE_KEY = "conversations:unpersisted"
+# Failed writes per queued conversation, and the conversations given up on
+PERSIST_ATTEMPTS_KEY = "conversations:persist_attempts"
+PERSIST_DEAD_LETTER_KEY = "conversations:persist_failed"
+
+logger = logging.getLogger(__name__)
 
 class ConversationOrchestrator:
     """
@@ -20,13 +47,34 @@ class ConversationOrchestrator:
         self.coach_agent = CoachAgent()
         self.safety_agent = SafetyAgent()
         
-        # Redis for conversation state management
-        self.redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        # Opt-in: overlap reply generation with the emotion transition
+        self.speculator = None
+        if settings.SPECULATIVE_GENERATION:
+            self.speculator = SpeculativeGenerator(
+                self.emotional_agent,
+                self.emotion_manager,
+                max_branches=settings.SPECULATIVE_MAX_BRANCHES
+            )
+        
+        # Single-call turns for scenarios in the "fast" pipeline mode
+        self.fast_turn_agent = FastTurnAgent()
+        self.fast_turn_stats = {"turns": 0, "fallbacks": {}}
+        
+        # Redis for conversation state management (shared async pool)
+        self.redis_client = get_redis()
+        
+        # Background coach notes still running, per conversation
+        self._coach_tasks: Dict[int, Set[asyncio.Task]] = {}
+        
+        # Running summaries of older turns, updated in the background
+        self.summarizer = ConversationSummarizer()
+        self._summary_tasks: Dict[int, asyncio.Task] = {}
     
     async def start_conversation(
         self,
         conversation_id: int,
-        scenario_context: Dict[str, Any]
+        scenario_context: Dict[str, Any],
+        user_id: Optional[int] = None
     ) -> Dict[str, Any]:
         """Initialize a new conversation"""
         
@@ -35,13 +83,35 @@ class ConversationOrchestrator:
             "scenario": scenario_context,
             "emotional_state": scenario_context.get("initial_emotional_state", "neutral"),
             "emotional_intensity": 5,
-            "history": [],
-            "checkpoints": [],
-            "turn_count": 0
+            "turn_count": 0,
+            "status": "in_progress"
         }
         
-        # Save to Redis
-        self._save_state(conversation_id, initial_state)
+        # Save to Redis (replacing any earlier run of this conversation)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(
+                self._key(conversation_id, "history"),
+                self._key(conversation_id, "checkpoints"),
+                self._key(conversation_id, "coach_notes"),
+                self._key(conversation_id, "summary")
+            )
+            pipe.set(
+                self._key(conversation_id, "scenario"),
+                json.dumps(scenario_context),
+                ex=settings.CONVERSATION_TTL_SECONDS
+            )
+            # Owner and persistence bookkeeping live beside the scalar
+            # fields; a new history version discards any stored transcript
+            meta = {**self._meta(initial_state), "persisted_length": 0}
+            if user_id is not None:
+                meta["user_id"] = user_id
+            if "id" in scenario_context:
+                meta["scenario_id"] = scenario_context["id"]
+            pipe.hset(self._key(conversation_id, "meta"), mapping=meta)
+            pipe.hincrby(self._key(conversation_id, "meta"), "history_version", 1)
+            pipe.expire(self._key(conversation_id, "meta"), settings.CONVERSATION_TTL_SECONDS)
+            self._queue_persist(pipe, conversation_id)
+            await pipe.execute()
         
         return {
             "status": "started",
@@ -60,15 +130,128 @@ class ConversationOrchestrator:
         3. Generate agent response
         4. Safety check on agent response
         5. Update state
+        In the "fast" pipeline mode steps 2-4 are one call when it succeeds
         """
         
+        with trace("process_message"):
+            turn = await self._begin_turn(conversation_id, user_message)
+            if "state" not in turn:
+                return turn
+            state = turn["state"]
+            
+            if self._pipeline_mode(state) == "fast":
+                with stage("fast_turn"):
+                    result = await self._fast_turn(conversation_id, turn, user_message)
+                if result:
+                    return result
+            
+            if self.speculator:
+                # Steps 3-4 overlapped: replies for likely states start right away
+                with stage("speculation"):
+                    emotion_eval, agent_response, speculation = await self.speculator.run(
+                        state, user_message
+                    )
+                self._apply_emotion(state, emotion_eval)
+                result = await self._finish_turn(conversation_id, turn, emotion_eval, agent_response)
+                result["speculation"] = speculation
+                return result
+            
+            emotion_eval = await self._evaluate_emotion(state, user_message)
+            
+            # Step 4: Generate agent response
+            with stage("generation"):
+                agent_response = await self.emotional_agent.generate_response(
+                    user_message=user_message,
+                    emotional_state=state["emotional_state"],
+                    scenario_context=state["scenario"],
+                    conversation_history=state["history"],
+                    summary=state["summary"]
+                )
+            
+            return await self._finish_turn(conversation_id, turn, emotion_eval, agent_response)
+    
+    async def stream_message(
+        self,
+        conversation_id: int,
+        user_message: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Same pipeline as process_message, yielding the reply as safety-checked delta frames"""
+        
+        with trace("stream_message"):
+            turn = await self._begin_turn(conversation_id, user_message)
+            if "state" not in turn:
+                yield turn
+                return
+            state = turn["state"]
+            
+            # A fast turn has no token stream; its reply is one delta
+            if self._pipeline_mode(state) == "fast":
+                with stage("fast_turn"):
+                    result = await self._fast_turn(conversation_id, turn, user_message)
+                if result:
+                    yield {
+                        "type": "delta",
+                        "content": result["content"],
+                        "emotional_state": result["emotional_state"]
+                    }
+                    result["replaced"] = False
+                    yield result
+                    return
+            
+            emotion_eval = await self._evaluate_emotion(state, user_message)
+            
+            # Steps 4-5: Stream agent response, releasing each sentence once
+            # the safety check has approved it
+            tokens = self.emotional_agent.stream_response(
+                user_message=user_message,
+                emotional_state=state["emotional_state"],
+                scenario_context=state["scenario"],
+                conversation_history=state["history"],
+                summary=state["summary"]
+            )
+            safety_result = None
+            with stage("generation"):
+                async for event in self.safety_agent.check_response_stream(
+                    tokens,
+                    context={
+                        "emotional_state": state["emotional_state"],
+                        "scenario": state["scenario"]
+                    }
+                ):
+                    if event["type"] == "sentence":
+                        yield {
+                            "type": "delta",
+                            "content": event["content"],
+                            "emotional_state": state["emotional_state"]
+                        }
+                    else:
+                        safety_result = event
+            
+            result = await self._finish_turn(
+                conversation_id, turn, emotion_eval, safety_result["modified_response"],
+                safety_result=safety_result
+            )
+            # Deltas already shown must be replaced if the safety check swapped the reply
+            if "error" not in result:
+                result["replaced"] = not safety_result["safe"]
+            yield result
+    
+    async def _begin_turn(
+        self,
+        conversation_id: int,
+        user_message: str
+    ) -> Dict[str, Any]:
+        """Input safety check and checkpoint; returns the turn, or the frame to send back"""
+        
         # Load conversation state
-        state = self._load_state(conversation_id)
+        with stage("load_state"):
+            state = await self._load_state(conversation_id, window=HISTORY_WINDOW)
         if not state:
             return {"error": "Conversation not found"}
         
         # Step 1: Safety check on user input
-        safety_check = self.safety_agent.check_user_message_safety(user_message)
+        with stage("input_safety"):
+            safety_check = self.safety_agent.check_user_message_safety(user_message)
         if not safety_check["safe"]:
             return {
                 "role": "system",
@@ -76,59 +259,150 @@ class ConversationOrchestrator:
                 "type": "warning"
             }
         
-        # Step 2: Create checkpoint before processing (for redo functionality)
-        self._create_checkpoint(conversation_id, state)
+        # Step 2: Checkpoint for redo - the scalar fields plus the history
+        # length, written together with the new turn once it completes
+        with stage("checkpoint"):
+            checkpoint = {
+                **self._meta(state),
+                "history_length": state["history_length"]
+            }
         
         # Add user message to history
-        state["history"].append({
+        user_entry = {
             "role": "user",
             "content": user_message,
             "emotional_state": state["emotional_state"]
-        })
-        
-        # Step 3: Evaluate emotional state transition
-        emotion_eval = self.emotion_manager.evaluate_transition(
-            current_state=state["emotional_state"],
-            user_message=user_message,
-            conversation_history=state["history"],
-            scenario_context=state["scenario"]
-        )
+        }
+        state["history"].append(user_entry)
+        state["history_length"] += 1
         
-        # Update emotional state
-        new_emotional_state = emotion_eval["new_state"]
-        state["emotional_state"] = new_emotional_state
-        state["emotional_intensity"] = emotion_eval["intensity"]
+        return {"state": state, "checkpoint": checkpoint, "user_entry": user_entry}
+    
+    async def _evaluate_emotion(
+        self,
+        state: Dict[str, Any],
+        user_message: str
+    ) -> Dict[str, Any]:
+        """Step 3 of the pipeline: evaluate and apply the emotional transition"""
+        
+        with stage("emotion"):
+            emotion_eval = await self.emotion_manager.evaluate_transition(
+                current_state=state["emotional_state"],
+                user_message=user_message,
+                conversation_history=state["history"],
+                scenario_context=state["scenario"],
+                history_length=state["history_length"],
+                summary=state["summary"],
+                current_intensity=state["emotional_intensity"]
+            )
         
-        # Step 4: Generate agent response
-        agent_response = self.emotional_agent.generate_response(
-            user_message=user_message,
-            emotional_state=new_emotional_state,
-            scenario_context=state["scenario"],
-            conversation_history=state["history"]
+        self._apply_emotion(state, emotion_eval)
+        return emotion_eval
+    
+    def _pipeline_mode(self, state: Dict[str, Any]) -> str:
+        return state["scenario"].get("pipeline_mode") or settings.PIPELINE_MODE
+    
+    async def _fast_turn(
+        self,
+        conversation_id: int,
+        turn: Dict[str, Any],
+        user_message: str
+    ) -> Optional[Dict[str, Any]]:
+        """Steps 3-5 in one structured call; None when the staged pipeline should run instead"""
+        
+        state = turn["state"]
+        try:
+            fast = await self.fast_turn_agent.run(
+                user_message=user_message,
+                emotional_state=state["emotional_state"],
+                intensity=state["emotional_intensity"],
+                scenario_context=state["scenario"],
+                conversation_history=state["history"],
+                summary=state["summary"]
+            )
+        except Exception as e:
+            logger.error(f"Fast turn failed for conversation {conversation_id}: {str(e)}")
+            fast = None
+        
+        if fast is None:
+            reason = "unparseable"
+        elif not fast["safe"]:
+            reason = "self_flagged"
+        elif self.safety_agent.check_response_locally(fast["reply"]):
+            reason = "red_flag"
+        else:
+            reason = None
+        if reason:
+            fallbacks = self.fast_turn_stats["fallbacks"]
+            fallbacks[reason] = fallbacks.get(reason, 0) + 1
+            return None
+        
+        self.fast_turn_stats["turns"] += 1
+        emotion_eval = {
+            "new_state": fast["new_state"],
+            "intensity": fast["intensity"],
+            "reasoning": fast["reasoning"]
+        }
+        self._apply_emotion(state, emotion_eval)
+        return await self._finish_turn(
+            conversation_id, turn, emotion_eval, fast["reply"],
+            safety_result={"safe": True, "issues": [], "modified_response": fast["reply"]}
         )
+    
+    def _apply_emotion(self, state: Dict[str, Any], emotion_eval: Dict[str, Any]):
+        """Update emotional state"""
+        state["emotional_state"] = emotion_eval["new_state"]
+        state["emotional_intensity"] = emotion_eval["intensity"]
+    
+    async def _finish_turn(
+        self,
+        conversation_id: int,
+        turn: Dict[str, Any],
+        emotion_eval: Dict[str, Any],
+        agent_response: str,
+        safety_result: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Output safety check (unless safety_result is given) and state update"""
+        
+        state = turn["state"]
+        new_emotional_state = state["emotional_state"]
         
         # Step 5: Safety check on agent response
-        safety_result = self.safety_agent.check_response_safety(
-            response=agent_response,
-            context={
-                "emotional_state": new_emotional_state,
-                "scenario": state["scenario"]
-            }
-        )
+        if safety_result is None:
+            with stage("output_safety"):
+                safety_result = await self.safety_agent.check_response_safety(
+                    response=agent_response,
+                    context={
+                        "emotional_state": new_emotional_state,
+                        "scenario": state["scenario"]
+                    }
+                )
         
         final_response = safety_result["modified_response"]
         
         # Add agent response to history
-        state["history"].append({
+        agent_entry = {
             "role": "agent",
             "content": final_response,
             "emotional_state": new_emotional_state
-        })
+        }
+        state["history"].append(agent_entry)
         
         state["turn_count"] += 1
+        state["history_length"] += 1
+        
+        # Append the turn and save state and checkpoint in one round trip
+        with stage("save"):
+            committed = await self._commit_turn(
+                conversation_id, state, turn["checkpoint"], [turn["user_entry"], agent_entry]
+            )
+        if not committed:
+            return {"error": "Conversation changed while the reply was generated; please resend"}
         
-        # Save updated state
-        self._save_state(conversation_id, state)
+        if settings.COACH_TURN_NOTES:
+            self._start_turn_note(conversation_id, state, turn["user_entry"], agent_entry)
+        if settings.CONTEXT_SUMMARIES:
+            self._start_summary_update(conversation_id)
         
         return {
             "role": "agent",
@@ -141,28 +415,125 @@ class ConversationOrchestrator:
     
     async def pause_conversation(self, conversation_id: int) -> Dict[str, Any]:
         """Pause and save conversation state"""
-        state = self._load_state(conversation_id)
-        if state:
-            state["status"] = "paused"
-            self._save_state(conversation_id, state)
+        meta_key = self._key(conversation_id, "meta")
+        if await self.redis_client.exists(meta_key):
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(meta_key, "status", "paused")
+                self._queue_persist(pipe, conversation_id)
+                await pipe.execute()
             return {"status": "paused"}
         return {"error": "Conversation not found"}
     
-    async def redo_last_turn(self, conversation_id: int) -> Dict[str, Any]:
-        """Rewind to last checkpoint"""
-        checkpoint_key = f"conversation:{conversation_id}:checkpoint"
-        checkpoint_data = self.redis_client.get(checkpoint_key)
+    async def end_conversation(self, conversation_id: int) -> Dict[str, Any]:
+        """Mark the conversation completed; returns its final turn count and history version"""
+        meta_key = self._key(conversation_id, "meta")
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.exists(meta_key)
+            pipe.hmget(meta_key, "turn_count", "history_version")
+            exists, (turn_count, history_version) = await pipe.execute()
+        if not exists:
+            return {"error": "Conversation not found"}
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(meta_key, "status", "completed")
+            self._queue_persist(pipe, conversation_id)
+            await pipe.execute()
+        return {
+            "status": "completed",
+            "turn_count": int(turn_count),
+            "history_version": int(history_version or 0)
+        }
+    
+    async def redo_last_turn(
+        self,
+        conversation_id: int,
+        steps: int = 1,
+        turn: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Rewind `steps` turns, or to the state right after turn `turn` (0 is the start)"""
+        if steps < 1:
+            return {"error": "steps must be at least 1"}
+        if turn is not None and turn < 0:
+            return {"error": "turn must not be negative"}
         
-        if checkpoint_data:
-            # Restore from checkpoint
-            state = json.loads(checkpoint_data)
-            self._save_state(conversation_id, state)
-            return {
-                "status": "rewound",
-                "message": "Last turn has been undone. You can try a different response."
-            }
+        meta_key = self._key(conversation_id, "meta")
+        history_key = self._key(conversation_id, "history")
+        checkpoints_key = self._key(conversation_id, "checkpoints")
+        notes_key = self._key(conversation_id, "coach_notes")
+        summary_key = self._key(conversation_id, "summary")
         
-        return {"error": "No checkpoint available"}
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # Retry if a turn commits while we are rewinding
+                    await pipe.watch(meta_key, checkpoints_key)
+                    turn_count, persisted_length = await pipe.hmget(
+                        meta_key, "turn_count", "persisted_length"
+                    )
+                    checkpoints = [
+                        json.loads(entry) for entry in await pipe.lrange(checkpoints_key, 0, -1)
+                    ]
+                    summary = await pipe.get(summary_key)
+                    if turn_count is None:
+                        return {"error": "Conversation not found"}
+                    if turn is not None and turn > int(turn_count):
+                        return {"error": f"Turn {turn} has not been played yet"}
+                    if turn is not None and turn == int(turn_count):
+                        return {"error": f"Already at turn {turn}"}
+                    
+                    target = int(turn_count) - steps if turn is None else turn
+                    index = next(
+                        (i for i, cp in enumerate(checkpoints) if cp["turn_count"] == target),
+                        None
+                    )
+                    if index is None:
+                        return {"error": "No checkpoint available"}
+                    
+                    # Restore: drop the messages appended since, put the
+                    # scalar fields back and forget the later checkpoints.
+                    # Stored messages past the rewind point are rewritten
+                    # at the next flush
+                    checkpoint = dict(checkpoints[index])
+                    history_length = checkpoint.pop("history_length")
+                    pipe.multi()
+                    if history_length:
+                        pipe.ltrim(history_key, 0, history_length - 1)
+                    else:
+                        pipe.delete(history_key)
+                    pipe.hset(meta_key, mapping={
+                        **checkpoint,
+                        "persisted_length": min(int(persisted_length or 0), history_length)
+                    })
+                    pipe.hincrby(meta_key, "history_version", 1)
+                    self._queue_persist(pipe, conversation_id)
+                    if index:
+                        pipe.ltrim(checkpoints_key, 0, index - 1)
+                    else:
+                        pipe.delete(checkpoints_key)
+                    if int(turn_count) > target:
+                        pipe.hdel(notes_key, *range(target + 1, int(turn_count) + 1))
+                    if summary and json.loads(summary)["covered"] > history_length:
+                        # Summarizes messages that no longer exist; rebuilt next turn
+                        pipe.delete(summary_key)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        
+        undone = int(turn_count) - target
+        return {
+            "status": "rewound",
+            "turn": target,
+            "message": (
+                "Last turn has been undone. You can try a different response."
+                if undone == 1 else
+                f"Rewound {undone} turns. You can try a different response."
+            )
+        }
+    
+    async def list_checkpoints(self, conversation_id: int) -> List[int]:
+        """Turns that can currently be rewound to"""
+        entries = await self.redis_client.lrange(self._key(conversation_id, "checkpoints"), 0, -1)
+        return [json.loads(entry)["turn_count"] for entry in entries]
     
     async def get_coaching_hint(
         self,
@@ -170,49 +541,391 @@ class ConversationOrchestrator:
         context: str = "general"
     ) -> Dict[str, Any]:
         """Get real-time coaching hint"""
-        state = self._load_state(conversation_id)
-        if not state:
-            return {"error": "Conversation not found"}
+        with trace("coaching_hint"):
+            with stage("load_state"):
+                state = await self._load_state(conversation_id, window=1)
+            if not state:
+                return {"error": "Conversation not found"}
+            
+            with stage("coach"):
+                hint = await self.coach_agent.evaluate_single_response(
+                    user_message=state["history"][-1]["content"] if state["history"] else "",
+                    context={
+                        "emotional_state": state["emotional_state"],
+                        "scenario": state["scenario"]
+                    }
+                )
+            
+            return hint
+    
+    async def get_final_feedback(self, conversation_id: int) -> Dict[str, Any]:
+        """Generate comprehensive feedback, scoring only turns without a valid per-turn note"""
+        with trace("final_feedback"):
+            pending = self._coach_tasks.get(conversation_id)
+            if pending:
+                with stage("pending_notes"):
+                    await asyncio.gather(*pending, return_exceptions=True)
+            
+            with stage("load_state"):
+                state = await self._load_state(conversation_id)
+            if not state:
+                return {"error": "Conversation not found"}
+            notes = await self.redis_client.hgetall(self._key(conversation_id, "coach_notes"))
+            
+            # A note only counts if it was written for the turn now in the
+            # history, not for one that has since been rewound and replayed
+            history = state["history"]
+            partials = {}
+            missing = []
+            for turn in range(1, len(history) // 2 + 1):
+                messages = history[2 * (turn - 1):2 * turn]
+                note = json.loads(notes[str(turn)]) if str(turn) in notes else None
+                if note and note["digest"] == self._turn_digest(*messages):
+                    partials[turn] = (note["feedback"], 1)
+                else:
+                    missing.append((turn, messages))
+            
+            chunks = []
+            for turn, messages in missing:
+                first_turn, chunk = chunks[-1] if chunks else (None, None)
+                if chunk and first_turn + len(chunk) // 2 == turn and \
+                        len(chunk) < settings.COACH_CHUNK_TURNS * 2:
+                    chunk.extend(messages)
+                else:
+                    chunks.append((turn, list(messages)))
+            with stage("score_chunks"):
+                results = await self.coach_agent.evaluate_chunks(chunks, state["scenario"])
+            for (first_turn, chunk), result in zip(chunks, results):
+                if result:
+                    partials[first_turn] = (result, len(chunk) // 2)
+            
+            with stage("merge"):
+                feedback = await self.coach_agent.merge_feedback(
+                    [partials[turn] for turn in sorted(partials)]
+                )
+            
+            return feedback
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Pipeline counters for monitoring"""
+        stats = {
+            "llm_cache": response_cache.get_stats(),
+            "prompt_cache": prompt_cache_stats.get_stats(),
+            "structured_output": structured_output_stats.get_stats(),
+            "model_provider": get_provider_stats()
+        }
+        stats["emotion"] = self.emotion_manager.get_stats()
+        stats["fast_turn"] = {
+            **self.fast_turn_stats,
+            "fallbacks": dict(self.fast_turn_stats["fallbacks"])
+        }
+        if self.speculator:
+            stats["speculation"] = self.speculator.get_stats()
+        return stats
+    
+    async def pending_persistence(self, limit: int) -> List[int]:
+        """Conversations due to be written to Postgres, oldest change first"""
+        return [
+            int(conversation_id)
+            for conversation_id in await self.redis_client.zrangebyscore(
+                PERSIST_QUEUE_KEY, "-inf", time.time(), start=0, num=limit
+            )
+        ]
+    
+    async def persistence_backlog(self) -> Dict[str, Any]:
+        """Queued and dead-lettered conversations, and how long the oldest change has waited"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zcard(PERSIST_QUEUE_KEY)
+            pipe.zrange(PERSIST_QUEUE_KEY, 0, 0, withscores=True)
+            pipe.hlen(PERSIST_DEAD_LETTER_KEY)
+            pending, oldest, dead_letters = await pipe.execute()
+        return {
+            "pending": pending,
+            "lag_seconds": round(max(time.time() - oldest[0][1], 0.0), 3) if oldest else 0.0,
+            "dead_letters": dead_letters
+        }
+    
+    async def export_unpersisted(self, conversation_ids: List[int]) -> List[Dict[str, Any]]:
+        """Meta and unpersisted messages of each conversation, meta None once expired"""
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for conversation_id in conversation_ids:
+                pipe.hgetall(self._key(conversation_id, "meta"))
+            metas = await pipe.execute()
         
-        hint = self.coach_agent.evaluate_single_response(
-            user_message=state["history"][-1]["content"] if state["history"] else "",
-            context={
-                "emotional_state": state["emotional_state"],
-                "scenario": state["scenario"]
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for conversation_id, meta in zip(conversation_ids, metas):
+                if meta:
+                    start = int(meta.get("persisted_length", 0))
+                    pipe.lrange(self._key(conversation_id, "history"), start, -1)
+            histories = iter(await pipe.execute())
+        
+        exported_at = time.time()
+        return [
+            {
+                "conversation_id": conversation_id,
+                "meta": meta or None,
+                "start": int(meta.get("persisted_length", 0)) if meta else 0,
+                "messages": [json.loads(entry) for entry in next(histories)] if meta else [],
+                "exported_at": exported_at
             }
-        )
+            for conversation_id, meta in zip(conversation_ids, metas)
+        ]
+    
+    async def mark_persisted(self, export: Dict[str, Any]):
+        """Record that an export from export_unpersisted is stored"""
+        conversation_id = export["conversation_id"]
+        meta_key = self._key(conversation_id, "meta")
         
-        return hint
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(meta_key)
+                    meta = await pipe.hgetall(meta_key)
+                    pipe.multi()
+                    pipe.hdel(PERSIST_ATTEMPTS_KEY, conversation_id)
+                    pipe.hdel(PERSIST_DEAD_LETTER_KEY, conversation_id)
+                    if not meta or meta == export["meta"]:
+                        pipe.zrem(PERSIST_QUEUE_KEY, conversation_id)
+                    else:
+                        # Changed during the flush; its wait counts from the export
+                        pipe.zadd(PERSIST_QUEUE_KEY, {conversation_id: export["exported_at"]}, xx=True)
+                    if meta and export["meta"] and \
+                            meta.get("history_version") == export["meta"].get("history_version"):
+                        pipe.hset(
+                            meta_key, "persisted_length", export["start"] + len(export["messages"])
+                        )
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
     
-    async def get_final_feedback(self, conversation_id: int) -> Dict[str, Any]:
-        """Generate comprehensive feedback for completed conversation"""
-        state = self._load_state(conversation_id)
-        if not state:
-            return {"error": "Conversation not found"}
+    async def persistence_failed(
+        self,
+        conversation_id: int,
+        error: str,
+        max_attempts: int,
+        backoff: float
+    ) -> bool:
+        """Back off and retry a failed write, or dead-letter it (returns True)"""
+        attempts = await self.redis_client.hincrby(PERSIST_ATTEMPTS_KEY, conversation_id, 1)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            if attempts >= max_attempts:
+                pipe.zrem(PERSIST_QUEUE_KEY, conversation_id)
+                pipe.hdel(PERSIST_ATTEMPTS_KEY, conversation_id)
+                pipe.hset(PERSIST_DEAD_LETTER_KEY, conversation_id, json.dumps({
+                    "error": error,
+                    "attempts": attempts,
+                    "failed_at": time.time()
+                }))
+            else:
+                retry_at = time.time() + backoff * 2 ** (attempts - 1)
+                pipe.zadd(PERSIST_QUEUE_KEY, {conversation_id: retry_at}, xx=True)
+            await pipe.execute()
+        return attempts >= max_attempts
+    
+    def _start_turn_note(
+        self,
+        conversation_id: int,
+        state: Dict[str, Any],
+        user_entry: Dict[str, Any],
+        agent_entry: Dict[str, Any]
+    ):
+        """Have the coach score the finished turn in the background"""
+        task = asyncio.create_task(self._record_turn_note(
+            conversation_id,
+            state["turn_count"],
+            state["history"][:-2],
+            user_entry,
+            agent_entry,
+            state["scenario"],
+            state["summary"]
+        ))
+        tasks = self._coach_tasks.setdefault(conversation_id, set())
+        tasks.add(task)
         
-        feedback = self.coach_agent.evaluate_conversation(
-            conversation_history=state["history"],
-            scenario_context=state["scenario"]
-        )
+        def done(task):
+            tasks.discard(task)
+            if not tasks:
+                self._coach_tasks.pop(conversation_id, None)
+        task.add_done_callback(done)
+    
+    async def _record_turn_note(
+        self,
+        conversation_id: int,
+        turn: int,
+        previous: List[Dict[str, Any]],
+        user_entry: Dict[str, Any],
+        agent_entry: Dict[str, Any],
+        scenario: Dict[str, Any],
+        summary: Optional[str]
+    ):
+        try:
+            # Runs after the turn; its tokens are not the turn's
+            with trace("coach_note", detached=True):
+                feedback = await self.coach_agent.evaluate_turn(
+                    previous, user_entry["content"], agent_entry["content"], scenario, summary
+                )
+            if not feedback:
+                return
+            notes_key = self._key(conversation_id, "coach_notes")
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(notes_key, str(turn), json.dumps({
+                    "digest": self._turn_digest(user_entry, agent_entry),
+                    "feedback": feedback
+                }))
+                pipe.expire(notes_key, settings.CONVERSATION_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            # The turn is scored again when feedback is requested
+            logger.error(f"Coach note for turn {turn} failed: {str(e)}")
+    
+    def _start_summary_update(self, conversation_id: int):
+        """Fold messages that left the verbatim window into the summary, in the background"""
+        running = self._summary_tasks.get(conversation_id)
+        if running and not running.done():
+            # Updates are incremental; the next turn picks up what this one skips
+            return
+        task = asyncio.create_task(self._update_summary(conversation_id))
+        self._summary_tasks[conversation_id] = task
+        
+        def done(task):
+            if self._summary_tasks.get(conversation_id) is task:
+                del self._summary_tasks[conversation_id]
+        task.add_done_callback(done)
+    
+    async def _update_summary(self, conversation_id: int):
+        meta_key = self._key(conversation_id, "meta")
+        history_key = self._key(conversation_id, "history")
+        summary_key = self._key(conversation_id, "summary")
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(summary_key)
+                pipe.hget(meta_key, "history_version")
+                pipe.llen(history_key)
+                summary, version, history_length = await pipe.execute()
+            
+            summary = json.loads(summary) if summary else {"text": None, "covered": 0}
+            # Up to where the next turn's verbatim window starts, so no
+            # message is both summarized and sent as written
+            end = history_length - HISTORY_WINDOW
+            if end - summary["covered"] < settings.CONTEXT_SUMMARY_MIN_NEW_MESSAGES:
+                return
+            
+            messages = [
+                json.loads(entry)
+                for entry in await self.redis_client.lrange(history_key, summary["covered"], end - 1)
+            ]
+            with trace("summary_update", detached=True):
+                text = await self.summarizer.summarize(summary["text"], messages)
+            
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                while True:
+                    try:
+                        await pipe.watch(meta_key)
+                        if await pipe.hget(meta_key, "history_version") != version:
+                            return  # Rewound or restarted while summarizing
+                        pipe.multi()
+                        pipe.set(
+                            summary_key,
+                            json.dumps({"text": text, "covered": end}),
+                            ex=settings.CONVERSATION_TTL_SECONDS
+                        )
+                        await pipe.execute()
+                        return
+                    except WatchError:
+                        continue
+        except Exception as e:
+            # Agents fall back to the recent messages alone
+            logger.error(f"Summary update for conversation {conversation_id} failed: {str(e)}")
+    
+    def _turn_digest(self, user_entry: Dict[str, Any], agent_entry: Dict[str, Any]) -> str:
+        return hashlib.sha256(
+            f"{user_entry['content']}\0{agent_entry['content']}".encode()
+        ).hexdigest()[:16]
+    
+    def _key(self, conversation_id: int, name: str) -> str:
+        return f"conversation:{conversation_id}:{name}"
+    
+    def _queue_persist(self, pipe, conversation_id: int):
+        """Queue the conversation for the write-behind flusher (keeps the first change time)"""
+        pipe.zadd(PERSIST_QUEUE_KEY, {conversation_id: time.time()}, nx=True)
+    
+    def _meta(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Scalar fields kept in the conversation's meta hash"""
+        return {
+            "emotional_state": state["emotional_state"],
+            "emotional_intensity": state["emotional_intensity"],
+            "turn_count": state["turn_count"],
+            "status": state.get("status", "in_progress")
+        }
+    
+    async def _load_state(
+        self,
+        conversation_id: int,
+        window: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Load conversation state, with only the last `window` messages, in one round trip"""
+        history_key = self._key(conversation_id, "history")
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self._key(conversation_id, "meta"))
+            pipe.get(self._key(conversation_id, "scenario"))
+            pipe.lrange(history_key, -window if window else 0, -1)
+            pipe.llen(history_key)
+            pipe.get(self._key(conversation_id, "summary"))
+            meta, scenario, history, history_length, summary = await pipe.execute()
+        
+        if not meta or scenario is None:
+            return None
         
-        return feedback
-    
-    def _save_state(self, conversation_id: int, state: Dict[str, Any]):
-        """Save conversation state to Redis"""
-        key = f"conversation:{conversation_id}:state"
-        self.redis_client.set(key, json.dumps(state))
-        self.redis_client.expire(key, 86400)  # 24 hour TTL
-    
-    def _load_state(self, conversation_id: int) -> Dict[str, Any]:
-        """Load conversation state from Redis"""
-        key = f"conversation:{conversation_id}:state"
-        data = self.redis_client.get(key)
-        return json.loads(data) if data else None
-    
-    def _create_checkpoint(self, conversation_id: int, state: Dict[str, Any]):
-        """Create checkpoint for redo functionality"""
-        checkpoint_key = f"conversation:{conversation_id}:checkpoint"
-        # Save current state as checkpoint
-        checkpoint_state = json.loads(json.dumps(state))  # Deep copy
-        self.redis_client.set(checkpoint_key, json.dumps(checkpoint_state))
-        self.redis_client.expire(checkpoint_key, 3600)  # 1 hour TTL
+        return {
+            "conversation_id": conversation_id,
+            "scenario": json.loads(scenario),
+            "emotional_state": meta["emotional_state"],
+            "emotional_intensity": int(meta["emotional_intensity"]),
+            "turn_count": int(meta["turn_count"]),
+            "status": meta.get("status", "in_progress"),
+            "history": [json.loads(entry) for entry in history],
+            "history_length": history_length,
+            "history_version": int(meta.get("history_version", 0)),
+            "summary": json.loads(summary)["text"] if summary else None
+        }
+    
+    async def _commit_turn(
+        self,
+        conversation_id: int,
+        state: Dict[str, Any],
+        checkpoint: Dict[str, Any],
+        new_messages: List[Dict[str, Any]]
+    ) -> bool:
+        """Save the turn and its checkpoint; False if the conversation changed meanwhile"""
+        ttl = settings.CONVERSATION_TTL_SECONDS
+        meta_key = self._key(conversation_id, "meta")
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # Retry if meta changes between the check and EXEC
+                    await pipe.watch(meta_key)
+                    turn_count, history_version = await pipe.hmget(
+                        meta_key, "turn_count", "history_version"
+                    )
+                    if turn_count is None or \
+                            int(turn_count) != checkpoint["turn_count"] or \
+                            int(history_version or 0) != state["history_version"]:
+                        return False
+                    
+                    pipe.multi()
+                    pipe.rpush(
+                        self._key(conversation_id, "history"),
+                        *[json.dumps(message) for message in new_messages]
+                    )
+                    pipe.hset(meta_key, mapping=self._meta(state))
+                    pipe.rpush(self._key(conversation_id, "checkpoints"), json.dumps(checkpoint))
+                    pipe.ltrim(self._key(conversation_id, "checkpoints"), -settings.MAX_CHECKPOINTS, -1)
+                    pipe.expire(self._key(conversation_id, "checkpoints"), settings.CHECKPOINT_TTL_SECONDS)
+                    for name in ("history", "meta", "scenario"):
+                        pipe.expire(self._key(conversation_id, name), ttl)
+                    self._queue_persist(pipe, conversation_id)
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
@@ -1,7 +1,76 @@
-from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, AsyncIterator, List, Tuple
+from collections import deque
+from app.core.model_provider import chat_model
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import SystemMessage
+from app.agents.cache import response_cache
+from app.agents.structured import SafetyVerdict, invoke_structured
 from app.core.config import settings
+import asyncio
+import re
+
+# A sentence ends at terminal punctuation followed by whitespace
+# (so "3.5" or a half-streamed "..." don't split), or at CJK punctuation
+SENTENCE_END = re.compile(r'[.!?…]+["\'”’)\]]*\s+|[。！？]+')
+
+def split_sentences(text: str) -> Tuple[List[str], str]:
+    """Split off complete sentences, keeping trailing whitespace attached.
+    Returns (sentences, unfinished remainder)"""
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentences.append(text[start:match.end()])
+        start = match.end()
+    return sentences, text[start:]
+
+# Lines substituted for a reply that fails the safety check
+SAFE_FALLBACK_RESPONSES = {
+    "denial": "I hear what you're saying, Doctor. I just need some time to process this.",
+    "anger": "I'm feeling overwhelmed right now. Can we take a moment?",
+    "sadness": "This is very difficult to hear. Thank you for being honest with me.",
+    "acceptance": "I understand. What should we do next?",
+    "bargaining": "Is there anything else we can try?"
+}
+DEFAULT_SAFE_FALLBACK = "I need a moment to think about this."
+
+# Phrases in a reply that suggest one of the checker's red flags; a hit
+# does not make the reply unsafe, it only sends it to the full check
+RED_FLAG_PATTERNS = [
+    re.compile(r"\b(?:cure[sd]?|guarantee[sd]?|miracle|100 ?%|promise[sd]?)\b", re.I),
+    re.compile(r"\b(?:alternative (?:medicine|treatments?)|supplements?|herbal|detox)\b", re.I),
+    re.compile(r"\b(?:stupid|idiot|useless|shut up|hate you)\b", re.I),
+    re.compile(r"\b(?:kill|harm|hurt) (?:myself|himself|herself|you)\b", re.I)
+]
+
+SAFETY_INSTRUCTIONS = SystemMessage(content="""You are a safety and ethics checker for a medical conversation simulation.
+
+Check for:
+1. **Medical Accuracy**: No false medical information or made-up treatments
+2. **Ethical Guidelines**: Respects patient autonomy, beneficence, non-maleficence
+3. **Professional Boundaries**: Maintains appropriate doctor-family relationship
+4. **Cultural Sensitivity**: No offensive or culturally inappropriate content
+5. **Emotional Safety**: No cruel or unnecessarily harsh language
+
+Red Flags:
+- Promising impossible outcomes
+- Recommending unproven treatments
+- Violating medical ethics
+- Offensive language or stereotypes
+- Inappropriate emotional manipulation
+
+Set "safe" to false if the response is problematic, and list each problem briefly in "issues" (empty when safe).""")
+
+SAFETY_PROMPT = ChatPromptTemplate.from_messages([
+    SAFETY_INSTRUCTIONS,
+    ("human", "Context: {context}\n\nAgent Response: {response}\n\nIs this safe and appropriate?")
+])
+
+# Streamed replies: one new sentence, with the end of the approved text
+# before it for context (same instructions, so the prefix is shared)
+SENTENCE_SAFETY_PROMPT = ChatPromptTemplate.from_messages([
+    SAFETY_INSTRUCTIONS,
+    ("human", "Context: {context}\n\nEarlier in the response (already checked): {preceding}\n\nNext sentence of the Agent Response: {response}\n\nIs this sentence safe and appropriate?")
+])
 
 class SafetyAgent:
     """
@@ -10,13 +79,13 @@ class SafetyAgent:
     """
     
     def __init__(self):
-        self.llm = ChatOpenAI(
+        self.llm = chat_model(
+            "safety_agent",
             model="gpt-4o-mini",
-            temperature=0.2,  # Low temperature for consistent safety checks
-            openai_api_key=settings.OPENAI_API_KEY
+            temperature=0.2  # Low temperature for consistent safety checks
         )
     
-    def check_response_safety(
+    async def check_response_safety(
         self,
         response: str,
         context: Dict[str, Any]
@@ -26,21 +95,12 @@ class SafetyAgent:
         Returns: {safe: bool, issues: list, modified_response: str}
         """
         
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self._build_safety_prompt()),
-            ("human", f"Context: {context}\n\nAgent Response: {response}\n\nIs this safe and appropriate?")
-        ])
-        
-        chain = prompt | self.llm
-        result = chain.invoke({})
+        verdict = await self._evaluate(response, context)
         
-        # Parse response
-        content = result.content.lower()
-        
-        if "unsafe" in content or "inappropriate" in content:
+        if self._is_unsafe(verdict):
             return {
                 "safe": False,
-                "issues": self._extract_issues(result.content),
+                "issues": self._extract_issues(verdict),
                 "modified_response": self._get_safe_fallback(context)
             }
         
@@ -50,6 +110,72 @@ class SafetyAgent:
             "modified_response": response
         }
     
+    async def check_response_stream(
+        self,
+        tokens: AsyncIterator[str],
+        context: Dict[str, Any]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Check a response sentence by sentence while it is being generated"""
+        
+        pending = deque()  # (sentence, check task) in generation order
+        approved = []
+        generated = ""
+        buffer = ""
+        
+        def schedule(sentence: str):
+            nonlocal generated
+            preceding = generated[-settings.SAFETY_STREAM_CONTEXT_CHARS:]
+            generated += sentence
+            pending.append((sentence, asyncio.create_task(self._evaluate(sentence, context, preceding))))
+        
+        try:
+            async for token in tokens:
+                buffer += token
+                sentences, buffer = split_sentences(buffer)
+                for sentence in sentences:
+                    schedule(sentence)
+                
+                # Release whatever has been approved so far without waiting
+                while pending and pending[0][1].done():
+                    sentence, task = pending.popleft()
+                    verdict = task.result()
+                    if self._is_unsafe(verdict):
+                        yield self._violation(verdict, context, "".join(approved))
+                        return
+                    approved.append(sentence)
+                    yield {"type": "sentence", "content": sentence}
+            
+            if buffer.strip():
+                schedule(buffer)
+            
+            while pending:
+                sentence, task = pending.popleft()
+                verdict = await task
+                if self._is_unsafe(verdict):
+                    yield self._violation(verdict, context, "".join(approved))
+                    return
+                approved.append(sentence)
+                yield {"type": "sentence", "content": sentence}
+        finally:
+            for _, task in pending:
+                task.cancel()
+            if hasattr(tokens, "aclose"):
+                await tokens.aclose()
+        
+        # A single sentence was checked exactly as the whole response would be
+        if len(approved) > 1:
+            verdict = await self._evaluate(generated, context)
+            if self._is_unsafe(verdict):
+                yield self._violation(verdict, context, generated)
+                return
+        
+        yield {
+            "type": "result",
+            "safe": True,
+            "issues": [],
+            "modified_response": "".join(approved)
+        }
+    
     def check_user_message_safety(
         self,
         user_message: str
@@ -70,44 +196,79 @@ class SafetyAgent:
         
         return {"safe": True}
     
-    def _build_safety_prompt(self) -> str:
-        return """You are a safety and ethics checker for a medical conversation simulation.
-
-Check for:
-1. **Medical Accuracy**: No false medical information or made-up treatments
-2. **Ethical Guidelines**: Respects patient autonomy, beneficence, non-maleficence
-3. **Professional Boundaries**: Maintains appropriate doctor-family relationship
-4. **Cultural Sensitivity**: No offensive or culturally inappropriate content
-5. **Emotional Safety**: No cruel or unnecessarily harsh language
-
-Red Flags:
-- Promising impossible outcomes
-- Recommending unproven treatments
-- Violating medical ethics
-- Offensive language or stereotypes
-- Inappropriate emotional manipulation
-
-Respond with:
-- "SAFE" if appropriate
-- "UNSAFE: [reason]" if problematic"""
-
-    def _extract_issues(self, response: str) -> list:
-        """Extract safety issues from LLM response"""
-        # Simple extraction - could be more sophisticated
-        lines = response.split("\n")
-        issues = [line.strip() for line in lines if ":" in line]
-        return issues[:3]  # Top 3 issues
+    def check_response_locally(self, response: str) -> List[str]:
+        """
+        Red-flag phrases found in a response, without a model call
+        Used where the response was self-checked by the model that wrote it
+        """
+        return [
+            match.group(0)
+            for pattern in RED_FLAG_PATTERNS
+            for match in [pattern.search(response)]
+            if match
+        ]
+    
+    async def _evaluate(
+        self,
+        response: str,
+        context: Dict[str, Any],
+        preceding: str = ""
+    ) -> Dict[str, Any]:
+        """Ask the checker model for a {safe, issues} verdict on a response or one sentence"""
+        
+        # Verdicts depend on the exact text, so it is not normalized
+        cache_key = response_cache.make_key(
+            "safety_verdict",
+            model=self.llm.model_name,
+            scenario_id=context.get("scenario", {}).get("id"),
+            emotional_state=context.get("emotional_state"),
+            response=response,
+            preceding=preceding
+        )
+        cached = await response_cache.get(cache_key, self.llm.temperature)
+        if cached is not None:
+            return cached
+        
+        inputs = {"context": str(context), "response": response}
+        if preceding:
+            inputs["preceding"] = preceding
+        result = await invoke_structured(
+            "safety_agent",
+            self.llm,
+            SENTENCE_SAFETY_PROMPT if preceding else SAFETY_PROMPT,
+            inputs,
+            SafetyVerdict,
+            defaults={"issues": []}
+        )
+        if result is None:
+            # No verdict is not a pass (not cached)
+            return {"safe": False, "issues": ["Safety check returned no verdict"]}
+        
+        verdict = result.model_dump()
+        await response_cache.set(
+            cache_key, verdict, self.llm.temperature,
+            ttl=settings.LLM_CACHE_SAFETY_TTL_SECONDS
+        )
+        return verdict
+    
+    def _is_unsafe(self, verdict: Dict[str, Any]) -> bool:
+        return not verdict["safe"]
+    
+    def _violation(self, verdict: Dict[str, Any], context: Dict[str, Any], released: str) -> Dict[str, Any]:
+        """Final stream event when a sentence fails the check"""
+        return {
+            "type": "result",
+            "safe": False,
+            "issues": self._extract_issues(verdict),
+            "modified_response": self._get_safe_fallback(context),
+            "released": released
+        }
+    
+    def _extract_issues(self, verdict: Dict[str, Any]) -> list:
+        return verdict["issues"][:3]  # Top 3 issues
     
     def _get_safe_fallback(self, context: Dict[str, Any]) -> str:
         """Return a safe, generic response"""
         emotional_state = context.get("emotional_state", "uncertain")
         
-        fallback_responses = {
-            "denial": "I hear what you're saying, Doctor. I just need some time to process this.",
-            "anger": "I'm feeling overwhelmed right now. Can we take a moment?",
-            "sadness": "This is very difficult to hear. Thank you for being honest with me.",
-            "acceptance": "I understand. What should we do next?",
-            "bargaining": "Is there anything else we can try?"
-        }
-        
-        return fallback_responses.get(emotional_state, "I need a moment to think about this.")
+        return SAFE_FALLBACK_RESPONSES.get(emotional_state, DEFAULT_SAFE_FALLBACK)
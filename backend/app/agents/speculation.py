@@ -0,0 +1,162 @@
+from typing import Dict, Any, List, Tuple
+from collections import Counter
+import asyncio
+from app.agents.emotional_agent import EmotionalAgent
+from app.agents.emotion_state_manager import EmotionStateManager
+from app.core.config import settings
+
+class SpeculativeGenerator:
+    """
+    Speculative reply generation
+    Starts replies for likely next states while the transition is evaluated
+    """
+
+    def __init__(
+        self,
+        emotional_agent: EmotionalAgent,
+        emotion_manager: EmotionStateManager,
+        max_branches: int = 2
+    ):
+        self.emotional_agent = emotional_agent
+        self.emotion_manager = emotion_manager
+        self.max_branches = max_branches
+
+        # Cumulative counters across all speculative turns
+        self.stats = {
+            "turns": 0,
+            "hits": 0,
+            "branches": 0,
+            "cancelled_branches": 0,
+            "wasted_tokens": 0,
+            "local_turns": 0  # Decided by the local classifier, nothing to speculate on
+        }
+
+    def candidate_states(self, current_state: str) -> List[str]:
+        """States reachable from current_state, most likely first"""
+        rules = self.emotion_manager.transition_rules.get(current_state, {})
+        counts = Counter(
+            state for next_states in rules.values() for state in next_states
+        )
+        ranked = sorted(
+            counts,
+            key=lambda state: (state != current_state, -counts[state])
+        )
+        return (ranked or [current_state])[:self.max_branches]
+
+    async def run(
+        self,
+        state: Dict[str, Any],
+        user_message: str
+    ) -> Tuple[Dict[str, Any], str, Dict[str, Any]]:
+        """
+        Evaluate the transition and generate the reply concurrently
+        Returns (emotion_eval, agent_response, turn_metrics)
+        """
+
+        emotion_eval = None
+        if settings.EMOTION_FAST_PATH:
+            emotion_eval = self.emotion_manager.classify_transition(
+                state["emotional_state"], user_message, state["history"], state["emotional_intensity"]
+            )
+        if emotion_eval:
+            self.stats["local_turns"] += 1
+            agent_response = await self.emotional_agent.generate_response(
+                user_message=user_message,
+                emotional_state=emotion_eval["new_state"],
+                scenario_context=state["scenario"],
+                conversation_history=state["history"],
+                summary=state.get("summary")
+            )
+            return emotion_eval, agent_response, {"hit": None, "branches": 0, "local": True}
+
+        candidates = self.candidate_states(state["emotional_state"])
+        usage = {candidate: {} for candidate in candidates}
+        branches = {
+            candidate: asyncio.create_task(
+                self._branch(state, user_message, candidate, usage[candidate])
+            )
+            for candidate in candidates
+        }
+
+        try:
+            emotion_eval = await self.emotion_manager.evaluate_transition(
+                current_state=state["emotional_state"],
+                user_message=user_message,
+                conversation_history=state["history"],
+                scenario_context=state["scenario"],
+                history_length=state["history_length"],
+                summary=state.get("summary"),
+                current_intensity=state["emotional_intensity"]
+            )
+        except BaseException:
+            for task in branches.values():
+                task.cancel()
+            raise
+
+        new_state = emotion_eval["new_state"]
+        winner = branches.pop(new_state, None)
+
+        # Discard the losing branches; whatever they had sent and streamed is spent
+        wasted_tokens = 0
+        cancelled = 0
+        for candidate, task in branches.items():
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+            spent = usage[candidate]
+            wasted_tokens += spent.get("prompt_tokens", 0) + spent.get("completion_tokens", 0)
+
+        if winner is not None:
+            agent_response = await winner
+        else:
+            # Miss: the decided state was not speculated on
+            agent_response = await self.emotional_agent.generate_response(
+                user_message=user_message,
+                emotional_state=new_state,
+                scenario_context=state["scenario"],
+                conversation_history=state["history"],
+                summary=state.get("summary")
+            )
+
+        metrics = {
+            "hit": winner is not None,
+            "branches": len(candidates),
+            "cancelled_branches": cancelled,
+            "wasted_tokens": wasted_tokens
+        }
+
+        self.stats["turns"] += 1
+        self.stats["hits"] += int(metrics["hit"])
+        self.stats["branches"] += metrics["branches"]
+        self.stats["cancelled_branches"] += cancelled
+        self.stats["wasted_tokens"] += wasted_tokens
+
+        return emotion_eval, agent_response, metrics
+
+    async def _branch(
+        self,
+        state: Dict[str, Any],
+        user_message: str,
+        emotional_state: str,
+        usage: Dict[str, int]
+    ) -> str:
+        """Stream one speculative reply, tracking its token usage in usage"""
+        pieces = []
+        async for piece in self.emotional_agent.stream_response(
+            user_message=user_message,
+            emotional_state=emotional_state,
+            scenario_context=state["scenario"],
+            conversation_history=state["history"],
+            summary=state.get("summary"),
+            usage=usage
+        ):
+            pieces.append(piece)
+        return "".join(pieces)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Cumulative speculation counters with the overall hit rate"""
+        turns = self.stats["turns"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / turns if turns else 0.0
+        }
@@ -0,0 +1,171 @@
+from typing import Any, Dict, List, Literal, Optional, Type, TypeVar
+import json
+import logging
+import re
+from langchain_openai import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, HumanMessage
+from pydantic import BaseModel, ValidationError, field_validator
+from app.agents.emotional_agent import EMOTIONAL_INSTRUCTIONS
+from app.agents.usage import prompt_cache_stats
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Ranges are enforced by the validators rather than the JSON schema, which
+# strict mode keeps to types and enums; out-of-range values are clamped
+EmotionalState = Literal[tuple(EMOTIONAL_INSTRUCTIONS)]
+
+class EmotionEvaluation(BaseModel):
+    new_state: EmotionalState
+    intensity: int
+    reasoning: str
+
+    @field_validator("intensity")
+    @classmethod
+    def _intensity_range(cls, value: int) -> int:
+        return min(max(value, 1), 10)
+
+class SafetyVerdict(BaseModel):
+    safe: bool
+    issues: List[str]
+
+class SuggestedResponse(BaseModel):
+    situation: str
+    better_response: str
+
+class CoachFeedback(BaseModel):
+    empathy_score: float
+    clarity_score: float
+    emotional_alignment_score: float
+    ethical_appropriateness_score: float
+    cultural_sensitivity_score: float
+    overall_score: float
+    strengths: List[str]
+    areas_for_improvement: List[str]
+    suggested_responses: List[SuggestedResponse]
+    summary: str
+
+    @field_validator(
+        "empathy_score", "clarity_score", "emotional_alignment_score",
+        "ethical_appropriateness_score", "cultural_sensitivity_score", "overall_score"
+    )
+    @classmethod
+    def _score_range(cls, value: float) -> float:
+        return min(max(value, 0.0), 10.0)
+
+class FastTurn(BaseModel):
+    new_state: EmotionalState
+    intensity: int
+    reasoning: str
+    reply: str
+    safe: bool
+    safety_concern: str
+
+    @field_validator("intensity")
+    @classmethod
+    def _intensity_range(cls, value: int) -> int:
+        return min(max(value, 1), 10)
+
+Model = TypeVar("Model", bound=BaseModel)
+
+JSON_OBJECT = re.compile(r"\{.*\}", re.S)
+
+def repair(
+    schema: Type[Model],
+    content: str,
+    defaults: Optional[Dict[str, Any]] = None
+) -> Optional[Model]:
+    """Salvage a reply that missed the schema; None if a required field is unusable"""
+    defaults = defaults or {}
+    match = JSON_OBJECT.search(content or "")
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    data = {**defaults, **{key: value for key, value in data.items() if value is not None}}
+    for _ in range(2):
+        try:
+            return schema.model_validate(data)
+        except ValidationError as e:
+            invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+            if not invalid or not invalid <= defaults.keys():
+                return None
+            data.update({field: defaults[field] for field in invalid})
+    return None
+
+class StructuredOutputStats:
+    """Per agent: model calls, and how many outputs were parsed, repaired or wasted"""
+
+    def __init__(self):
+        self._agents: Dict[str, Dict[str, int]] = {}
+
+    def agent(self, agent: str) -> Dict[str, int]:
+        return self._agents.setdefault(agent, {
+            "calls": 0, "parsed": 0, "repaired": 0, "retries": 0, "wasted": 0, "failed": 0
+        })
+
+    def can_retry(self, agent: str) -> bool:
+        """Retries stay within STRUCTURED_OUTPUT_RETRY_RATIO of all calls"""
+        stats = self.agent(agent)
+        return stats["retries"] < settings.STRUCTURED_OUTPUT_RETRY_RATIO * max(stats["calls"], 10)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            agent: {
+                **stats,
+                "wasted_rate": round(stats["wasted"] / stats["calls"], 3) if stats["calls"] else 0.0
+            }
+            for agent, stats in self._agents.items()
+        }
+
+structured_output_stats = StructuredOutputStats()
+
+async def invoke_structured(
+    agent: str,
+    llm: ChatOpenAI,
+    prompt: ChatPromptTemplate,
+    inputs: Dict[str, Any],
+    schema: Type[Model],
+    defaults: Optional[Dict[str, Any]] = None
+) -> Optional[Model]:
+    """Call the model with a strict schema, repairing or retrying bad replies; None if unusable"""
+    structured = llm.with_structured_output(
+        schema, method="json_schema", strict=True, include_raw=True
+    )
+    messages = await prompt.aformat_messages(**inputs)
+    stats = structured_output_stats.agent(agent)
+
+    for attempt in range(settings.STRUCTURED_OUTPUT_MAX_RETRIES + 1):
+        stats["calls"] += 1
+        result = await structured.ainvoke(messages)
+        raw = result["raw"]
+        prompt_cache_stats.record(agent, raw)
+
+        if result["parsed"] is not None:
+            stats["parsed"] += 1
+            return result["parsed"]
+
+        repaired = repair(schema, raw.content, defaults)
+        if repaired is not None:
+            stats["repaired"] += 1
+            return repaired
+
+        stats["wasted"] += 1
+        error = result["parsing_error"] or "no JSON object in the reply"
+        logger.warning(f"{agent} reply did not match {schema.__name__}: {str(error)[:200]}")
+        if attempt == settings.STRUCTURED_OUTPUT_MAX_RETRIES or not structured_output_stats.can_retry(agent):
+            break
+        stats["retries"] += 1
+        messages = messages + [
+            AIMessage(content=raw.content or ""),
+            HumanMessage(content=f"That reply did not match the required JSON schema ({str(error)[:300]}). Reply again with the complete JSON object only.")
+        ]
+
+    stats["failed"] += 1
+    return None
@@ -0,0 +1,84 @@
+from typing import Dict, Any
+import logging
+from app.core.tracing import record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+
+def token_usage(message: Any) -> Dict[str, int]:
+    """
+    Extract token counts from a chat model message
+    Handles both usage_metadata (newer langchain-core) and the raw
+    OpenAI token_usage block in response_metadata. cached_prompt_tokens
+    is the part of the prompt served from the provider's prompt cache
+    """
+
+    # Older langchain-openai only reports cached tokens in the raw block
+    metadata = getattr(message, "response_metadata", None) or {}
+    raw = metadata.get("token_usage") or {}
+    raw_cached = (raw.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "cached_prompt_tokens": details.get("cache_read", 0) or raw_cached
+        }
+
+    return {
+        "prompt_tokens": raw.get("prompt_tokens", 0),
+        "completion_tokens": raw.get("completion_tokens", 0),
+        "cached_prompt_tokens": raw_cached
+    }
+
+
+class PromptCacheStats:
+    """
+    Share of prompt tokens served from the provider's prefix cache, per
+    agent. A ratio that stays near zero across turns of one conversation
+    means the static prompt prefix is not byte-identical between calls
+    """
+
+    def __init__(self):
+        self._agents: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, agent: str, message: Any) -> float:
+        """
+        Count one call's usage; returns its cached-prefix ratio
+        Every agent reports its calls here, so this also feeds the tokens
+        of the trace spans open around the call
+        """
+        usage = token_usage(message)
+        metadata = getattr(message, "response_metadata", None) or {}
+        record_llm_usage(agent, metadata.get("model_name", "unknown"), usage)
+        prompt_tokens = usage["prompt_tokens"]
+        cached = usage["cached_prompt_tokens"]
+        ratio = cached / prompt_tokens if prompt_tokens else 0.0
+
+        stats = self._agents.setdefault(agent, {
+            "calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0,
+            "completion_tokens": 0, "last_ratio": 0.0
+        })
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["cached_prompt_tokens"] += cached
+        stats["completion_tokens"] += usage["completion_tokens"]
+        stats["last_ratio"] = round(ratio, 3)
+        logger.debug(f"{agent} prompt: {cached}/{prompt_tokens} tokens from cache ({ratio:.0%})")
+        return ratio
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            agent: {
+                **stats,
+                "cached_ratio": round(
+                    stats["cached_prompt_tokens"] / stats["prompt_tokens"], 3
+                ) if stats["prompt_tokens"] else 0.0
+            }
+            for agent, stats in self._agents.items()
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -1,65 +1,109 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import StreamingResponse
+from typing import AsyncIterator
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel
-from openai import OpenAI, OpenAIError
+from openai import OpenAIError
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartParser, MultiPartException
 from app.core.config import settings
-import io
+from app.core.model_provider import ReplayMissError
+from app.core.tracing import stage, trace
+from app.services.speech import get_voice_for_emotion, open_speech_stream, transcribe
+from app.services.tts_cache import speech_cache
 import logging
 
 router = APIRouter()
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
 logger = logging.getLogger(__name__)
 
 class TTSRequest(BaseModel):
     text: str
     emotion: str = "neutral"
 
-def get_voice_for_emotion(emotion: str) -> str:
-    """Map emotional states to appropriate TTS voices"""
-    voice_map = {
-        "neutral": "nova",      # Calm, professional
-        "denial": "alloy",      # Slightly defensive
-        "anger": "onyx",        # Deeper, more intense
-        "bargaining": "shimmer", # Hopeful, pleading
-        "sadness": "echo",      # Softer, emotional
-        "acceptance": "fable"   # Peaceful, resigned
+class SpooledUploadParser(MultiPartParser):
+    # Uploaded files above this size are spooled to disk instead of memory
+    max_file_size = settings.STT_SPOOL_THRESHOLD_BYTES
+
+def max_upload_bytes() -> int:
+    """
+    Upload size cap: the explicit byte limit, or the size of the longest
+    allowed recording at the highest expected bitrate, whichever is lower
+    """
+    duration_cap = settings.STT_MAX_DURATION_SECONDS * settings.STT_MAX_BITRATE_BPS // 8
+    return min(settings.STT_MAX_UPLOAD_BYTES, duration_cap)
+
+async def limited_body(request: Request, limit: int) -> AsyncIterator[bytes]:
+    """Request body stream that aborts as soon as it exceeds limit"""
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail="Recording is too long or too large")
+        yield chunk
+
+# The form is parsed by hand, so describe it for the OpenAPI docs
+STT_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {"audio_file": {"type": "string", "format": "binary"}},
+                "required": ["audio_file"]
+            }
+        }
     }
-    return voice_map.get(emotion, "nova")
+}
 
-@router.post("/speech-to-text")
-async def speech_to_text(audio_file: UploadFile = File(...)):
+@router.post("/speech-to-text", openapi_extra={"requestBody": STT_REQUEST_BODY})
+async def speech_to_text(request: Request):
     """
     Convert speech audio to text using OpenAI Whisper API
+    Expects a multipart form with the recording in `audio_file`. The
+    upload is parsed as it streams in, with size/duration limits enforced
+    on the way, and spooled to disk above STT_SPOOL_THRESHOLD_BYTES
     """
-    try:
-        # Read the uploaded audio file
-        audio_data = await audio_file.read()
-        
-        # Create a file-like object for OpenAI API
-        audio_file_obj = io.BytesIO(audio_data)
-        audio_file_obj.name = audio_file.filename or "audio.webm"
+    with trace("speech_to_text"):
+        limit = max_upload_bytes()
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > limit:
+            raise HTTPException(status_code=413, detail="Recording is too long or too large")
         
-        # Use Whisper API for transcription
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file_obj,
-            language="en"  # Can be made configurable for Japanese support
-        )
-        
-        return {
-            "text": transcription.text,
-            "success": True
-        }
-    
-    except OpenAIError as e:
-        logger.error(f"OpenAI API error: {str(e)}")
-        error_msg = "Transcription service unavailable. Please check your OpenAI API quota."
-        if hasattr(e, 'code') and e.code == 'insufficient_quota':
-            error_msg = "OpenAI API quota exceeded. Please check your billing details at https://platform.openai.com/account/billing"
-        raise HTTPException(status_code=503, detail=error_msg)
-    except Exception as e:
-        logger.error(f"Unexpected error in speech-to-text: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
+        form = None
+        try:
+            with stage("upload"):
+                parser = SpooledUploadParser(request.headers, limited_body(request, limit), max_files=1, max_fields=10)
+                form = await parser.parse()
+            audio_file = form.get("audio_file")
+            if not isinstance(audio_file, UploadFile):
+                raise HTTPException(status_code=422, detail="Missing audio_file upload")
+            
+            # Use Whisper API for transcription
+            with stage("transcribe"):
+                text = await transcribe(audio_file.file, audio_file.filename or "audio.webm")
+            
+            return {
+                "text": text,
+                "success": True
+            }
+            
+        except HTTPException:
+            raise
+        except OpenAIError as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            error_msg = "Transcription service unavailable. Please check your OpenAI API quota."
+            if hasattr(e, 'code') and e.code == 'insufficient_quota':
+                error_msg = "OpenAI API quota exceeded. Please check your billing details at https://platform.openai.com/account/billing"
+            raise HTTPException(status_code=503, detail=error_msg)
+        except ReplayMissError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=e.message)
+        except Exception as e:
+            logger.error(f"Unexpected error in speech-to-text: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
+        finally:
+            if form is not None:
+                await form.close()
 
 @router.post("/text-to-speech")
 async def text_to_speech(request: TTSRequest):
@@ -67,45 +111,52 @@ async def text_to_speech(request: TTSRequest):
     Convert text to speech using OpenAI TTS API
     Voice is selected based on emotional state for more realistic interactions
     """
-    try:
-        # Select voice based on emotion
-        voice = get_voice_for_emotion(request.emotion)
-        
-        # Generate speech
-        response = client.audio.speech.create(
-            model="tts-1",  # Use tts-1-hd for higher quality if needed
-            voice=voice,
-            input=request.text,
-            speed=1.0  # Can be adjusted based on emotion (faster for anger, slower for sadness)
-        )
-        
-        # Read the audio content
-        audio_content = response.read()
-        audio_bytes = io.BytesIO(audio_content)
-        
-        return StreamingResponse(
-            audio_bytes,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "attachment; filename=response.mp3"
-            }
-        )
-    
-    except OpenAIError as e:
-        logger.error(f"OpenAI API error: {str(e)}")
-        error_msg = "Text-to-speech service unavailable. Please check your OpenAI API quota."
-        if hasattr(e, 'code') and e.code == 'insufficient_quota':
-            error_msg = "OpenAI API quota exceeded. Please check your billing details at https://platform.openai.com/account/billing"
-        raise HTTPException(status_code=503, detail=error_msg)
-    except Exception as e:
-        logger.error(f"Unexpected error in text-to-speech: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"TTS generation failed: {str(e)}")
+    with trace("text_to_speech"):
+        try:
+            # Select voice based on emotion
+            voice = get_voice_for_emotion(request.emotion)
+            
+            speed = 1.0  # Can be adjusted based on emotion (faster for anger, slower for sadness)
+            headers = {"Content-Disposition": "attachment; filename=response.mp3"}
+            
+            # Generate speech; chunks are forwarded as they arrive upstream
+            # Timed until the audio starts; the body streams after the span
+            with stage("synthesize"):
+                if settings.TTS_CACHE_ENABLED:
+                    # Audio synthesized before is served straight from disk,
+                    # new audio is cached on the way through
+                    key = speech_cache.key(request.text, voice, speed, "tts-1")
+                    cached = speech_cache.lookup(key)
+                    if cached is not None:
+                        return FileResponse(cached, media_type="audio/mpeg", headers=headers)
+                    audio_chunks = speech_cache.fill(key, await open_speech_stream(request.text, voice, speed=speed))
+                else:
+                    audio_chunks = await open_speech_stream(request.text, voice, speed=speed)
+            
+            return StreamingResponse(
+                audio_chunks,
+                media_type="audio/mpeg",
+                headers=headers
+            )
+            
+        except OpenAIError as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            error_msg = "Text-to-speech service unavailable. Please check your OpenAI API quota."
+            if hasattr(e, 'code') and e.code == 'insufficient_quota':
+                error_msg = "OpenAI API quota exceeded. Please check your billing details at https://platform.openai.com/account/billing"
+            raise HTTPException(status_code=503, detail=error_msg)
+        except ReplayMissError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except Exception as e:
+            logger.error(f"Unexpected error in text-to-speech: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"TTS generation failed: {str(e)}")
 
 @router.get("/health")
 async def audio_health_check():
     """Check if audio services are configured"""
     return {
         "status": "healthy",
+        "backend": settings.MODEL_BACKEND,
         "whisper_available": True,
         "tts_available": True
     }
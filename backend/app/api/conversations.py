@@ -1,10 +1,22 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException, Query
+from pydantic import BaseModel, Field, ValidationError
 from typing import List, Optional
+import asyncio
 import json
+import logging
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.agents.orchestrator import ConversationOrchestrator
+from app.agents.emotional_agent import OPENING_LINE
+from app.api.feedback import FeedbackResponse, get_feedback
+from app.core.database import get_db
+from app.services.speech import SpeechPipeline
+from app.services.live_transcription import LiveTranscriber, SUPPORTED_SAMPLE_RATES
+from app.services.feedback import request_feedback
+from app.services.persistence import conversation_flusher
+from app.services.scenarios import scenario_catalog
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 orchestrator = ConversationOrchestrator()
 
 class ConversationStart(BaseModel):
@@ -29,53 +41,26 @@ class MessageResponse(BaseModel):
     content: str
     emotional_state: Optional[str]
 
-# Mock scenario data - in production this would come from database
-MOCK_SCENARIOS = {
-    1: {
-        "id": 1,
-        "title": "Terminal Cancer - Family in Denial",
-        "description": "75-year-old patient with stage 4 lung cancer. Adult daughter is in denial about prognosis.",
-        "patient_condition": "Stage 4 lung cancer with weeks to live",
-        "patient_age": 75,
-        "family_relationship": "Adult daughter",
-        "family_background": "Only child who has been very close to parent. Works as a nurse.",
-        "initial_emotional_state": "denial"
-    },
-    2: {
-        "id": 2,
-        "title": "Sudden Cardiac Arrest - Spouse in Shock",
-        "description": "58-year-old patient after cardiac arrest. Spouse is experiencing shock and anger.",
-        "patient_condition": "Post-cardiac arrest, severe brain damage",
-        "patient_age": 58,
-        "family_relationship": "Spouse",
-        "family_background": "Married 30 years. No other family nearby.",
-        "initial_emotional_state": "anger"
-    },
-    3: {
-        "id": 3,
-        "title": "Advanced Dementia - Family Disagreement",
-        "description": "82-year-old with advanced dementia. Family members disagree on care approach.",
-        "patient_condition": "Advanced dementia, recurrent aspiration pneumonia",
-        "patient_age": 82,
-        "family_relationship": "Adult children (multiple)",
-        "family_background": "Three adult children with different opinions on care.",
-        "initial_emotional_state": "bargaining"
-    }
-}
+class RedoRequest(BaseModel):
+    """WebSocket redo options, coerced like the REST query parameters"""
+    steps: int = Field(1, ge=1)
+    turn: Optional[int] = Field(None, ge=0)
 
 @router.post("/start", response_model=ConversationResponse)
 async def start_conversation(conversation: ConversationStart):
     # Get scenario context
-    scenario_context = MOCK_SCENARIOS.get(conversation.scenario_id)
+    await scenario_catalog.refresh()
+    scenario_context = scenario_catalog.get(conversation.scenario_id)
     if not scenario_context:
-        scenario_context = MOCK_SCENARIOS[1]  # Default scenario
+        raise HTTPException(status_code=404, detail="Scenario not found")
     
     # Initialize conversation with orchestrator
     conversation_id = conversation.scenario_id * 1000 + conversation.user_id  # Simple ID generation
     
     result = await orchestrator.start_conversation(
         conversation_id=conversation_id,
-        scenario_context=scenario_context
+        scenario_context=scenario_context,
+        user_id=conversation.user_id
     )
     
     return {
@@ -92,37 +77,90 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: int):
     # Send initial greeting from agent
     await websocket.send_json({
         "role": "agent",
-        "content": "Doctor... thank you for taking the time to speak with me. I know you're busy.",
+        "content": OPENING_LINE,
         "emotional_state": "neutral",
         "type": "message"
     })
     
+    live_audio = None  # LiveTranscriber while the physician is speaking
+    
     try:
         while True:
-            data = await websocket.receive_text()
-            message_data = json.loads(data)
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            
+            if frame.get("bytes") is not None:
+                # Live audio: 16-bit mono PCM between audio_start and audio_stop
+                if live_audio and not live_audio.feed(frame["bytes"]):
+                    live_audio.cancel()
+                    live_audio = None
+                    await websocket.send_json({
+                        "type": "system",
+                        "content": "Recording is too long. Please try a shorter response."
+                    })
+                continue
+            
+            message_data = json.loads(frame["text"])
             
             # Handle different message types
             msg_type = message_data.get("type", "message")
             
             if msg_type == "message":
-                user_message = message_data.get("content", "")
-                
-                # Process through orchestrator
-                response = await orchestrator.process_message(
-                    conversation_id=conversation_id,
-                    user_message=user_message
+                await handle_user_message(
+                    websocket, conversation_id, message_data.get("content", ""), message_data
                 )
-                
-                await websocket.send_json(response)
+            
+            elif msg_type == "audio_start":
+                # Segments are transcribed while the physician keeps talking
+                if live_audio:
+                    live_audio.cancel()
+                    live_audio = None
+                sample_rate = message_data.get("sample_rate", 16000)
+                if type(sample_rate) is not int or sample_rate not in SUPPORTED_SAMPLE_RATES:
+                    await websocket.send_json({
+                        "type": "system",
+                        "content": f"Unsupported sample rate; use one of {', '.join(map(str, SUPPORTED_SAMPLE_RATES))}",
+                        "status": "error"
+                    })
+                    continue
+                live_audio = LiveTranscriber(sample_rate=sample_rate)
+            
+            elif msg_type == "audio_stop":
+                if not live_audio:
+                    continue
+                transcriber, live_audio = live_audio, None
+                user_message = await transcriber.finish()
+                await websocket.send_json({"type": "transcript", "content": user_message})
+                if user_message:
+                    await handle_user_message(websocket, conversation_id, user_message, message_data)
             
             elif msg_type == "redo":
-                # Handle redo request
-                result = await orchestrator.redo_last_turn(conversation_id)
+                # Handle redo request: one turn back by default, or
+                # "steps" turns back, or back to right after turn "turn"
+                try:
+                    redo = RedoRequest(
+                        steps=message_data.get("steps", 1),
+                        turn=message_data.get("turn")
+                    )
+                except ValidationError as e:
+                    error = e.errors()[0]
+                    await websocket.send_json({
+                        "type": "system",
+                        "content": f"Invalid redo request: {error['loc'][0]} - {error['msg']}",
+                        "status": "error"
+                    })
+                    continue
+                result = await orchestrator.redo_last_turn(
+                    conversation_id,
+                    steps=redo.steps,
+                    turn=redo.turn
+                )
                 await websocket.send_json({
                     "type": "system",
-                    "content": result.get("message", "Conversation rewound"),
-                    "status": result.get("status")
+                    "content": result.get("message", result.get("error", "Conversation rewound")),
+                    "status": result.get("status"),
+                    "turn": result.get("turn")
                 })
             
             elif msg_type == "hint":
@@ -135,9 +173,78 @@ async def websocket_endpoint(websocket: WebSocket, conversation_id: int):
                 })
             
     except WebSocketDisconnect:
-        print(f"Client disconnected from conversation {conversation_id}")
+        logger.info(f"Client disconnected from conversation {conversation_id}")
+        if live_audio:
+            live_audio.cancel()
         await orchestrator.pause_conversation(conversation_id)
 
+async def handle_user_message(
+    websocket: WebSocket,
+    conversation_id: int,
+    user_message: str,
+    options: dict
+):
+    """Run one physician message through the orchestrator and reply"""
+    if options.get("stream"):
+        # Forward reply tokens as they are generated
+        if options.get("audio"):
+            await stream_with_audio(websocket, conversation_id, user_message)
+            return
+        async for frame in orchestrator.stream_message(
+            conversation_id=conversation_id,
+            user_message=user_message
+        ):
+            await websocket.send_json(frame)
+        return
+    
+    # Process through orchestrator
+    response = await orchestrator.process_message(
+        conversation_id=conversation_id,
+        user_message=user_message
+    )
+    
+    await websocket.send_json(response)
+
+async def stream_with_audio(websocket: WebSocket, conversation_id: int, user_message: str):
+    """
+    Streamed turn with pipelined speech: TTS starts on each approved
+    sentence while the rest of the reply is still being generated.
+    Audio for sentence n is sent as {"type": "audio", "seq": n}, then its
+    MP3 bytes as binary frames, then {"type": "audio_end", "seq": n}
+    """
+    speech = SpeechPipeline()
+    
+    async def send_audio():
+        current = None
+        async for seq, chunk in speech.chunks():
+            if seq != current:
+                if current is not None:
+                    await websocket.send_json({"type": "audio_end", "seq": current})
+                await websocket.send_json({"type": "audio", "seq": seq, "format": "mp3"})
+                current = seq
+            await websocket.send_bytes(chunk)
+        if current is not None:
+            await websocket.send_json({"type": "audio_end", "seq": current})
+    
+    sender = asyncio.create_task(send_audio())
+    try:
+        async for frame in orchestrator.stream_message(
+            conversation_id=conversation_id,
+            user_message=user_message
+        ):
+            if frame.get("type") == "delta":
+                speech.add_sentence(frame["content"], frame["emotional_state"])
+            elif frame.get("replaced"):
+                # The safety fallback is spoken in place of the rest of the reply
+                speech.add_sentence(frame["content"], frame["emotional_state"])
+            await websocket.send_json(frame)
+        speech.close()
+        await sender
+    except BaseException:
+        speech.cancel()
+        sender.cancel()
+        raise
+
 @router.post("/pause/{conversation_id}")
 async def pause_conversation(conversation_id: int):
     result = await orchestrator.pause_conversation(conversation_id)
@@ -148,12 +255,38 @@ async def resume_conversation(conversation_id: int):
     # TODO: Implement resume logic
     return {"status": "in_progress", "conversation_id": conversation_id}
 
+@router.post("/end/{conversation_id}")
+async def end_conversation(conversation_id: int):
+    result = await orchestrator.end_conversation(conversation_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    
+    # Feedback is generated in the background; poll GET /api/feedback/{id}
+    job = await request_feedback(conversation_id, result["turn_count"], result["history_version"])
+    return {"status": "completed", "conversation_id": conversation_id, "feedback": job["status"]}
+
 @router.post("/redo/{conversation_id}")
-async def redo_last_message(conversation_id: int):
-    result = await orchestrator.redo_last_turn(conversation_id)
+async def redo_last_message(
+    conversation_id: int,
+    steps: int = Query(1, ge=1),
+    turn: Optional[int] = Query(None, ge=0)
+):
+    result = await orchestrator.redo_last_turn(conversation_id, steps=steps, turn=turn)
     return result
 
-@router.get("/{conversation_id}/feedback")
-async def get_conversation_feedback(conversation_id: int):
-    feedback = await orchestrator.get_final_feedback(conversation_id)
-    return feedback
+@router.get("/checkpoints/{conversation_id}")
+async def list_checkpoints(conversation_id: int):
+    return {"turns": await orchestrator.list_checkpoints(conversation_id)}
+
+@router.get("/stats")
+async def get_pipeline_stats():
+    return {**orchestrator.get_stats(), "persistence": await conversation_flusher.get_stats()}
+
+@router.get(
+    "/{conversation_id}/feedback",
+    response_model=FeedbackResponse,
+    responses={202: {"description": "Feedback is still being generated"}}
+)
+async def get_conversation_feedback(conversation_id: int, db: AsyncSession = Depends(get_db)):
+    # Same as GET /api/feedback/{id}, kept for older clients
+    return await get_feedback(conversation_id, db)
@@ -1,6 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_db
+from app.services.feedback import feedback_jobs, feedback_job_status, load_feedback
+from app.services.jobs import PENDING_STATES
 
 router = APIRouter()
 
@@ -14,30 +19,32 @@ class FeedbackResponse(BaseModel):
     overall_score: float
     strengths: List[str]
     areas_for_improvement: List[str]
+    suggested_responses: Optional[List[dict]] = None
     summary: str
-    
+
     class Config:
         from_attributes = True
 
-@router.get("/{conversation_id}", response_model=FeedbackResponse)
-async def get_feedback(conversation_id: int):
-    # TODO: Generate real feedback using Coach agent
-    return {
-        "conversation_id": conversation_id,
-        "empathy_score": 8.5,
-        "clarity_score": 7.8,
-        "emotional_alignment_score": 8.2,
-        "ethical_appropriateness_score": 9.0,
-        "cultural_sensitivity_score": 8.5,
-        "overall_score": 8.4,
-        "strengths": [
-            "Good use of empathetic language",
-            "Gave family time to process information",
-            "Respected cultural considerations"
-        ],
-        "areas_for_improvement": [
-            "Could have provided more specific medical details",
-            "Might have checked for understanding more frequently"
-        ],
-        "summary": "You demonstrated strong empathy and cultural awareness. Consider being more explicit about treatment options and checking comprehension."
-    }
+@router.get("/stats")
+async def get_feedback_job_stats():
+    return await feedback_jobs.get_stats()
+
+@router.get(
+    "/{conversation_id}",
+    response_model=FeedbackResponse,
+    responses={202: {"description": "Feedback is still being generated"}}
+)
+async def get_feedback(conversation_id: int, db: AsyncSession = Depends(get_db)):
+    job = await feedback_job_status(conversation_id)
+    if job and job["status"] in PENDING_STATES:
+        return JSONResponse(
+            status_code=202,
+            content={"conversation_id": conversation_id, "status": job["status"]}
+        )
+
+    feedback = await load_feedback(db, conversation_id)
+    if feedback:
+        return feedback
+    if job and job["status"] == "failed":
+        raise HTTPException(status_code=500, detail="Feedback generation failed")
+    raise HTTPException(status_code=404, detail="No feedback for this conversation")
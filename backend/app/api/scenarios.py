@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import List, Optional
+from app.core.config import settings
+from app.services.scenarios import scenario_catalog
 
 router = APIRouter()
 
@@ -15,40 +17,33 @@ class ScenarioResponse(BaseModel):
     class Config:
         from_attributes = True
 
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak If-None-Match comparison against a list of tags or *"""
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+def cached_json(request: Request, body: bytes, etag: str) -> Response:
+    """Prebuilt JSON body with its ETag, or 304 if the client already has it"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={settings.SCENARIO_CACHE_MAX_AGE_SECONDS}"
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=List[ScenarioResponse])
-async def list_scenarios():
-    # Return sample scenarios
-    return [
-        {
-            "id": 1,
-            "title": "Terminal Cancer - Family in Denial",
-            "description": "75-year-old patient with stage 4 lung cancer. Adult daughter is in denial about prognosis.",
-            "difficulty": "intermediate",
-            "patient_age": 75,
-            "patient_condition": "Stage 4 lung cancer with weeks to live"
-        },
-        {
-            "id": 2,
-            "title": "Sudden Cardiac Arrest - Spouse in Shock",
-            "description": "58-year-old patient after cardiac arrest. Spouse is experiencing shock and anger.",
-            "difficulty": "beginner",
-            "patient_age": 58,
-            "patient_condition": "Post-cardiac arrest, severe brain damage"
-        },
-        {
-            "id": 3,
-            "title": "Advanced Dementia - Family Disagreement",
-            "description": "82-year-old with advanced dementia. Family members disagree on care approach.",
-            "difficulty": "advanced",
-            "patient_age": 82,
-            "patient_condition": "Advanced dementia, recurrent aspiration pneumonia"
-        }
-    ]
+async def list_scenarios(request: Request):
+    await scenario_catalog.refresh()
+    return cached_json(request, scenario_catalog.list_body, scenario_catalog.list_etag)
 
 @router.get("/{scenario_id}", response_model=ScenarioResponse)
-async def get_scenario(scenario_id: int):
-    scenarios = await list_scenarios()
-    for scenario in scenarios:
-        if scenario["id"] == scenario_id:
-            return scenario
-    raise HTTPException(status_code=404, detail="Scenario not found")
+async def get_scenario(scenario_id: int, request: Request):
+    await scenario_catalog.refresh()
+    detail = scenario_catalog.detail(scenario_id)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+    return cached_json(request, *detail)
@@ -1,16 +1,96 @@
-from sqlalchemy import create_engine
+from typing import Any, AsyncIterator, Dict
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 from app.core.config import settings
 
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class TimedQueue(AsyncAdaptedQueue):
+    """Pool queue that records how long checkouts block waiting for an idle connection"""
+
+    def get(self, block=True, timeout=None):
+        # Opening a new connection happens outside get, so it is not counted
+        start = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            waited = time.perf_counter() - start
+            TimedQueuePool.wait_count += 1
+            TimedQueuePool.wait_seconds_total += waited
+            TimedQueuePool.wait_seconds_max = max(TimedQueuePool.wait_seconds_max, waited)
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a free connection"""
+
+    _queue_class = TimedQueue
+
+    wait_count = 0
+    wait_seconds_total = 0.0
+    wait_seconds_max = 0.0
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL may name any Postgres scheme or driver; the engine uses asyncpg"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() not in ("postgres", "postgresql"):
+        return url
+    return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+# Size per process: each uvicorn worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+engine = create_async_engine(
+    async_database_url(settings.DATABASE_URL),
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+    pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+    connect_args={"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+)
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+pool_stats = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidated": 0}
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def _count_connect(dbapi_connection, connection_record):
+    pool_stats["connects"] += 1
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats["checkouts"] += 1
+
+@event.listens_for(engine.sync_engine.pool, "checkin")
+def _count_checkin(dbapi_connection, connection_record):
+    pool_stats["checkins"] += 1
+
+@event.listens_for(engine.sync_engine.pool, "invalidate")
+def _count_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats["invalidated"] += 1
+
+async def get_db() -> AsyncIterator[AsyncSession]:
+    """Per-request session for router dependencies"""
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Pool occupancy and checkout wait times, for sizing against the worker count"""
+    pool = engine.sync_engine.pool
+    waits = TimedQueuePool.wait_count
+    return {
+        **pool_stats,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_connections": settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+        "wait_avg_ms": round(TimedQueuePool.wait_seconds_total / waits * 1000, 3) if waits else 0.0,
+        "wait_max_ms": round(TimedQueuePool.wait_seconds_max * 1000, 3)
+    }
+
+async def close_database():
+    await engine.dispose()
@@ -0,0 +1,492 @@
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Set, Tuple
+from contextlib import AsyncExitStack
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import tempfile
+import time
+import weakref
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from openai import AsyncOpenAI
+from pydantic import BaseModel
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Replayed replies are streamed a word (with its trailing space) at a time
+STREAM_PIECE = re.compile(r"\S+\s*|\s+")
+
+class ReplayMissError(LookupError):
+    """Nothing recorded for a request in replay mode"""
+
+class Recordings:
+    """
+    Recorded model responses under MODEL_RECORDINGS_DIR
+    chat.jsonl and transcriptions.jsonl hold one response per line, keyed
+    by the hash of the request; speech audio is stored as speech/<key>.mp3.
+    Requests repeated while recording keep every response, and replay
+    hands them out in recorded order. The async methods read and write
+    the files in a thread; the sync ones are for the sync model paths
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self._entries: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._by_agent: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._served: Dict[str, int] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0, "substituted": 0}
+
+    async def append(self, kind: str, entry: Dict[str, Any]):
+        await self.load(kind)
+        await asyncio.to_thread(self._write, kind, entry)
+        self._index(kind, entry)
+        self.stats["recorded"] += 1
+
+    def append_sync(self, kind: str, entry: Dict[str, Any]):
+        self._load(kind)
+        self._write(kind, entry)
+        self._index(kind, entry)
+        self.stats["recorded"] += 1
+
+    async def load(self, kind: str):
+        """Read kind's recordings, if not done yet"""
+        if kind not in self._entries:
+            entries, by_agent = await asyncio.to_thread(self._read, kind)
+            # Another caller may have loaded it meanwhile
+            if kind not in self._entries:
+                self._entries[kind], self._by_agent[kind] = entries, by_agent
+
+    async def replay(self, kind: str, key: str, agent: str) -> Dict[str, Any]:
+        await self.load(kind)
+        return self.next(kind, key, agent)
+
+    def next(self, kind: str, key: str, agent: str) -> Dict[str, Any]:
+        """
+        Next recorded response for key. On a miss, MODEL_REPLAY_ON_MISS
+        "agent" substitutes any response recorded for the same agent,
+        "error" raises ReplayMissError
+        """
+        entries = self._load(kind)
+        candidates = entries.get(key)
+        if candidates is None:
+            self.stats["misses"] += 1
+            candidates = self._by_agent[kind].get(agent)
+            if settings.MODEL_REPLAY_ON_MISS != "agent" or not candidates:
+                raise ReplayMissError(f"No recorded {kind} response for {agent} ({key[:12]})")
+            self.stats["substituted"] += 1
+            key = f"agent:{agent}"
+
+        slot = f"{kind}:{key}"
+        served = self._served.get(slot, 0)
+        self._served[slot] = served + 1
+        self.stats["replayed"] += 1
+        return candidates[served % len(candidates)]
+
+    def speech_path(self, key: str) -> Path:
+        return self.directory / "speech" / f"{key}.mp3"
+
+    def _load(self, kind: str) -> Dict[str, List[Dict[str, Any]]]:
+        if kind not in self._entries:
+            self._entries[kind], self._by_agent[kind] = self._read(kind)
+        return self._entries[kind]
+
+    def _read(self, kind: str) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, List[Dict[str, Any]]]]:
+        """Entries of kind by request key and by agent"""
+        entries, by_agent = {}, {}
+        path = self.directory / f"{kind}.jsonl"
+        if path.exists():
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.setdefault(entry["key"], []).append(entry)
+                        by_agent.setdefault(entry.get("agent", ""), []).append(entry)
+        return entries, by_agent
+
+    def _write(self, kind: str, entry: Dict[str, Any]):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / f"{kind}.jsonl", "a") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+
+    def _index(self, kind: str, entry: Dict[str, Any]):
+        self._entries[kind].setdefault(entry["key"], []).append(entry)
+        self._by_agent[kind].setdefault(entry.get("agent", ""), []).append(entry)
+
+recordings = Recordings(settings.MODEL_RECORDINGS_DIR)
+
+class ReplayTiming:
+    """
+    Emulated latency for replayed responses
+    The wait before the first token follows MODEL_REPLAY_LATENCY: the
+    recorded value, a fixed MODEL_REPLAY_LATENCY_MS, a lognormal with that
+    median and MODEL_REPLAY_LATENCY_SIGMA, or none. Tokens then arrive at
+    MODEL_REPLAY_TOKENS_PER_SECOND (0 = all at once). Seeded, so two
+    replays of the same run wait the same
+    """
+
+    def __init__(self):
+        self._random = random.Random(settings.MODEL_REPLAY_SEED)
+
+    def first_token(self, recorded_ms: float) -> float:
+        mode = settings.MODEL_REPLAY_LATENCY
+        if mode == "recorded":
+            return recorded_ms / 1000
+        if mode == "fixed":
+            return settings.MODEL_REPLAY_LATENCY_MS / 1000
+        if mode == "lognormal":
+            return self._random.lognormvariate(
+                math.log(settings.MODEL_REPLAY_LATENCY_MS / 1000), settings.MODEL_REPLAY_LATENCY_SIGMA
+            )
+        return 0.0
+
+    def per_token(self) -> float:
+        rate = settings.MODEL_REPLAY_TOKENS_PER_SECOND
+        return 1 / rate if rate > 0 else 0.0
+
+replay_timing = ReplayTiming()
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def chat_request_key(llm: ChatOpenAI, messages: List[BaseMessage], kwargs: Dict[str, Any]) -> str:
+    response_format = kwargs.get("response_format")
+    if isinstance(response_format, type):
+        response_format = response_format.__name__
+    return request_key(
+        llm.model_name,
+        llm.temperature,
+        [(message.type, message.content) for message in messages],
+        response_format
+    )
+
+def dump_message(message: BaseMessage) -> Dict[str, Any]:
+    additional = dict(message.additional_kwargs)
+    parsed = additional.pop("parsed", None)
+    return {
+        "content": message.content,
+        "additional_kwargs": additional,
+        "parsed": parsed.model_dump() if isinstance(parsed, BaseModel) else parsed,
+        "usage_metadata": getattr(message, "usage_metadata", None),
+        "response_metadata": message.response_metadata
+    }
+
+def load_message(data: Dict[str, Any], response_format: Any = None) -> AIMessage:
+    additional = dict(data["additional_kwargs"])
+    if data.get("parsed") is not None:
+        parsed = data["parsed"]
+        if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+            parsed = response_format.model_validate(parsed)
+        additional["parsed"] = parsed
+    return AIMessage(
+        content=data["content"],
+        additional_kwargs=additional,
+        usage_metadata=data.get("usage_metadata"),
+        response_metadata=data.get("response_metadata") or {}
+    )
+
+class RecordingChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that also writes every response to the recordings"""
+
+    agent: str = ""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        recordings.append_sync("chat", self._entry(
+            messages, kwargs, result.generations[0].message, latency_ms, latency_ms
+        ))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.perf_counter()
+        result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        latency_ms = (time.perf_counter() - started) * 1000
+        await recordings.append("chat", self._entry(
+            messages, kwargs, result.generations[0].message, latency_ms, latency_ms
+        ))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        started = time.perf_counter()
+        first_token_ms = None
+        message = None
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            if first_token_ms is None and chunk.message.content:
+                first_token_ms = (time.perf_counter() - started) * 1000
+            message = chunk.message if message is None else message + chunk.message
+            yield chunk
+        if message is None:
+            return
+        latency_ms = (time.perf_counter() - started) * 1000
+        await recordings.append("chat", self._entry(
+            messages, kwargs, message,
+            first_token_ms if first_token_ms is not None else latency_ms, latency_ms
+        ))
+
+    def _entry(self, messages, kwargs, message: BaseMessage, ttft_ms: float, latency_ms: float) -> Dict[str, Any]:
+        return {
+            "key": chat_request_key(self, messages, kwargs),
+            "agent": self.agent,
+            "model": self.model_name,
+            "ttft_ms": ttft_ms,
+            "latency_ms": latency_ms,
+            "message": dump_message(message)
+        }
+
+class ReplayChatOpenAI(ChatOpenAI):
+    """ChatOpenAI served entirely from the recordings, no network"""
+
+    agent: str = ""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        entry, message = self._replayed(messages, kwargs)
+        time.sleep(self._wait(entry, message))
+        return self._result(message)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await recordings.load("chat")
+        entry, message = self._replayed(messages, kwargs)
+        await asyncio.sleep(self._wait(entry, message))
+        return self._result(message)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        entry, message = self._replayed(messages, kwargs)
+        pieces, piece_delay = self._pieces(message)
+        time.sleep(replay_timing.first_token(entry["ttft_ms"]))
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(piece_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(message)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await recordings.load("chat")
+        entry, message = self._replayed(messages, kwargs)
+        pieces, piece_delay = self._pieces(message)
+        await asyncio.sleep(replay_timing.first_token(entry["ttft_ms"]))
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(piece_delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield self._final_chunk(message)
+
+    def _replayed(self, messages, kwargs) -> Tuple[Dict[str, Any], AIMessage]:
+        entry = recordings.next("chat", chat_request_key(self, messages, kwargs), self.agent)
+        return entry, load_message(entry["message"], kwargs.get("response_format"))
+
+    def _wait(self, entry: Dict[str, Any], message: AIMessage) -> float:
+        """Emulated time for a whole (non-streamed) response"""
+        tokens = (message.usage_metadata or {}).get("output_tokens", 0)
+        return replay_timing.first_token(entry["ttft_ms"]) + tokens * replay_timing.per_token()
+
+    def _pieces(self, message: AIMessage) -> Tuple[List[str], float]:
+        """Stream pieces of a reply and the wait between them"""
+        pieces = STREAM_PIECE.findall(message.content) if isinstance(message.content, str) else []
+        tokens = (message.usage_metadata or {}).get("output_tokens", 0) or len(pieces)
+        # Spread the recorded token count over the pieces
+        return pieces, replay_timing.per_token() * tokens / max(len(pieces), 1)
+
+    def _final_chunk(self, message: AIMessage) -> ChatGenerationChunk:
+        return ChatGenerationChunk(message=AIMessageChunk(
+            content="",
+            usage_metadata=message.usage_metadata,
+            response_metadata=message.response_metadata
+        ))
+
+    def _result(self, message: AIMessage) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=message)],
+            llm_output={"token_usage": message.response_metadata.get("token_usage", {}), "model_name": self.model_name}
+        )
+
+CHAT_BACKENDS = {
+    "live": ChatOpenAI,
+    "record": RecordingChatOpenAI,
+    "replay": ReplayChatOpenAI
+}
+
+def chat_model(agent: str, **kwargs) -> ChatOpenAI:
+    """
+    Chat model for an agent on the configured MODEL_BACKEND
+    agent names the caller in the recordings; kwargs go to ChatOpenAI
+    """
+    backend = settings.MODEL_BACKEND
+    if backend != "live":
+        kwargs["agent"] = agent
+    # The client is still constructed in replay mode, it just never sends
+    api_key = settings.OPENAI_API_KEY or ("offline" if backend == "replay" else "")
+    return CHAT_BACKENDS[backend](openai_api_key=api_key, **kwargs)
+
+_cleanup_tasks: Set[asyncio.Task] = set()
+
+def close_when_dropped(stream: AsyncIterator[bytes], stack: AsyncExitStack):
+    """
+    Close stack in a background task once stream is garbage collected
+    A stream that was iterated closes the stack itself; this covers one
+    that never was, e.g. a StreamingResponse whose client went away
+    before the first chunk, which would otherwise hold the upstream
+    response open
+    """
+    loop = asyncio.get_running_loop()
+
+    def start_cleanup():
+        task = loop.create_task(stack.aclose())
+        _cleanup_tasks.add(task)
+        task.add_done_callback(_cleanup_tasks.discard)
+
+    def dropped():
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(start_cleanup)
+
+    weakref.finalize(stream, dropped)
+
+def file_digest(audio_file: BinaryIO) -> str:
+    """SHA-256 of an upload, read in pieces and rewound for the request"""
+    digest = hashlib.sha256()
+    while chunk := audio_file.read(1024 * 1024):
+        digest.update(chunk)
+    audio_file.seek(0)
+    return digest.hexdigest()
+
+class LiveAudio:
+    """Speech synthesis and transcription through the OpenAI API"""
+
+    def __init__(self):
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+
+    async def open_speech(self, text: str, voice: str, model: str, speed: float) -> AsyncIterator[bytes]:
+        """
+        Start synthesis and return an iterator over the MP3 bytes as they
+        arrive. Request errors (OpenAIError) are raised here, before any
+        audio has been handed out
+        """
+        stack = AsyncExitStack()
+        response = await stack.enter_async_context(
+            self.client.audio.speech.with_streaming_response.create(
+                model=model,
+                voice=voice,
+                input=text,
+                speed=speed,
+                response_format="mp3"
+            )
+        )
+
+        async def chunks():
+            async with stack:
+                async for chunk in response.iter_bytes(settings.TTS_CHUNK_SIZE):
+                    yield chunk
+
+        stream = chunks()
+        close_when_dropped(stream, stack)
+        return stream
+
+    async def transcribe(self, audio_file: BinaryIO, filename: str, model: str, language: str) -> str:
+        transcription = await self.client.audio.transcriptions.create(
+            model=model,
+            file=(filename, audio_file),
+            language=language
+        )
+        return transcription.text
+
+class RecordingAudio(LiveAudio):
+    """LiveAudio that also writes the audio and transcripts to the recordings"""
+
+    async def open_speech(self, text: str, voice: str, model: str, speed: float) -> AsyncIterator[bytes]:
+        started = time.perf_counter()
+        stream = await super().open_speech(text, voice, model, speed)
+        key = request_key(model, voice, speed, text)
+        path = recordings.speech_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        async def chunks():
+            first_byte_ms = None
+            fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".part")
+            complete = False
+            try:
+                with os.fdopen(fd, "wb") as tmp:
+                    async for chunk in stream:
+                        if first_byte_ms is None:
+                            first_byte_ms = (time.perf_counter() - started) * 1000
+                        await asyncio.to_thread(tmp.write, chunk)
+                        yield chunk
+                complete = True
+            finally:
+                if complete:
+                    os.replace(tmp_name, path)
+                    await recordings.append("speech", {
+                        "key": key, "agent": "tts", "ttft_ms": first_byte_ms or 0.0
+                    })
+                else:
+                    os.unlink(tmp_name)
+
+        return chunks()
+
+    async def transcribe(self, audio_file: BinaryIO, filename: str, model: str, language: str) -> str:
+        # Keyed by content; hashed off the loop without holding the upload in memory
+        digest = await asyncio.to_thread(file_digest, audio_file)
+        started = time.perf_counter()
+        text = await super().transcribe(audio_file, filename, model, language)
+        await recordings.append("transcriptions", {
+            "key": request_key(model, language, digest),
+            "agent": "stt",
+            "ttft_ms": (time.perf_counter() - started) * 1000,
+            "text": text
+        })
+        return text
+
+class ReplayAudio:
+    """Recorded audio and transcripts, no network"""
+
+    async def open_speech(self, text: str, voice: str, model: str, speed: float) -> AsyncIterator[bytes]:
+        entry = await recordings.replay("speech", request_key(model, voice, speed, text), "tts")
+        path = recordings.speech_path(entry["key"])
+        await asyncio.sleep(replay_timing.first_token(entry["ttft_ms"]))
+        rate = settings.MODEL_REPLAY_AUDIO_BYTES_PER_SECOND
+
+        async def chunks():
+            with open(path, "rb") as f:
+                while chunk := await asyncio.to_thread(f.read, settings.TTS_CHUNK_SIZE):
+                    yield chunk
+                    if rate > 0:
+                        await asyncio.sleep(len(chunk) / rate)
+
+        return chunks()
+
+    async def transcribe(self, audio_file: BinaryIO, filename: str, model: str, language: str) -> str:
+        digest = await asyncio.to_thread(file_digest, audio_file)
+        entry = await recordings.replay("transcriptions", request_key(model, language, digest), "stt")
+        await asyncio.sleep(replay_timing.first_token(entry["ttft_ms"]))
+        return entry["text"]
+
+AUDIO_BACKENDS = {
+    "live": LiveAudio,
+    "record": RecordingAudio,
+    "replay": ReplayAudio
+}
+
+_audio = None
+
+def audio_provider():
+    """Speech/transcription backend for MODEL_BACKEND, created on first use"""
+    global _audio
+    if _audio is None:
+        _audio = AUDIO_BACKENDS[settings.MODEL_BACKEND]()
+    return _audio
+
+def get_provider_stats() -> Dict[str, Any]:
+    return {"backend": settings.MODEL_BACKEND, **recordings.stats}
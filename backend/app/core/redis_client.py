@@ -0,0 +1,21 @@
+import redis.asyncio as redis
+from app.core.config import settings
+
+# One pool per process, shared by every component that talks to Redis.
+# When every connection is checked out (job workers blocked in BLMOVE,
+# background coach and summary tasks, cache lookups, speculation
+# branches), callers wait up to REDIS_POOL_TIMEOUT_SECONDS for one to be
+# released instead of failing with "Too many connections"
+pool = redis.BlockingConnectionPool.from_url(
+    settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT_SECONDS,
+    decode_responses=True
+)
+
+def get_redis() -> redis.Redis:
+    """Redis client backed by the shared connection pool"""
+    return redis.Redis(connection_pool=pool)
+
+async def close_redis():
+    await pool.disconnect()
@@ -0,0 +1,122 @@
+from typing import Any, Dict, Iterator, Optional, Set
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import logging
+import time
+from prometheus_client import Counter, Histogram
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "vital_talk_stage_seconds",
+    "Time spent per stage of an operation; stage=total is the whole operation",
+    ["operation", "stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+)
+
+STAGE_TOKENS = Histogram(
+    "vital_talk_stage_tokens",
+    "LLM tokens used per stage of an operation",
+    ["operation", "stage", "kind"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+
+LLM_TOKENS = Counter(
+    "vital_talk_llm_tokens",
+    "LLM tokens by agent and model",
+    ["agent", "model", "kind"]
+)
+
+class Span:
+    """One timed stage, with the LLM usage of the calls made inside it"""
+
+    def __init__(self, operation: str, stage: str, parent: Optional["Span"]):
+        self.operation = operation
+        self.stage = stage
+        self.parent = parent
+        self.started = time.perf_counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.models: Set[str] = set()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_tracer = None
+
+def get_tracer():
+    """
+    OpenTelemetry tracer when OTEL_ENABLED, exporting over OTLP (endpoint
+    from the standard OTEL_EXPORTER_OTLP_* variables). The packages are
+    optional; without them spans only feed the Prometheus histograms
+    """
+    global _tracer
+    if _tracer is None:
+        _tracer = False
+        if settings.OTEL_ENABLED:
+            try:
+                from opentelemetry import trace
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                from opentelemetry.sdk.resources import Resource
+                from opentelemetry.sdk.trace import TracerProvider
+                from opentelemetry.sdk.trace.export import BatchSpanProcessor
+                provider = TracerProvider(
+                    resource=Resource.create({"service.name": settings.OTEL_SERVICE_NAME})
+                )
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+                trace.set_tracer_provider(provider)
+                _tracer = trace.get_tracer("vital_talk")
+            except ImportError as e:
+                logger.warning(f"OpenTelemetry unavailable, spans go to /metrics only: {str(e)}")
+    return _tracer or None
+
+@contextmanager
+def trace(operation: str, stage: str = "total", detached: bool = False) -> Iterator[Span]:
+    """
+    Time a stage of an operation (or, with stage "total", the operation)
+    LLM calls made inside count towards this span and every enclosing one.
+    detached starts a new root, for background work spawned by a traced
+    operation that should not count towards it
+    """
+    span = Span(operation, stage, None if detached else _current_span.get())
+    token = _current_span.set(span)
+    tracer = get_tracer()
+    otel = tracer.start_as_current_span(f"{operation}.{stage}") if tracer else nullcontext()
+    with otel as otel_span:
+        try:
+            yield span
+        finally:
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # An async generator closed from another context
+                pass
+            duration = time.perf_counter() - span.started
+            STAGE_SECONDS.labels(operation, stage).observe(duration)
+            if span.prompt_tokens or span.completion_tokens:
+                STAGE_TOKENS.labels(operation, stage, "prompt").observe(span.prompt_tokens)
+                STAGE_TOKENS.labels(operation, stage, "completion").observe(span.completion_tokens)
+            if otel_span is not None:
+                otel_span.set_attribute("llm.prompt_tokens", span.prompt_tokens)
+                otel_span.set_attribute("llm.completion_tokens", span.completion_tokens)
+                otel_span.set_attribute("llm.models", sorted(span.models))
+            logger.debug(
+                f"{operation}.{stage}: {duration * 1000:.1f} ms, "
+                f"{span.prompt_tokens}+{span.completion_tokens} tokens {sorted(span.models)}"
+            )
+
+def record_llm_usage(agent: str, model: str, usage: Dict[str, Any]):
+    """Count one LLM call's tokens, globally and in the open spans"""
+    LLM_TOKENS.labels(agent, model, "prompt").inc(usage["prompt_tokens"])
+    LLM_TOKENS.labels(agent, model, "completion").inc(usage["completion_tokens"])
+    span = _current_span.get()
+    while span is not None:
+        span.prompt_tokens += usage["prompt_tokens"]
+        span.completion_tokens += usage["completion_tokens"]
+        span.models.add(model)
+        span = span.parent
+
+def stage(name: str):
+    """Span for a stage of whatever operation is being traced"""
+    parent = _current_span.get()
+    return trace(parent.operation if parent else "untraced", name)
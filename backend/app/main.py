@@ -1,7 +1,15 @@
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.agents.context import load_tokenizer
 from app.api import conversations, scenarios, users, feedback, audio
 from app.core.config import settings
+from app.core.database import close_database, get_pool_stats
+from app.core.redis_client import close_redis
+from app.services.feedback import feedback_jobs, generate_feedback
+from app.services.persistence import conversation_flusher
+from app.services.scenarios import scenario_catalog
 
 app = FastAPI(
     title="Vital Talk API",
@@ -18,6 +26,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def configure_event_loop():
+    # In debug mode asyncio warns about any step that blocks the loop,
+    # which is how synchronous LLM/Redis calls inside handlers show up
+    if settings.ASYNCIO_DEBUG:
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = settings.SLOW_CALLBACK_MS / 1000
+
+@app.on_event("startup")
+async def load_scenarios():
+    await scenario_catalog.load()
+
+@app.on_event("startup")
+async def load_context_tokenizer():
+    # Off the loop: tiktoken may download its tables the first time
+    await load_tokenizer()
+
+@app.on_event("startup")
+async def start_job_workers():
+    await feedback_jobs.start(
+        lambda payload: generate_feedback(conversations.orchestrator, payload),
+        concurrency=settings.JOB_WORKERS
+    )
+
+@app.on_event("startup")
+async def start_conversation_flusher():
+    if settings.PERSIST_ENABLED:
+        conversation_flusher.start(conversations.orchestrator)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await feedback_jobs.stop()
+    await conversation_flusher.stop()
+    await close_redis()
+    await close_database()
+
 # Include routers
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(scenarios.router, prefix="/api/scenarios", tags=["scenarios"])
@@ -36,3 +81,12 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/health/db")
+async def database_pool_stats():
+    return get_pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus exposition: per-stage timing and token histograms"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
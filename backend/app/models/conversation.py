@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, DateTime, Enum, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -36,13 +36,18 @@ class MessageRole(str, enum.Enum):
 
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
+    __table_args__ = (
+        # One row per history position; the write-behind flusher relies on it
+        UniqueConstraint("conversation_id", "position"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     conversation_id = Column(Integer, ForeignKey("conversations.id"), nullable=False)
+    position = Column(Integer, nullable=False)  # Index in the conversation history
     role = Column(Enum(MessageRole), nullable=False)
     content = Column(Text, nullable=False)
     emotional_state = Column(String)  # Emotional state when message was sent
-    metadata = Column(JSON)  # Additional context
+    message_metadata = Column("metadata", JSON)  # Additional context ("metadata" is reserved by SQLAlchemy)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
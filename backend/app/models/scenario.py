@@ -32,6 +32,9 @@ class Scenario(Base):
     # Conversation goals
     conversation_goals = Column(JSON)  # List of goals
     
+    # Agent pipeline ("staged" or "fast"), PIPELINE_MODE when unset
+    pipeline_mode = Column(String)
+    
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
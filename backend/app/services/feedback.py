@@ -0,0 +1,87 @@
+from typing import Any, Dict, Optional
+import json
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import get_redis
+from app.models.feedback import Feedback
+from app.services.jobs import JobQueue
+from app.services.persistence import store_conversation
+
+# Columns of the Feedback model filled from the coach's JSON
+FEEDBACK_FIELDS = (
+    "empathy_score",
+    "clarity_score",
+    "emotional_alignment_score",
+    "ethical_appropriateness_score",
+    "cultural_sensitivity_score",
+    "overall_score",
+    "strengths",
+    "areas_for_improvement",
+    "suggested_responses",
+    "summary"
+)
+
+feedback_jobs = JobQueue("feedback", max_attempts=settings.JOB_MAX_ATTEMPTS)
+
+async def request_feedback(
+    conversation_id: int,
+    turn_count: int,
+    history_version: int
+) -> Dict[str, Any]:
+    """
+    Queue feedback generation for a conversation as it stands
+    The job id covers the history version and turn count, so ending twice
+    is a no-op while a conversation continued, rewound or restarted after
+    ending gets fresh feedback, even when it is back at the same turn count
+    """
+    job_id = f"{conversation_id}:{history_version}:{turn_count}"
+    job = await feedback_jobs.enqueue(
+        job_id, {"conversation_id": conversation_id, "job_id": job_id}
+    )
+    await get_redis().set(
+        f"feedback:{conversation_id}:job", job_id, ex=settings.JOB_RESULT_TTL_SECONDS
+    )
+    return job
+
+async def feedback_job_status(conversation_id: int) -> Optional[Dict[str, Any]]:
+    """Latest feedback job of the conversation, None if there is none"""
+    job_id = await get_redis().get(f"feedback:{conversation_id}:job")
+    return await feedback_jobs.status(job_id) if job_id else None
+
+async def generate_feedback(orchestrator, payload: Dict[str, Any]):
+    """Job handler: run the coach and store the result"""
+    conversation_id = payload["conversation_id"]
+    
+    # A retry reuses the coach's feedback if only storing it failed
+    draft_key = f"feedback:{payload['job_id']}:draft"
+    draft = await get_redis().get(draft_key)
+    if draft:
+        feedback = json.loads(draft)
+    else:
+        feedback = await orchestrator.get_final_feedback(conversation_id)
+        if "error" in feedback:
+            raise ValueError(feedback["error"])
+        await get_redis().set(draft_key, json.dumps(feedback), ex=settings.JOB_RESULT_TTL_SECONDS)
+    
+    # The feedback row references the conversation row, which the
+    # write-behind flusher may not have written yet
+    await store_conversation(orchestrator, conversation_id)
+    async with SessionLocal() as db:
+        await save_feedback(db, conversation_id, feedback)
+    await get_redis().delete(draft_key)
+
+async def save_feedback(db: AsyncSession, conversation_id: int, feedback: Dict[str, Any]):
+    """Insert or replace the conversation's feedback row"""
+    row = await load_feedback(db, conversation_id)
+    if row is None:
+        row = Feedback(conversation_id=conversation_id)
+        db.add(row)
+    for field in FEEDBACK_FIELDS:
+        setattr(row, field, feedback.get(field))
+    await db.commit()
+
+async def load_feedback(db: AsyncSession, conversation_id: int) -> Optional[Feedback]:
+    result = await db.execute(select(Feedback).where(Feedback.conversation_id == conversation_id))
+    return result.scalar_one_or_none()
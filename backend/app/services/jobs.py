@@ -0,0 +1,220 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Job states stored in the job hash; the first three mean "not finished yet"
+PENDING_STATES = ("queued", "running", "retrying")
+
+class JobQueue:
+    """
+    Redis-backed job queue with a local pool of asyncio workers
+    Job ids are idempotency keys; running jobs are held under a per-process lease
+    """
+
+    def __init__(self, name: str, redis_client=None, max_attempts: int = 3):
+        self.name = name
+        self.redis_client = redis_client or get_redis()
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._workers: List[asyncio.Task] = []
+        self.stats = {"completed": 0, "retried": 0, "failed": 0, "reclaimed": 0}
+
+    async def enqueue(self, job_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Queue a job unless one with this id already exists; returns its status"""
+        job_key = self._key("job", job_id)
+        if not await self.redis_client.hsetnx(job_key, "status", "queued"):
+            job = await self.status(job_id)
+            if job and job["status"] != "failed":
+                return job
+            # A job that gave up may be asked for again
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key, mapping={
+                "status": "queued",
+                "payload": json.dumps(payload),
+                "attempts": 0,
+                "enqueued_at": time.time()
+            })
+            pipe.expire(job_key, settings.JOB_RESULT_TTL_SECONDS)
+            pipe.lpush(self._key("queue"), job_id)
+            await pipe.execute()
+        return {"id": job_id, "status": "queued", "attempts": 0}
+
+    async def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.redis_client.hgetall(self._key("job", job_id))
+        if not job:
+            return None
+        return {
+            "id": job_id,
+            "status": job["status"],
+            "attempts": int(job.get("attempts", 0)),
+            "error": job.get("error")
+        }
+
+    async def start(self, handler: Callable[[Dict[str, Any]], Awaitable[None]], concurrency: int):
+        """Take a lease, recover jobs of dead processes and start the worker pool"""
+        await self._renew_lease()
+        await self._reclaim_expired()
+        self._workers = [
+            asyncio.create_task(self._work(handler)) for _ in range(concurrency)
+        ]
+        self._workers.append(asyncio.create_task(self._promote_retries()))
+        self._workers.append(asyncio.create_task(self._keep_lease()))
+
+    async def stop(self):
+        """Stop the workers and hand their unfinished jobs back to the queue"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        try:
+            await self._requeue(self.worker_id)
+        except RedisError as e:
+            # Recovered by another process once the lease expires
+            logger.error(f"Job queue {self.name} could not requeue its jobs: {str(e)}")
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and outcome counters"""
+        worker_ids = await self.redis_client.smembers(self._key("workers"))
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.llen(self._key("queue"))
+            pipe.zcard(self._key("retries"))
+            for worker_id in worker_ids:
+                pipe.llen(self._key("processing", worker_id))
+            depth, retrying, *running = await pipe.execute()
+        return {
+            **self.stats,
+            "queue_depth": depth,
+            "running": sum(running),
+            "retrying": retrying,
+            "processes": len(worker_ids),
+            "workers": max(len(self._workers) - 2, 0)
+        }
+
+    async def _work(self, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+        while True:
+            try:
+                job_id = await self.redis_client.blmove(
+                    self._key("queue"), self._processing_key, 1, "RIGHT", "LEFT"
+                )
+                if job_id:
+                    await self._run(job_id, handler)
+            except asyncio.CancelledError:
+                raise
+            except RedisError as e:
+                logger.error(f"Job queue {self.name} lost Redis: {str(e)}")
+                await asyncio.sleep(1)
+
+    async def _run(self, job_id: str, handler: Callable[[Dict[str, Any]], Awaitable[None]]):
+        job_key = self._key("job", job_id)
+        payload = await self.redis_client.hget(job_key, "payload")
+        attempts = await self.redis_client.hincrby(job_key, "attempts", 1)
+        await self.redis_client.hset(job_key, "status", "running")
+
+        try:
+            await asyncio.wait_for(handler(json.loads(payload)), settings.JOB_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            # Left in the processing list; requeued by stop() or, if this
+            # process dies, by whichever process sees its lease expire
+            raise
+        except Exception as e:
+            retry = attempts < self.max_attempts
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hset(job_key, mapping={
+                    "status": "retrying" if retry else "failed",
+                    "error": str(e) or type(e).__name__
+                })
+                if retry:
+                    delay = settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+                    pipe.zadd(self._key("retries"), {job_id: time.time() + delay})
+                pipe.lrem(self._processing_key, 1, job_id)
+                await pipe.execute()
+            self.stats["retried" if retry else "failed"] += 1
+            logger.error(f"Job {self.name}:{job_id} attempt {attempts} failed: {str(e)}")
+            return
+
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.hset(job_key, mapping={"status": "done", "finished_at": time.time()})
+            pipe.hdel(job_key, "error")
+            pipe.lrem(self._processing_key, 1, job_id)
+            await pipe.execute()
+        self.stats["completed"] += 1
+
+    async def _promote_retries(self):
+        """Move retries whose backoff has elapsed back onto the queue"""
+        retries_key = self._key("retries")
+        while True:
+            try:
+                for job_id in await self.redis_client.zrangebyscore(retries_key, 0, time.time()):
+                    # zrem decides which process gets to requeue it
+                    if await self.redis_client.zrem(retries_key, job_id):
+                        await self.redis_client.lpush(self._key("queue"), job_id)
+            except RedisError as e:
+                logger.error(f"Job queue {self.name} lost Redis: {str(e)}")
+            await asyncio.sleep(1)
+
+    async def _keep_lease(self):
+        """Renew this process's lease and recover the jobs of expired ones"""
+        while True:
+            await asyncio.sleep(settings.JOB_LEASE_SECONDS / 3)
+            try:
+                await self._renew_lease()
+                await self._reclaim_expired()
+            except RedisError as e:
+                logger.error(f"Job queue {self.name} lost Redis: {str(e)}")
+
+    async def _renew_lease(self):
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.set(self._key("lease", self.worker_id), time.time(), ex=settings.JOB_LEASE_SECONDS)
+            pipe.sadd(self._key("workers"), self.worker_id)
+            await pipe.execute()
+
+    async def _reclaim_expired(self):
+        """Requeue the processing lists of processes whose lease has expired"""
+        worker_ids = [
+            worker_id for worker_id in await self.redis_client.smembers(self._key("workers"))
+            if worker_id != self.worker_id
+        ]
+        if not worker_ids:
+            return
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                pipe.exists(self._key("lease", worker_id))
+            alive = await pipe.execute()
+        for worker_id, lease in zip(worker_ids, alive):
+            # srem decides which process gets to requeue them
+            if not lease and await self.redis_client.srem(self._key("workers"), worker_id):
+                reclaimed = await self._requeue(worker_id)
+                self.stats["reclaimed"] += reclaimed
+                if reclaimed:
+                    logger.warning(f"Job queue {self.name} requeued {reclaimed} jobs of expired worker {worker_id}")
+
+    async def _requeue(self, worker_id: str) -> int:
+        """Put a process's processing list back on the queue; returns how many jobs"""
+        processing_key = self._key("processing", worker_id)
+        moved = 0
+        while await self.redis_client.lmove(processing_key, self._key("queue"), "RIGHT", "RIGHT"):
+            moved += 1
+        if worker_id == self.worker_id:
+            async with self.redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(self._key("lease", worker_id))
+                pipe.srem(self._key("workers"), worker_id)
+                await pipe.execute()
+        return moved
+
+    @property
+    def _processing_key(self) -> str:
+        return self._key("processing", self.worker_id)
+
+    def _key(self, *parts: str) -> str:
+        return ":".join(("jobs", self.name) + parts)
@@ -0,0 +1,139 @@
+from typing import List, Optional
+from array import array
+import asyncio
+import io
+import logging
+import math
+import sys
+import wave
+from app.core.config import settings
+from app.services.speech import transcribe
+
+logger = logging.getLogger(__name__)
+
+# Sample rates a client may announce in audio_start
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 24000, 48000)
+
+class SilenceSegmenter:
+    """
+    Splits a live 16-bit mono PCM stream into segments at pauses
+    A segment is cut once it is at least STT_MIN_SEGMENT_MS long and
+    followed by STT_SILENCE_MS of frames below STT_SILENCE_RMS, or when it
+    reaches STT_MAX_SEGMENT_MS
+    """
+
+    FRAME_MS = 30
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.frame_bytes = sample_rate * self.FRAME_MS // 1000 * 2
+        if self.frame_bytes <= 0:
+            # feed() would never get past an empty frame
+            raise ValueError(f"Sample rate {sample_rate} is too low to frame")
+        self._pending = b""  # bytes not yet forming a whole frame
+        self._frames: List[bytes] = []
+        self._voiced = False
+        self._silent_run = 0
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """Add audio; returns the segments completed by it"""
+        self._pending += data
+        segments = []
+        while len(self._pending) >= self.frame_bytes:
+            frame = self._pending[:self.frame_bytes]
+            self._pending = self._pending[self.frame_bytes:]
+            segment = self._add_frame(frame)
+            if segment:
+                segments.append(segment)
+        return segments
+
+    def flush(self) -> Optional[bytes]:
+        """Whatever is left once the speaker has stopped"""
+        self._frames.append(self._pending[:len(self._pending) // 2 * 2])
+        self._pending = b""
+        return self._cut()
+
+    def _add_frame(self, frame: bytes) -> Optional[bytes]:
+        self._frames.append(frame)
+        if self._rms(frame) >= settings.STT_SILENCE_RMS:
+            self._voiced = True
+            self._silent_run = 0
+        else:
+            self._silent_run += 1
+
+        length_ms = len(self._frames) * self.FRAME_MS
+        silence_ms = self._silent_run * self.FRAME_MS
+        if length_ms >= settings.STT_MAX_SEGMENT_MS or (
+            length_ms >= settings.STT_MIN_SEGMENT_MS and silence_ms >= settings.STT_SILENCE_MS
+        ):
+            return self._cut()
+        return None
+
+    def _cut(self) -> Optional[bytes]:
+        frames, voiced = self._frames, self._voiced
+        self._frames = []
+        self._voiced = False
+        self._silent_run = 0
+        # Pure silence is dropped; Whisper tends to hallucinate on it
+        return b"".join(frames) if voiced else None
+
+    def _rms(self, frame: bytes) -> float:
+        samples = array("h", frame)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return math.sqrt(sum(s * s for s in samples) / len(samples)) if samples else 0.0
+
+class LiveTranscriber:
+    """
+    Transcribes an utterance while it is still being spoken
+    Each segment cut by the SilenceSegmenter is sent to Whisper right
+    away, concurrently with the rest of the recording; finish() stitches
+    the segment transcripts back together in order
+    """
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.segmenter = SilenceSegmenter(sample_rate)
+        self.max_bytes = settings.STT_MAX_DURATION_SECONDS * sample_rate * 2
+        self.received = 0
+        self._tasks: List[asyncio.Task] = []
+        self._limit = asyncio.Semaphore(settings.STT_LIVE_CONCURRENCY)
+
+    def feed(self, data: bytes) -> bool:
+        """Add audio; False once the utterance exceeds the duration limit"""
+        self.received += len(data)
+        if self.received > self.max_bytes:
+            return False
+        for segment in self.segmenter.feed(data):
+            self._start(segment)
+        return True
+
+    async def finish(self) -> str:
+        tail = self.segmenter.flush()
+        if tail:
+            self._start(tail)
+        texts = await asyncio.gather(*self._tasks)
+        return " ".join(text.strip() for text in texts if text and text.strip())
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _start(self, segment: bytes):
+        self._tasks.append(asyncio.create_task(self._transcribe(segment)))
+
+    async def _transcribe(self, segment: bytes) -> str:
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(segment)
+        buffer.seek(0)
+        async with self._limit:
+            try:
+                return await transcribe(buffer, "segment.wav")
+            except Exception as e:
+                # A lost segment leaves a gap rather than failing the turn
+                logger.error(f"Live transcription failed for segment: {str(e)}")
+                return ""
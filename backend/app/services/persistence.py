@@ -0,0 +1,212 @@
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+from sqlalchemy import and_, case, delete, func, insert, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.conversation import (
+    Conversation,
+    ConversationMessage,
+    ConversationStatus,
+    MessageRole
+)
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by one conversation's data rather than by the database;
+# only these are held against the conversation
+ROW_ERRORS = (IntegrityError, DataError, ValueError, KeyError)
+
+class ConversationFlusher:
+    """
+    Write-behind persistence of conversations to Postgres
+    Turns are committed to Redis only; the orchestrator queues every
+    conversation it changes and this flusher drains the queue in the
+    background. Each batch is written in one transaction with multi-row
+    inserts. Message rows are keyed by history position and everything
+    from the last persisted position on is rewritten, so a flush that was
+    interrupted by a restart is simply done again without duplicates.
+    If the batch fails on a bad row, each conversation is written again
+    in its own savepoint; the ones that still fail are retried later with
+    backoff and dead-lettered after PERSIST_MAX_ATTEMPTS, so they cannot
+    hold up the rest of the queue
+    """
+
+    def __init__(self, batch_size: int, interval: float):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.orchestrator = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "batches": 0,
+            "conversations": 0,
+            "messages": 0,
+            "failed_batches": 0,
+            "failed_conversations": 0,
+            "dead_lettered": 0
+        }
+
+    def start(self, orchestrator):
+        self.orchestrator = orchestrator
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background loop and write what is still queued"""
+        if not self._task:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            while await self.flush() == self.batch_size:
+                pass
+        except Exception as e:
+            logger.error(f"Final conversation flush failed: {str(e)}")
+
+    async def flush(self) -> int:
+        """Write one batch of queued conversations; returns how many were taken"""
+        conversation_ids = await self.orchestrator.pending_persistence(self.batch_size)
+        if not conversation_ids:
+            return 0
+
+        exports = await self.orchestrator.export_unpersisted(conversation_ids)
+        # Conversations without an owner or scenario cannot be stored; they just leave the queue
+        writable = [
+            export for export in exports
+            if export["meta"] and "user_id" in export["meta"] and "scenario_id" in export["meta"]
+        ]
+        failed = await write_exports(writable) if writable else {}
+        for export in exports:
+            error = failed.get(export["conversation_id"])
+            if error is None:
+                await self.orchestrator.mark_persisted(export)
+                continue
+            self.stats["failed_conversations"] += 1
+            if await self.orchestrator.persistence_failed(
+                export["conversation_id"],
+                error,
+                max_attempts=settings.PERSIST_MAX_ATTEMPTS,
+                backoff=settings.PERSIST_RETRY_BACKOFF_SECONDS
+            ):
+                self.stats["dead_lettered"] += 1
+            logger.error(f"Conversation {export['conversation_id']} could not be stored: {error}")
+
+        stored = [export for export in writable if export["conversation_id"] not in failed]
+        self.stats["batches"] += 1
+        self.stats["conversations"] += len(stored)
+        self.stats["messages"] += sum(len(export["messages"]) for export in stored)
+        return len(conversation_ids)
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Flush counters, queued conversations and flush lag"""
+        backlog = await self.orchestrator.persistence_backlog() if self.orchestrator else {}
+        return {**self.stats, **backlog}
+
+    async def _run(self):
+        while True:
+            try:
+                # Keep going without a pause while there is a backlog
+                if await self.flush() == self.batch_size:
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed_batches"] += 1
+                logger.error(f"Conversation flush failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+async def store_conversation(orchestrator, conversation_id: int):
+    """Write one conversation now instead of waiting for the flusher"""
+    export, = await orchestrator.export_unpersisted([conversation_id])
+    meta = export["meta"]
+    if not meta:
+        raise ValueError("Conversation not found")
+    if "user_id" not in meta or "scenario_id" not in meta:
+        raise ValueError("Conversation has no owner or scenario")
+    failed = await write_exports([export])
+    if conversation_id in failed:
+        raise ValueError(failed[conversation_id])
+    await orchestrator.mark_persisted(export)
+
+async def write_exports(exports: List[Dict[str, Any]]) -> Dict[int, str]:
+    """
+    Store exports in one transaction, the whole batch in one go when it
+    goes through, otherwise each conversation in its own savepoint.
+    Returns the error of each conversation that could not be stored;
+    errors that are not about one conversation's rows are raised
+    """
+    failed = {}
+    async with SessionLocal() as db:
+        try:
+            async with db.begin_nested():
+                await write_batch(db, exports)
+        except ROW_ERRORS:
+            for export in exports:
+                try:
+                    async with db.begin_nested():
+                        await write_batch(db, [export])
+                except ROW_ERRORS as e:
+                    failed[export["conversation_id"]] = str(e) or type(e).__name__
+        await db.commit()
+    return failed
+
+async def write_batch(db: AsyncSession, exports: List[Dict[str, Any]]):
+    """
+    Write a batch of exports in the session's transaction: upsert the
+    conversation rows, drop stored messages at or after each export's
+    start position and insert the exported messages
+    """
+    conversations = []
+    messages = []
+    for export in exports:
+        meta = export["meta"]
+        status = ConversationStatus(meta.get("status", "in_progress"))
+        conversations.append({
+            "id": export["conversation_id"],
+            "user_id": int(meta["user_id"]),
+            "scenario_id": int(meta["scenario_id"]),
+            "status": status,
+            "current_emotional_state": meta["emotional_state"],
+            "completed_at": func.now() if status == ConversationStatus.COMPLETED else None
+        })
+        for position, message in enumerate(export["messages"], start=export["start"]):
+            messages.append({
+                "conversation_id": export["conversation_id"],
+                "position": position,
+                "role": MessageRole(message["role"]),
+                "content": message["content"],
+                "emotional_state": message.get("emotional_state")
+            })
+
+    upsert = pg_insert(Conversation).values(conversations)
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[Conversation.id],
+        set_={
+            "status": upsert.excluded.status,
+            "current_emotional_state": upsert.excluded.current_emotional_state,
+            # Keep the first completion time unless the conversation was restarted
+            "completed_at": case(
+                (upsert.excluded.completed_at.is_(None), None),
+                else_=func.coalesce(Conversation.completed_at, upsert.excluded.completed_at)
+            )
+        }
+    )
+
+    await db.execute(upsert)
+    await db.execute(delete(ConversationMessage).where(or_(*[
+        and_(
+            ConversationMessage.conversation_id == export["conversation_id"],
+            ConversationMessage.position >= export["start"]
+        )
+        for export in exports
+    ])))
+    if messages:
+        await db.execute(insert(ConversationMessage), messages)
+
+conversation_flusher = ConversationFlusher(
+    batch_size=settings.PERSIST_BATCH_SIZE,
+    interval=settings.PERSIST_FLUSH_INTERVAL_SECONDS
+)
@@ -0,0 +1,157 @@
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import time
+from sqlalchemy import select
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.redis_client import get_redis
+from app.models.scenario import Scenario
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever scenarios change; every process reloads when it moves
+VERSION_KEY = "scenarios:version"
+
+# Fields the scenario list and detail endpoints expose
+PUBLIC_FIELDS = ("id", "title", "description", "difficulty", "patient_age", "patient_condition")
+
+# Columns copied into the scenario context the agents read
+CONTEXT_FIELDS = PUBLIC_FIELDS + (
+    "patient_prognosis",
+    "family_relationship",
+    "family_background",
+    "initial_emotional_state",
+    "conversation_goals",
+    "pipeline_mode"
+)
+
+# Built-in scenarios, used while the scenarios table is empty or unreachable
+DEFAULT_SCENARIOS = [
+    {
+        "id": 1,
+        "title": "Terminal Cancer - Family in Denial",
+        "description": "75-year-old patient with stage 4 lung cancer. Adult daughter is in denial about prognosis.",
+        "difficulty": "intermediate",
+        "patient_condition": "Stage 4 lung cancer with weeks to live",
+        "patient_age": 75,
+        "family_relationship": "Adult daughter",
+        "family_background": "Only child who has been very close to parent. Works as a nurse.",
+        "initial_emotional_state": "denial"
+    },
+    {
+        "id": 2,
+        "title": "Sudden Cardiac Arrest - Spouse in Shock",
+        "description": "58-year-old patient after cardiac arrest. Spouse is experiencing shock and anger.",
+        "difficulty": "beginner",
+        "patient_condition": "Post-cardiac arrest, severe brain damage",
+        "patient_age": 58,
+        "family_relationship": "Spouse",
+        "family_background": "Married 30 years. No other family nearby.",
+        "initial_emotional_state": "anger"
+    },
+    {
+        "id": 3,
+        "title": "Advanced Dementia - Family Disagreement",
+        "description": "82-year-old with advanced dementia. Family members disagree on care approach.",
+        "difficulty": "advanced",
+        "patient_condition": "Advanced dementia, recurrent aspiration pneumonia",
+        "patient_age": 82,
+        "family_relationship": "Adult children (multiple)",
+        "family_background": "Three adult children with different opinions on care.",
+        "initial_emotional_state": "bargaining"
+    }
+]
+
+class ScenarioCatalog:
+    """
+    In-memory scenario catalog indexed by id
+    Loaded from the scenarios table at startup. The JSON bodies and ETags
+    of the list and detail endpoints are built once per load, so serving
+    them is a dict lookup. The shared version counter in Redis is checked
+    at most every SCENARIO_VERSION_CHECK_SECONDS and a newer version
+    triggers a reload
+    """
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self._contexts: Dict[int, Dict[str, Any]] = {}
+        self._bodies: Dict[int, bytes] = {}
+        self._etags: Dict[int, str] = {}
+        self.list_body = b"[]"
+        self.list_etag = self._etag(self.list_body)
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._load_failed = False
+
+    async def load(self):
+        """(Re)build the catalog from the database"""
+        version = await self._current_version()
+        self._load_failed = False
+        try:
+            async with SessionLocal() as db:
+                rows = (await db.execute(select(Scenario).order_by(Scenario.id))).scalars().all()
+            scenarios = [self._context(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Loading scenarios failed, using the built-in set: {str(e)}")
+            scenarios = []
+            self._load_failed = True
+        self._build(scenarios or DEFAULT_SCENARIOS)
+        self.version = version
+        self._checked_at = self._loaded_at = time.monotonic()
+
+    async def refresh(self):
+        """Reload if the version moved, the last load failed or the catalog is too old"""
+        now = time.monotonic()
+        if now - self._checked_at < settings.SCENARIO_VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        if self._load_failed or now - self._loaded_at >= settings.SCENARIO_RELOAD_SECONDS or \
+                await self._current_version() != self.version:
+            await self.load()
+
+    async def invalidate(self):
+        """Call after changing scenarios: bumps the version and reloads"""
+        await get_redis().incr(VERSION_KEY)
+        await self.load()
+
+    def get(self, scenario_id: int) -> Optional[Dict[str, Any]]:
+        """Full scenario context for the agents, None if unknown"""
+        context = self._contexts.get(scenario_id)
+        return dict(context) if context else None
+
+    def detail(self, scenario_id: int) -> Optional[Tuple[bytes, str]]:
+        """(JSON body, ETag) of one scenario's public fields"""
+        if scenario_id not in self._bodies:
+            return None
+        return self._bodies[scenario_id], self._etags[scenario_id]
+
+    def _build(self, scenarios: List[Dict[str, Any]]):
+        public = [{field: scenario.get(field) for field in PUBLIC_FIELDS} for scenario in scenarios]
+        self._contexts = {scenario["id"]: scenario for scenario in scenarios}
+        self._bodies = {item["id"]: self._json(item) for item in public}
+        self._etags = {scenario_id: self._etag(body) for scenario_id, body in self._bodies.items()}
+        self.list_body = self._json(public)
+        self.list_etag = self._etag(self.list_body)
+
+    async def _current_version(self) -> Optional[str]:
+        try:
+            return await get_redis().get(VERSION_KEY)
+        except Exception as e:
+            logger.error(f"Reading the scenario version failed: {str(e)}")
+            return self.version
+
+    def _context(self, row: Scenario) -> Dict[str, Any]:
+        context = {field: getattr(row, field) for field in CONTEXT_FIELDS}
+        context["difficulty"] = row.difficulty.value
+        return {key: value for key, value in context.items() if value is not None}
+
+    def _json(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    def _etag(self, body: bytes) -> str:
+        # Content-derived, so every worker hands out the same tag
+        return '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+
+scenario_catalog = ScenarioCatalog()
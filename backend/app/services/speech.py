@@ -0,0 +1,117 @@
+from typing import AsyncIterator, Optional, List, BinaryIO
+from app.agents.emotional_agent import OPENING_LINE
+from app.agents.safety_agent import SAFE_FALLBACK_RESPONSES, DEFAULT_SAFE_FALLBACK
+from app.core.config import settings
+from app.core.model_provider import audio_provider
+from app.services.tts_cache import speech_cache
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+def get_voice_for_emotion(emotion: str) -> str:
+    """Map emotional states to appropriate TTS voices"""
+    voice_map = {
+        "neutral": "nova",      # Calm, professional
+        "denial": "alloy",      # Slightly defensive
+        "anger": "onyx",        # Deeper, more intense
+        "bargaining": "shimmer", # Hopeful, pleading
+        "sadness": "echo",      # Softer, emotional
+        "acceptance": "fable"   # Peaceful, resigned
+    }
+    return voice_map.get(emotion, "nova")
+
+async def open_speech_stream(
+    text: str,
+    voice: str,
+    model: str = "tts-1",
+    speed: float = 1.0
+) -> AsyncIterator[bytes]:
+    """
+    Start speech synthesis and return an iterator over the MP3 bytes as
+    they arrive from the configured backend. Request errors (OpenAIError)
+    are raised here, before any audio has been handed out
+    """
+    # Use tts-1-hd for higher quality if needed
+    return await audio_provider().open_speech(text, voice, model, speed)
+
+async def synthesize(
+    text: str,
+    voice: str,
+    model: str = "tts-1",
+    speed: float = 1.0
+) -> AsyncIterator[bytes]:
+    """
+    Speech for text, from the disk cache when it has been synthesized
+    before, otherwise streamed from the API and cached on the way through
+    """
+    if not settings.TTS_CACHE_ENABLED:
+        return await open_speech_stream(text, voice, model=model, speed=speed)
+    
+    key = speech_cache.key(text, voice, speed, model)
+    path = speech_cache.lookup(key)
+    if path is not None:
+        return speech_cache.read(path)
+    
+    stream = await open_speech_stream(text, voice, model=model, speed=speed)
+    return speech_cache.fill(key, stream)
+
+def stock_phrases() -> List[str]:
+    """Fixed lines the app speaks repeatedly, worth synthesizing ahead of time"""
+    return [OPENING_LINE, DEFAULT_SAFE_FALLBACK, *SAFE_FALLBACK_RESPONSES.values()]
+
+async def transcribe(audio_file: BinaryIO, filename: str) -> str:
+    """
+    Transcribe audio with Whisper without loading it into memory:
+    the file object is streamed into the upload request
+    """
+    # Language can be made configurable for Japanese support
+    return await audio_provider().transcribe(audio_file, filename, "whisper-1", "en")
+
+class SpeechPipeline:
+    """
+    Sentence-level TTS pipelining
+    Each sentence is sent to TTS as soon as it is added, while later ones
+    are still being generated; audio comes out of chunks() in sentence
+    order, streaming the current sentence as its bytes arrive
+    """
+    
+    def __init__(self, max_concurrent: Optional[int] = None):
+        self._sentences = asyncio.Queue()  # per-sentence chunk queues, in order
+        self._tasks = []
+        self._limit = asyncio.Semaphore(max_concurrent or settings.TTS_PIPELINE_CONCURRENCY)
+    
+    def add_sentence(self, text: str, emotion: str):
+        chunks = asyncio.Queue()
+        self._sentences.put_nowait(chunks)
+        self._tasks.append(asyncio.create_task(self._synthesize(text, emotion, chunks)))
+    
+    def close(self):
+        """No more sentences will be added"""
+        self._sentences.put_nowait(None)
+    
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+    
+    async def chunks(self) -> AsyncIterator[tuple]:
+        """Yield (sentence index, audio chunk) pairs in sentence order"""
+        index = 0
+        while (sentence := await self._sentences.get()) is not None:
+            while (chunk := await sentence.get()) is not None:
+                yield index, chunk
+            index += 1
+    
+    async def _synthesize(self, text: str, emotion: str, out: asyncio.Queue):
+        try:
+            async with self._limit:
+                stream = await synthesize(text, get_voice_for_emotion(emotion))
+                async for chunk in stream:
+                    out.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # A failed sentence is skipped rather than stalling the rest
+            logger.error(f"Pipelined TTS failed for sentence: {str(e)}")
+        finally:
+            out.put_nowait(None)
@@ -0,0 +1,121 @@
+from typing import AsyncIterator, Dict, Any, Optional
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SpeechCache:
+    """
+    Content-addressed disk cache of synthesized speech
+    Files are named by the hash of (text, voice, speed, model), so
+    identical requests map to the same MP3. Total size is bounded with
+    least-recently-used eviction; file mtimes carry the LRU order across
+    restarts
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # filename -> size, least recent first
+        self._total_bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._load_index()
+
+    def key(self, text: str, voice: str, speed: float, model: str) -> str:
+        return hashlib.sha256(f"{model}\0{voice}\0{speed}\0{text}".encode()).hexdigest()
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Path of the cached MP3 for key, or None"""
+        name = f"{key}.mp3"
+        if name not in self._entries:
+            self.stats["misses"] += 1
+            return None
+        path = self.directory / name
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(name)
+            self.stats["misses"] += 1
+            return None
+        self._entries.move_to_end(name)
+        self.stats["hits"] += 1
+        return path
+
+    async def fill(self, key: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """
+        Pass audio chunks through while writing them to the cache
+        The file only becomes visible once the stream completed
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        complete = False
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                async for chunk in chunks:
+                    await asyncio.to_thread(tmp.write, chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                self._add(f"{key}.mp3", tmp_name)
+            else:
+                os.unlink(tmp_name)
+
+    async def read(self, path: Path) -> AsyncIterator[bytes]:
+        """Stream a cached file in TTS_CHUNK_SIZE pieces"""
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, settings.TTS_CHUNK_SIZE):
+                yield chunk
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes
+        }
+
+    def _add(self, name: str, tmp_name: str):
+        os.replace(tmp_name, self.directory / name)
+        size = os.path.getsize(self.directory / name)
+        self._forget(name)
+        self._entries[name] = size
+        self._total_bytes += size
+        self.stats["stores"] += 1
+        self._evict()
+
+    def _forget(self, name: str):
+        size = self._entries.pop(name, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.stats["evictions"] += 1
+            try:
+                os.unlink(self.directory / name)
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                # Left over from an interrupted write
+                os.unlink(entry.path)
+            elif entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+speech_cache = SpeechCache(settings.TTS_CACHE_DIR, settings.TTS_CACHE_MAX_BYTES)
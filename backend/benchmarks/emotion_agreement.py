@@ -0,0 +1,85 @@
+"""
+Compare the local emotion transition classifier with the LLM evaluation
+it replaces: how many turns the fast path takes (coverage), and how often
+its next state matches the LLM's on those turns and on all turns.
+
+Usage (from backend/, with OPENAI_API_KEY set):
+    python -m benchmarks.emotion_agreement benchmarks/data/physician_messages.jsonl
+
+Each line is {"message": str, "current_state": str, "intensity": int,
+"history": [...]}; intensity and history are optional.
+"""
+import argparse
+import asyncio
+import json
+from collections import Counter
+from app.agents.emotion_state_manager import EmotionStateManager
+from app.core.config import settings
+
+
+async def evaluate(path: str, threshold: float):
+    manager = EmotionStateManager()
+    with open(path) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    # The LLM decides every item; the classifier is scored against it
+    settings.EMOTION_FAST_PATH = False
+    settings.EMOTION_FAST_PATH_CONFIDENCE = 0.0
+
+    covered = agreed = agreed_all = 0
+    intensity_error = 0
+    labels = Counter()
+    mismatches = []
+    for item in corpus:
+        history = item.get("history", [])
+        intensity = item.get("intensity", 5)
+        llm = await manager.evaluate_transition(
+            current_state=item["current_state"],
+            user_message=item["message"],
+            conversation_history=history,
+            scenario_context={},
+            current_intensity=intensity
+        )
+        label, confidence, _ = manager.classifier.predict(item["message"])
+        local = manager.classify_transition(
+            item["current_state"], item["message"], history, intensity
+        )
+        labels[label] += 1
+        if local is None:
+            continue
+
+        match = local["new_state"] == llm["new_state"]
+        agreed_all += match
+        intensity_error += abs(local["intensity"] - int(llm["intensity"]))
+        if confidence >= threshold:
+            covered += 1
+            agreed += match
+        if not match:
+            mismatches.append({
+                "message": item["message"],
+                "current_state": item["current_state"],
+                "label": label,
+                "confidence": round(confidence, 3),
+                "local": local["new_state"],
+                "llm": llm["new_state"]
+            })
+
+    total = len(corpus)
+    print(json.dumps({
+        "messages": total,
+        "threshold": threshold,
+        "coverage": covered / total if total else 0.0,
+        "agreement_when_confident": agreed / covered if covered else 1.0,
+        "agreement_all": agreed_all / total if total else 1.0,
+        "mean_intensity_error": intensity_error / total if total else 0.0,
+        "labels": dict(labels),
+        "mismatches": mismatches
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("corpus")
+    parser.add_argument("--threshold", type=float, default=settings.EMOTION_FAST_PATH_CONFIDENCE)
+    args = parser.parse_args()
+    asyncio.run(evaluate(args.corpus, args.threshold))
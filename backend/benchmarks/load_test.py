@@ -0,0 +1,285 @@
+"""
+Concurrent session load test: N simulated physicians against one backend
+process.
+
+The API runs in this process under uvicorn, with every model call served
+by the replay backend from benchmarks/data/stub_recordings (any request
+gets a response recorded for the same agent) after a lognormal wait and
+at a fixed token rate. Each physician starts a conversation over HTTP,
+then plays scripted turns over the conversation WebSocket, streaming by
+default, with a redo and a coaching hint every few turns.
+
+Reported: turn latency and time to first token (p50/p95/p99), redo and
+hint latency, event loop lag (the clients share the server's loop, but
+do little besides waiting) and Redis commands per turn (from INFO, so
+use a Redis nobody else is using). Results are written as JSON;
+--compare adds the change against an earlier run.
+
+Usage (from backend/, with Redis at REDIS_URL):
+    python -m benchmarks.load_test --sessions 50 --turns 8
+    python -m benchmarks.load_test --sessions 50 --compare benchmarks/results/load_abc123_50.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from pathlib import Path
+
+DATA_DIR = Path(__file__).parent / "data"
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Conversation ids are scenario * 1000 + user id; offset clear of real users
+USER_ID_OFFSET = 500000
+
+
+def configure(args):
+    # Read by the settings object, so this must happen before app imports
+    os.environ.update({
+        "MODEL_BACKEND": "replay",
+        "MODEL_RECORDINGS_DIR": str(DATA_DIR / "stub_recordings"),
+        "MODEL_REPLAY_ON_MISS": "agent",
+        "MODEL_REPLAY_LATENCY": "lognormal",
+        "MODEL_REPLAY_LATENCY_MS": str(args.llm_latency_ms),
+        "MODEL_REPLAY_LATENCY_SIGMA": str(args.llm_latency_sigma),
+        "MODEL_REPLAY_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "MODEL_REPLAY_SEED": str(args.seed),
+        "LLM_CACHE_ENABLED": "false",
+        "PERSIST_ENABLED": "false"
+    })
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+
+    def rank(p):
+        return round(values[min(int(len(values) * p / 100), len(values) - 1)], 1)
+
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": round(values[-1], 1)
+    }
+
+
+class Metrics:
+    def __init__(self):
+        self.turn_ms = []
+        self.ttft_ms = []
+        self.redo_ms = []
+        self.hint_ms = []
+        self.loop_lag_ms = []
+        self.errors = []
+
+
+async def watch_loop_lag(metrics: Metrics, interval: float = 0.05):
+    """How late the event loop wakes up from a short sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.loop_lag_ms.append((loop.time() - started - interval) * 1000)
+
+
+async def receive_until(ws, types) -> dict:
+    """Next JSON frame of one of the given types (or an error frame)"""
+    while True:
+        frame = await ws.recv()
+        if isinstance(frame, bytes):
+            continue
+        frame = json.loads(frame)
+        if frame.get("type") in types or "error" in frame:
+            return frame
+
+
+async def physician(index: int, args, base_url: str, messages: list, metrics: Metrics):
+    import httpx
+    import websockets
+
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as http:
+        response = await http.post("/api/conversations/start", json={
+            "scenario_id": args.scenario,
+            "user_id": USER_ID_OFFSET + index
+        })
+        response.raise_for_status()
+        conversation_id = response.json()["id"]
+
+    ws_url = base_url.replace("http", "ws", 1) + f"/api/conversations/ws/{conversation_id}"
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        await receive_until(ws, ("message",))  # Opening line
+        for turn in range(args.turns):
+            message = messages[(index + turn) % len(messages)]
+            started = time.perf_counter()
+            await ws.send(json.dumps({"type": "message", "content": message, "stream": args.stream}))
+            first_token = None
+            while True:
+                frame = await receive_until(ws, ("delta", "message", "warning"))
+                if frame.get("type") == "delta":
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                    continue
+                break
+            finished = time.perf_counter()
+            if "error" in frame:
+                metrics.errors.append(frame["error"])
+                continue
+            metrics.turn_ms.append((finished - started) * 1000)
+            metrics.ttft_ms.append(((first_token or finished) - started) * 1000)
+
+            if args.redo_every and (turn + 1) % args.redo_every == 0:
+                started = time.perf_counter()
+                await ws.send(json.dumps({"type": "redo"}))
+                await receive_until(ws, ("system",))
+                metrics.redo_ms.append((time.perf_counter() - started) * 1000)
+            if args.hint_every and (turn + 1) % args.hint_every == 0:
+                started = time.perf_counter()
+                await ws.send(json.dumps({"type": "hint"}))
+                await receive_until(ws, ("hint",))
+                metrics.hint_ms.append((time.perf_counter() - started) * 1000)
+
+            await asyncio.sleep(rng.uniform(args.think_min, args.think_max))
+    return conversation_id
+
+
+async def redis_commands(client) -> int:
+    return (await client.info("stats"))["total_commands_processed"]
+
+
+async def run(args) -> dict:
+    import uvicorn
+    from app.core.redis_client import get_redis
+    from app.main import app
+
+    with open(DATA_DIR / "physician_messages.jsonl") as f:
+        messages = [json.loads(line)["message"] for line in f if line.strip()]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    metrics = Metrics()
+    monitor = asyncio.create_task(watch_loop_lag(metrics))
+    redis_client = get_redis()
+    commands_before = await redis_commands(redis_client)
+    started = time.perf_counter()
+
+    results = await asyncio.gather(*[
+        physician(index, args, f"http://127.0.0.1:{args.port}", messages, metrics)
+        for index in range(args.sessions)
+    ], return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    commands = await redis_commands(redis_client) - commands_before
+    monitor.cancel()
+    for result in results:
+        if isinstance(result, BaseException):
+            metrics.errors.append(repr(result))
+
+    # Leave the local Redis as it was
+    conversation_ids = [result for result in results if isinstance(result, int)]
+    for conversation_id in conversation_ids:
+        keys = [key async for key in redis_client.scan_iter(f"conversation:{conversation_id}:*")]
+        if keys:
+            await redis_client.delete(*keys)
+    if conversation_ids:
+        await redis_client.zrem("conversations:unpersisted", *conversation_ids)
+
+    server.should_exit = True
+    await serving
+
+    turns = len(metrics.turn_ms)
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "compare")
+        },
+        "sessions_completed": len(conversation_ids),
+        "turns": turns,
+        "errors": len(metrics.errors),
+        "error_samples": metrics.errors[:5],
+        "elapsed_seconds": round(elapsed, 1),
+        "turns_per_second": round(turns / elapsed, 2) if elapsed else 0.0,
+        "turn_latency_ms": percentiles(metrics.turn_ms),
+        "time_to_first_token_ms": percentiles(metrics.ttft_ms),
+        "redo_latency_ms": percentiles(metrics.redo_ms),
+        "hint_latency_ms": percentiles(metrics.hint_ms),
+        "event_loop_lag_ms": percentiles(metrics.loop_lag_ms),
+        # Includes background work (coach notes, summaries, jobs) and redo/hint
+        "redis_commands_per_turn": round(commands / turns, 1) if turns else None
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Change of each headline number against a baseline run"""
+    changes = {}
+    for section in ("turn_latency_ms", "time_to_first_token_ms", "event_loop_lag_ms"):
+        for stat in ("p50", "p95", "p99"):
+            before = baseline.get(section, {}).get(stat)
+            after = current.get(section, {}).get(stat)
+            if before is not None and after is not None:
+                changes[f"{section}.{stat}"] = {"before": before, "after": after, "delta": round(after - before, 1)}
+    for field in ("redis_commands_per_turn", "turns_per_second"):
+        if baseline.get(field) is not None and current.get(field) is not None:
+            changes[field] = {
+                "before": baseline[field],
+                "after": current[field],
+                "delta": round(current[field] - baseline[field], 2)
+            }
+    return {"baseline_commit": baseline.get("commit"), "changes": changes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=8)
+    parser.add_argument("--scenario", type=int, default=1)
+    parser.add_argument("--no-stream", dest="stream", action="store_false")
+    parser.add_argument("--redo-every", type=int, default=4, help="0 disables redo")
+    parser.add_argument("--hint-every", type=int, default=3, help="0 disables hints")
+    parser.add_argument("--think-min", type=float, default=0.5, help="Seconds between turns")
+    parser.add_argument("--think-max", type=float, default=2.0)
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions start")
+    parser.add_argument("--llm-latency-ms", type=float, default=600.0, help="Median wait for the first token")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Result file (default benchmarks/results/load_<commit>_<sessions>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    configure(args)
+    result = asyncio.run(run(args))
+    if args.compare:
+        with open(args.compare) as f:
+            result["comparison"] = compare(result, json.load(f))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load_{result['commit']}_{args.sessions}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(json.dumps(result, indent=2))
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare the agent pipeline modes: the same scripted physician messages
+are played through a real ConversationOrchestrator once per mode, and
+latency and LLM tokens per turn are reported, plus how often fast turns
+fell back to the staged pipeline.
+
+Usage (from backend/, with OPENAI_API_KEY set and Redis at REDIS_URL):
+    python -m benchmarks.pipeline_modes benchmarks/data/physician_messages.jsonl --turns 10
+
+Only the "message" field of each corpus line is used, in order.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from app.agents.orchestrator import ConversationOrchestrator
+from app.agents.usage import prompt_cache_stats
+from app.core.config import settings
+from app.services.scenarios import DEFAULT_SCENARIOS
+
+MODES = ("staged", "fast")
+
+
+def _tokens() -> dict:
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "calls": 0}
+    for stats in prompt_cache_stats.get_stats().values():
+        for field in totals:
+            totals[field] += stats[field]
+    return totals
+
+
+async def run_mode(mode: str, messages: list, conversation_id: int, scenario: dict) -> dict:
+    orchestrator = ConversationOrchestrator()
+    await orchestrator.start_conversation(conversation_id, {**scenario, "pipeline_mode": mode})
+
+    latencies = []
+    before = _tokens()
+    for message in messages:
+        started = time.perf_counter()
+        await orchestrator.process_message(conversation_id, message)
+        latencies.append(time.perf_counter() - started)
+    after = _tokens()
+    await orchestrator.redis_client.delete(*[
+        f"conversation:{conversation_id}:{name}"
+        for name in ("meta", "scenario", "history", "checkpoints", "coach_notes", "summary")
+    ])
+    await orchestrator.redis_client.zrem("conversations:unpersisted", conversation_id)
+
+    turns = len(messages)
+    latencies.sort()
+    return {
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 1),
+            "p50": round(latencies[turns // 2] * 1000, 1),
+            "p95": round(latencies[min(int(turns * 0.95), turns - 1)] * 1000, 1)
+        },
+        "per_turn": {
+            field: round((after[field] - before[field]) / turns, 1) for field in after
+        },
+        "fast_turn": orchestrator.get_stats()["fast_turn"]
+    }
+
+
+async def main(path: str, turns: int, scenario_id: int):
+    with open(path) as f:
+        messages = [json.loads(line)["message"] for line in f if line.strip()][:turns]
+    scenario = next(s for s in DEFAULT_SCENARIOS if s["id"] == scenario_id)
+
+    # Every turn must reach the models; background calls would blur the counts
+    settings.LLM_CACHE_ENABLED = False
+    settings.COACH_TURN_NOTES = False
+    settings.CONTEXT_SUMMARIES = False
+    settings.SPECULATIVE_GENERATION = False
+
+    results = {}
+    for offset, mode in enumerate(MODES):
+        results[mode] = await run_mode(mode, messages, 980000 + offset, scenario)
+    print(json.dumps({"turns": len(messages), "modes": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("corpus")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--scenario", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.corpus, args.turns, args.scenario))
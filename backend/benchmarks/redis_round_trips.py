@@ -0,0 +1,116 @@
+"""
+Count Redis round trips per conversation turn, before and after the
+pipelined state writes.
+
+"before" replays the command sequence the orchestrator used to issue
+(GET state, SET+EXPIRE checkpoint, SET+EXPIRE state); "after" drives the
+real ConversationOrchestrator with stub agents, so it measures whatever
+the current code does.
+
+Usage (from backend/, with Redis at REDIS_URL):
+    python -m benchmarks.redis_round_trips --turns 20
+"""
+import argparse
+import asyncio
+import json
+import redis.asyncio as redis
+from app.agents.orchestrator import ConversationOrchestrator
+from app.core.config import settings
+
+
+class CountingConnection(redis.Connection):
+    """Counts each write to the socket, i.e. each round trip"""
+    round_trips = 0
+
+    async def send_packed_command(self, command, check_health=True):
+        CountingConnection.round_trips += 1
+        return await super().send_packed_command(command, check_health)
+
+
+class StubEmotionManager:
+    transition_rules = {}
+
+    async def evaluate_transition(self, current_state, **kwargs):
+        return {"new_state": current_state, "intensity": 5, "reasoning": ""}
+
+
+class StubEmotionalAgent:
+    async def generate_response(self, **kwargs):
+        return "I understand, Doctor."
+
+
+class StubSafetyAgent:
+    def check_user_message_safety(self, user_message):
+        return {"safe": True}
+
+    async def check_response_safety(self, response, context):
+        return {"safe": True, "issues": [], "modified_response": response}
+
+
+SCENARIO = {"id": 1, "initial_emotional_state": "denial"}
+
+
+async def legacy_turns(client: redis.Redis, conversation_id: int, turns: int):
+    key = f"conversation:{conversation_id}:state"
+    checkpoint_key = f"conversation:{conversation_id}:checkpoint"
+    await client.set(key, json.dumps({"history": [], "turn_count": 0}))
+    CountingConnection.round_trips = 0
+    for _ in range(turns):
+        state = json.loads(await client.get(key))
+        await client.set(checkpoint_key, json.dumps(state))
+        await client.expire(checkpoint_key, 3600)
+        state["history"].append({"role": "user", "content": "..."})
+        state["history"].append({"role": "agent", "content": "..."})
+        state["turn_count"] += 1
+        await client.set(key, json.dumps(state))
+        await client.expire(key, 86400)
+
+
+async def current_turns(client: redis.Redis, conversation_id: int, turns: int):
+    # Coach notes and summaries run in the background, outside the turn
+    settings.COACH_TURN_NOTES = False
+    settings.CONTEXT_SUMMARIES = False
+    orchestrator = ConversationOrchestrator()
+    orchestrator.redis_client = client
+    orchestrator.emotion_manager = StubEmotionManager()
+    orchestrator.emotional_agent = StubEmotionalAgent()
+    orchestrator.safety_agent = StubSafetyAgent()
+    orchestrator.speculator = None
+    await orchestrator.start_conversation(conversation_id, SCENARIO)
+    CountingConnection.round_trips = 0
+    for _ in range(turns):
+        await orchestrator.process_message(conversation_id, "I'm so sorry.")
+
+
+async def measure(run, turns: int) -> float:
+    pool = redis.ConnectionPool.from_url(
+        settings.REDIS_URL,
+        connection_class=CountingConnection,
+        decode_responses=True
+    )
+    client = redis.Redis(connection_pool=pool)
+    conversation_id = 990000
+    # Each run resets the counter once its setup is done
+    await run(client, conversation_id, turns)
+    trips = CountingConnection.round_trips
+    await client.delete(*[
+        f"conversation:{conversation_id}:{name}"
+        for name in ("state", "checkpoint", "checkpoints", "meta", "scenario", "history")
+    ])
+    await pool.disconnect()
+    return trips / turns
+
+
+async def main(turns: int):
+    before = await measure(legacy_turns, turns)
+    after = await measure(current_turns, turns)
+    print(json.dumps({
+        "turns": turns,
+        "round_trips_per_turn": {"before": before, "after": after}
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=20)
+    asyncio.run(main(parser.parse_args().turns))
@@ -0,0 +1,55 @@
+"""
+Replay a corpus of agent responses through both safety checks and report
+how often the incremental (sentence-by-sentence) verdict matches the
+whole-response verdict.
+
+Usage (from backend/):
+    python -m benchmarks.safety_replay benchmarks/data/safety_corpus.jsonl
+
+Each corpus line is {"response": str, "context": {...}}.
+"""
+import argparse
+import asyncio
+import json
+from app.agents.safety_agent import SafetyAgent
+
+
+async def _tokens(text: str):
+    # Emulate a token stream at word granularity
+    for word in text.split(" "):
+        yield word + " "
+
+
+async def replay(path: str):
+    agent = SafetyAgent()
+    with open(path) as f:
+        corpus = [json.loads(line) for line in f if line.strip()]
+
+    agreements = 0
+    mismatches = []
+    for item in corpus:
+        whole = await agent.check_response_safety(item["response"], item["context"])
+        incremental = None
+        async for event in agent.check_response_stream(_tokens(item["response"]), item["context"]):
+            if event["type"] == "result":
+                incremental = event
+        if whole["safe"] == incremental["safe"]:
+            agreements += 1
+        else:
+            mismatches.append({
+                "response": item["response"],
+                "whole_safe": whole["safe"],
+                "incremental_safe": incremental["safe"]
+            })
+
+    print(json.dumps({
+        "responses": len(corpus),
+        "agreement": agreements / len(corpus) if corpus else 1.0,
+        "mismatches": mismatches
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("corpus")
+    asyncio.run(replay(parser.parse_args().corpus))
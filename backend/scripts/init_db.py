@@ -0,0 +1,92 @@
+"""
+Create the database schema, or bring an existing one up to date.
+
+Tables that do not exist yet are created from the models. Databases
+created before write-behind persistence are upgraded in place: message
+rows get their history position (numbered in insertion order) and the
+one-row-per-position constraint the flusher relies on, and scenarios
+get the pipeline_mode column. The built-in scenarios and a default
+user (id 1, the user the frontend sends until sign-in exists) are added
+when missing, so conversations can be stored on a fresh install, and
+running servers are told to reload their scenario catalog. Every step
+is idempotent, so this is safe to run on each deploy.
+
+Usage (from backend/):
+    python -m scripts.init_db
+"""
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from app.core.database import Base, close_database, engine
+from app.core.redis_client import close_redis
+from app.models import Scenario, User
+from app.models.scenario import DifficultyLevel
+from app.services.scenarios import DEFAULT_SCENARIOS, scenario_catalog
+
+DEFAULT_USER = {
+    "id": 1,
+    "email": "trainee@example.com",
+    "hashed_password": "",
+    "full_name": "Default Trainee"
+}
+
+UPGRADES = [
+    "ALTER TABLE scenarios ADD COLUMN IF NOT EXISTS pipeline_mode VARCHAR",
+    "ALTER TABLE conversation_messages ADD COLUMN IF NOT EXISTS position INTEGER",
+    """
+    UPDATE conversation_messages AS message SET position = numbered.position
+    FROM (
+        SELECT id, row_number() OVER (PARTITION BY conversation_id ORDER BY created_at, id) - 1 AS position
+        FROM conversation_messages
+    ) AS numbered
+    WHERE message.id = numbered.id AND message.position IS NULL
+    """,
+    "ALTER TABLE conversation_messages ALTER COLUMN position SET NOT NULL",
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint
+            WHERE conname = 'conversation_messages_conversation_id_position_key'
+        ) THEN
+            ALTER TABLE conversation_messages
+                ADD CONSTRAINT conversation_messages_conversation_id_position_key
+                UNIQUE (conversation_id, position);
+        END IF;
+    END $$
+    """
+]
+
+
+async def seed(conn):
+    """Add the default user and built-in scenarios, keeping existing rows"""
+    await conn.execute(insert(User).values(DEFAULT_USER).on_conflict_do_nothing())
+    await conn.execute(insert(Scenario).values([
+        {**scenario, "difficulty": DifficultyLevel(scenario["difficulty"])}
+        for scenario in DEFAULT_SCENARIOS
+    ]).on_conflict_do_nothing())
+    # Rows above are inserted with explicit ids; move the id sequences past them
+    for table in ("users", "scenarios"):
+        await conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"(SELECT MAX(id) FROM {table}))"
+        ))
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in UPGRADES:
+            await conn.execute(text(statement))
+        await seed(conn)
+    try:
+        # Running servers reload their scenario catalog
+        await scenario_catalog.invalidate()
+    except Exception as e:
+        print(f"Could not signal the scenario change through Redis: {str(e)}")
+    await close_database()
+    await close_redis()
+    print("Database schema is up to date")
+
+
+if __name__ == "__main__":
+    asyncio.run(init_db())
@@ -0,0 +1,26 @@
+"""
+Pre-synthesize the stock phrases (opening line and safety fallbacks) in
+every emotion's voice, so those requests are served from the TTS cache
+and never reach the API.
+
+Usage (from backend/):
+    python -m scripts.warm_tts_cache
+"""
+import asyncio
+from app.services.speech import get_voice_for_emotion, synthesize, stock_phrases
+from app.services.tts_cache import speech_cache
+
+EMOTIONS = ["neutral", "denial", "anger", "bargaining", "sadness", "acceptance"]
+
+
+async def warm():
+    voices = sorted({get_voice_for_emotion(emotion) for emotion in EMOTIONS})
+    for voice in voices:
+        for phrase in stock_phrases():
+            async for _ in await synthesize(phrase, voice):
+                pass
+    print(speech_cache.get_stats())
+
+
+if __name__ == "__main__":
+    asyncio.run(warm())
@@ -0,0 +1,69 @@
+"""
+Test settings: every model call is replayed from the stub recordings
+used by the load test, with a short fixed latency, and nothing is
+cached or written to Postgres. Set before any app module reads them.
+Tests that need Postgres use TEST_DATABASE_URL and skip without it
+"""
+import os
+from pathlib import Path
+
+STUB_RECORDINGS = Path(__file__).parent.parent / "benchmarks" / "data" / "stub_recordings"
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+os.environ.update({
+    "MODEL_BACKEND": "replay",
+    "MODEL_RECORDINGS_DIR": str(STUB_RECORDINGS),
+    "MODEL_REPLAY_ON_MISS": "agent",
+    "MODEL_REPLAY_LATENCY": "fixed",
+    "MODEL_REPLAY_LATENCY_MS": "20",
+    "LLM_CACHE_ENABLED": "false",
+    "PERSIST_ENABLED": "false",
+    # Always ask the emotion model, and summarize from the second turn on
+    "EMOTION_FAST_PATH": "false",
+    "CONTEXT_RECENT_MESSAGES": "2",
+    "CONTEXT_SUMMARY_MIN_NEW_MESSAGES": "2"
+})
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+
+
+import asyncio  # noqa: E402 - app settings read the environment above
+import fakeredis.aioredis  # noqa: E402
+import pytest  # noqa: E402
+from app.agents.orchestrator import ConversationOrchestrator  # noqa: E402
+from app.core.database import Base, close_database, engine  # noqa: E402
+from scripts.init_db import seed  # noqa: E402
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    """One fake Redis for everything that calls get_redis()"""
+    client = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    for module in ("app.core.redis_client", "app.services.feedback", "app.services.scenarios"):
+        monkeypatch.setattr(f"{module}.get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def orchestrator(fake_redis):
+    orchestrator = ConversationOrchestrator()
+    orchestrator.redis_client = fake_redis
+    return orchestrator
+
+
+@pytest.fixture
+def database():
+    """Fresh schema in TEST_DATABASE_URL, seeded like scripts/init_db.py"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    async def reset():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+            await seed(conn)
+        # Each test runs its own event loop; pooled connections belong to this one
+        await close_database()
+
+    asyncio.run(reset())
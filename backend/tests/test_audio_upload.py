@@ -0,0 +1,88 @@
+"""
+Speech-to-text uploads are refused with 413 as soon as they exceed the
+limit, whether or not Content-Length announces it, and only uploads
+within it reach the transcription backend.
+"""
+import asyncio
+import httpx
+import pytest
+from app.api import audio
+from app.core.config import settings
+from app.main import app
+
+LIMIT = 4096
+BOUNDARY = "test-boundary"
+
+
+@pytest.fixture
+def transcribed(monkeypatch):
+    """Sizes of the uploads that reached transcription"""
+    monkeypatch.setattr(settings, "STT_MAX_UPLOAD_BYTES", LIMIT)
+    sizes = []
+
+    async def transcribe(audio_file, filename):
+        sizes.append(len(audio_file.read()))
+        return "I understand."
+
+    monkeypatch.setattr(audio, "transcribe", transcribe)
+    return sizes
+
+
+def multipart(size: int) -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="audio_file"; filename="audio.webm"\r\n'
+        "Content-Type: audio/webm\r\n\r\n"
+    ).encode() + b"\0" * size + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def post(body, headers=None) -> httpx.Response:
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/audio/speech-to-text",
+                content=body,
+                headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}", **(headers or {})}
+            )
+
+    return asyncio.run(main())
+
+
+def test_upload_within_limit_is_transcribed(transcribed):
+    response = post(multipart(1000))
+
+    assert response.status_code == 200
+    assert response.json()["text"] == "I understand."
+    assert transcribed == [1000]
+
+
+def test_declared_oversize_upload_is_refused(transcribed):
+    response = post(multipart(LIMIT * 2))
+
+    assert response.status_code == 413
+    assert transcribed == []
+
+
+def test_undeclared_oversize_upload_is_cut_off(transcribed):
+    body = multipart(LIMIT * 4)
+
+    async def stream():
+        # Sent chunked, without Content-Length
+        for start in range(0, len(body), 1024):
+            yield body[start:start + 1024]
+
+    response = post(stream())
+
+    assert response.status_code == 413
+    assert transcribed == []
+
+
+def test_missing_file_is_rejected(transcribed):
+    body = (
+        f"--{BOUNDARY}\r\n"
+        'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"hello\r\n--{BOUNDARY}--\r\n"
+    ).encode()
+
+    assert post(body).status_code == 422
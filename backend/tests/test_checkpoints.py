@@ -0,0 +1,95 @@
+"""
+Redo checkpoints: rewinding by steps or to a turn restores the history
+and scalar fields of that point, and a turn that was still running
+when the conversation was rewound is not committed on top of it.
+"""
+import asyncio
+from app.services.scenarios import CONTEXT_FIELDS, DEFAULT_SCENARIOS
+
+CONVERSATION_ID = 2001
+
+SCENARIO = {
+    key: value for key, value in DEFAULT_SCENARIOS[0].items() if key in CONTEXT_FIELDS
+}
+
+MESSAGES = [
+    "I'm afraid the scans show the cancer has spread to her liver.",
+    "I know this is a lot to take in. What questions do you have?",
+    "We can focus on keeping her comfortable from here."
+]
+
+
+async def play_turns(orchestrator, count: int):
+    await orchestrator.start_conversation(CONVERSATION_ID, SCENARIO, user_id=1)
+    for message in MESSAGES[:count]:
+        result = await orchestrator.process_message(CONVERSATION_ID, message)
+        assert result["type"] == "message"
+
+
+async def history(orchestrator) -> list:
+    state = await orchestrator._load_state(CONVERSATION_ID)
+    return [entry["content"] for entry in state["history"]]
+
+
+def test_redo_goes_back_one_turn(orchestrator):
+    async def main():
+        await play_turns(orchestrator, 3)
+        assert await orchestrator.list_checkpoints(CONVERSATION_ID) == [0, 1, 2]
+
+        result = await orchestrator.redo_last_turn(CONVERSATION_ID)
+
+        assert result["status"] == "rewound" and result["turn"] == 2
+        state = await orchestrator._load_state(CONVERSATION_ID)
+        assert state["turn_count"] == 2
+        assert state["history_length"] == 4
+        assert state["history"][-2]["content"] == MESSAGES[1]
+        assert await orchestrator.list_checkpoints(CONVERSATION_ID) == [0, 1]
+
+    asyncio.run(main())
+
+
+def test_redo_to_turn_restores_state_after_that_turn(orchestrator):
+    async def main():
+        await play_turns(orchestrator, 3)
+        after_first = await history(orchestrator)
+
+        result = await orchestrator.redo_last_turn(CONVERSATION_ID, turn=1)
+
+        assert result["turn"] == 1
+        assert await history(orchestrator) == after_first[:2]
+        assert (await orchestrator.redo_last_turn(CONVERSATION_ID, turn=0))["turn"] == 0
+        assert await history(orchestrator) == []
+
+    asyncio.run(main())
+
+
+def test_redo_rejects_unreachable_turns(orchestrator):
+    async def main():
+        await play_turns(orchestrator, 2)
+
+        assert "error" in await orchestrator.redo_last_turn(CONVERSATION_ID, turn=2)
+        assert "error" in await orchestrator.redo_last_turn(CONVERSATION_ID, turn=3)
+        assert "error" in await orchestrator.redo_last_turn(CONVERSATION_ID, steps=3)
+        assert "error" in await orchestrator.redo_last_turn(CONVERSATION_ID, steps=0)
+        assert len(await history(orchestrator)) == 4
+
+    asyncio.run(main())
+
+
+def test_turn_running_during_redo_is_not_committed(orchestrator):
+    async def main():
+        await play_turns(orchestrator, 2)
+        turn = await orchestrator._begin_turn(CONVERSATION_ID, MESSAGES[2])
+
+        await orchestrator.redo_last_turn(CONVERSATION_ID)
+        result = await orchestrator._finish_turn(
+            CONVERSATION_ID, turn, {"new_state": "sadness", "intensity": 5}, "I see."
+        )
+
+        assert "error" in result
+        state = await orchestrator._load_state(CONVERSATION_ID)
+        assert state["turn_count"] == 1
+        assert [entry["content"] for entry in state["history"]][0] == MESSAGES[0]
+        assert state["history_length"] == 2
+
+    asyncio.run(main())
@@ -0,0 +1,17 @@
+"""DATABASE_URL is accepted in any of the usual Postgres spellings"""
+import pytest
+from app.core.database import async_database_url
+
+
+@pytest.mark.parametrize("url", [
+    "postgresql://user:secret@db:5432/vital_talk",
+    "postgres://user:secret@db:5432/vital_talk",
+    "postgresql+psycopg2://user:secret@db:5432/vital_talk",
+    "postgresql+asyncpg://user:secret@db:5432/vital_talk"
+])
+def test_postgres_urls_use_asyncpg(url):
+    assert async_database_url(url) == "postgresql+asyncpg://user:secret@db:5432/vital_talk"
+
+
+def test_other_backends_are_left_alone():
+    assert async_database_url("sqlite+aiosqlite:///test.db") == "sqlite+aiosqlite:///test.db"
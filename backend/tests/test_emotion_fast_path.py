@@ -0,0 +1,73 @@
+"""
+Emotion fast path: confident classifications are decided in-process from
+transition_rules; unsure ones go to the emotion model.
+"""
+import asyncio
+import pytest
+from app.agents.emotion_classifier import ResponseTypeClassifier, next_state
+from app.agents.emotion_state_manager import EmotionStateManager
+from app.core.config import settings
+from app.services.scenarios import CONTEXT_FIELDS, DEFAULT_SCENARIOS
+
+SCENARIO = {
+    key: value for key, value in DEFAULT_SCENARIOS[0].items() if key in CONTEXT_FIELDS
+}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    monkeypatch.setattr(settings, "EMOTION_FAST_PATH", True)
+    return EmotionStateManager()
+
+
+@pytest.mark.parametrize("message, label", [
+    ("I'm so sorry. This must be overwhelming, take your time.", "empathetic_response"),
+    ("The scans show stage 4 cancer with 20 percent survival at 6 months.", "factual_response"),
+    ("Calm down, you're overreacting.", "dismissive_response")
+])
+def test_clear_messages_are_classified(message, label):
+    predicted, confidence, _ = ResponseTypeClassifier().predict(message)
+    assert predicted == label
+    assert confidence >= settings.EMOTION_FAST_PATH_CONFIDENCE
+
+
+def test_transition_rules():
+    rules = EmotionStateManager().transition_rules
+    # Empathy eases intensity and moves on once it is low enough
+    assert next_state(rules, "denial", "empathetic_response", 5, 0, 3) == ("sadness", 4)
+    assert next_state(rules, "anger", "empathetic_response", 8, 0, 3) == ("anger", 7)
+    # ...or once the state has lasted long enough
+    assert next_state(rules, "anger", "empathetic_response", 8, 3, 3) == ("sadness", 7)
+    # Dismissal escalates, facts keep things as they are
+    assert next_state(rules, "denial", "dismissive_response", 5, 0, 3) == ("anger", 7)
+    assert next_state(rules, "sadness", "factual_response", 6, 0, 3) == ("sadness", 6)
+    assert next_state(rules, "neutral", "factual_response", 5, 0, 3) is None
+
+
+def test_confident_message_skips_the_model(manager):
+    async def main():
+        evaluation = await manager.evaluate_transition(
+            current_state="denial",
+            user_message="I'm so sorry. This must be overwhelming, take your time.",
+            conversation_history=[],
+            scenario_context=SCENARIO
+        )
+        assert evaluation["source"] == "local"
+        assert evaluation["new_state"] == "sadness"
+        assert manager.stats == {"local": 1, "llm": 0}
+
+    asyncio.run(main())
+
+
+def test_unsure_message_asks_the_model(manager):
+    async def main():
+        evaluation = await manager.evaluate_transition(
+            current_state="denial",
+            user_message="Okay.",
+            conversation_history=[],
+            scenario_context=SCENARIO
+        )
+        assert "source" not in evaluation
+        assert manager.stats == {"local": 0, "llm": 1}
+
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+"""
+Nothing in a conversation turn may block the event loop: concurrent
+sessions only overlap their model calls if every call is awaited.
+
+Each test runs the loop in debug mode, where asyncio logs any step that
+holds the loop longer than slow_callback_duration, and replaces the
+replay model's sync paths (_generate and _stream, reached through
+invoke/stream instead of ainvoke/astream) with versions that block for
+longer than that and note the calling agent.
+"""
+import asyncio
+import logging
+import time
+import pytest
+from app.agents.context import load_tokenizer
+from app.core.model_provider import ReplayChatOpenAI
+from app.services.scenarios import CONTEXT_FIELDS, DEFAULT_SCENARIOS
+
+SLOW_CALLBACK_SECONDS = 0.25
+
+CONVERSATION_ID = 1001
+
+SCENARIO = {
+    key: value for key, value in DEFAULT_SCENARIOS[0].items() if key in CONTEXT_FIELDS
+}
+
+
+@pytest.fixture
+def blocking_calls(monkeypatch):
+    """Agents that reached a sync model call"""
+    calls = []
+    generate = ReplayChatOpenAI._generate
+    stream = ReplayChatOpenAI._stream
+
+    def blocking_generate(self, *args, **kwargs):
+        calls.append(self.agent)
+        time.sleep(SLOW_CALLBACK_SECONDS * 2)
+        return generate(self, *args, **kwargs)
+
+    def blocking_stream(self, *args, **kwargs):
+        calls.append(self.agent)
+        time.sleep(SLOW_CALLBACK_SECONDS * 2)
+        yield from stream(self, *args, **kwargs)
+
+    monkeypatch.setattr(ReplayChatOpenAI, "_generate", blocking_generate)
+    monkeypatch.setattr(ReplayChatOpenAI, "_stream", blocking_stream)
+    return calls
+
+
+def run_with_slow_callbacks(coro, caplog) -> list:
+    """Run coro on a debug loop; returns the slow-callback warnings it caused"""
+    async def main():
+        asyncio.get_running_loop().slow_callback_duration = SLOW_CALLBACK_SECONDS
+        # Loaded at startup in the app, off the loop
+        await load_tokenizer()
+        return await coro
+
+    with caplog.at_level(logging.WARNING, logger="asyncio"):
+        asyncio.run(main(), debug=True)
+    return [
+        record.getMessage() for record in caplog.records
+        if record.name == "asyncio" and "took" in record.getMessage()
+    ]
+
+
+async def background_work(orchestrator):
+    """Wait for the coach notes and summary updates a turn started"""
+    tasks = [task for tasks in orchestrator._coach_tasks.values() for task in tasks]
+    tasks += list(orchestrator._summary_tasks.values())
+    await asyncio.gather(*tasks)
+
+
+async def play_conversation(orchestrator):
+    await orchestrator.start_conversation(CONVERSATION_ID, SCENARIO, user_id=1)
+
+    result = await orchestrator.process_message(
+        CONVERSATION_ID, "I'm afraid the scans show the cancer has spread to her liver."
+    )
+    assert result["type"] == "message"
+    await background_work(orchestrator)
+
+    frames = [
+        frame async for frame in orchestrator.stream_message(
+            CONVERSATION_ID, "I know this is a lot to take in. What questions do you have?"
+        )
+    ]
+    assert frames[-1]["type"] == "message"
+    assert any(frame["type"] == "delta" for frame in frames)
+    await background_work(orchestrator)
+
+    hint = await orchestrator.get_coaching_hint(CONVERSATION_ID)
+    assert "error" not in hint
+    feedback = await orchestrator.get_final_feedback(CONVERSATION_ID)
+    assert "error" not in feedback
+
+
+def test_conversation_does_not_block_event_loop(orchestrator, blocking_calls, caplog):
+    slow_callbacks = run_with_slow_callbacks(play_conversation(orchestrator), caplog)
+
+    assert blocking_calls == []
+    assert slow_callbacks == []
+
+
+def test_blocking_model_call_is_detected(orchestrator, blocking_calls, caplog):
+    async def sync_call():
+        orchestrator.emotional_agent.llm.invoke("Hello")
+
+    slow_callbacks = run_with_slow_callbacks(sync_call(), caplog)
+
+    assert blocking_calls == ["emotional_agent"]
+    assert slow_callbacks
@@ -0,0 +1,113 @@
+"""
+Ending a conversation queues its feedback; the job stores the
+conversation ahead of the write-behind flusher, so the feedback row's
+foreign key holds, and GET /api/feedback serves the result. Needs
+TEST_DATABASE_URL.
+"""
+import asyncio
+import httpx
+import pytest
+from app.api import conversations
+from app.api import feedback as feedback_api
+from app.core.database import close_database
+from app.main import app
+from app.services import feedback
+from app.services.jobs import JobQueue
+from app.services.scenarios import CONTEXT_FIELDS, DEFAULT_SCENARIOS
+
+CONVERSATION_ID = 3001
+
+SCENARIO = {
+    key: value for key, value in DEFAULT_SCENARIOS[0].items() if key in CONTEXT_FIELDS
+}
+
+
+@pytest.fixture
+def feedback_queue(fake_redis, monkeypatch):
+    queue = JobQueue("feedback", redis_client=fake_redis, max_attempts=2)
+    monkeypatch.setattr(feedback, "feedback_jobs", queue)
+    monkeypatch.setattr(feedback_api, "feedback_jobs", queue)
+    return queue
+
+
+async def job_finished(conversation_id: int) -> dict:
+    for _ in range(200):
+        job = await feedback.feedback_job_status(conversation_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError("Feedback job did not finish")
+
+
+def test_end_conversation_then_fetch_feedback(database, orchestrator, feedback_queue, monkeypatch):
+    monkeypatch.setattr(conversations, "orchestrator", orchestrator)
+
+    async def main():
+        await orchestrator.start_conversation(CONVERSATION_ID, SCENARIO, user_id=1)
+        await orchestrator.process_message(
+            CONVERSATION_ID, "I'm afraid the scans show the cancer has spread to her liver."
+        )
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post(f"/api/conversations/end/{CONVERSATION_ID}")
+            assert response.status_code == 200
+            assert response.json()["feedback"] == "queued"
+            assert (await client.get(f"/api/feedback/{CONVERSATION_ID}")).status_code == 202
+
+            # Nothing has been flushed: the job has to store the conversation itself
+            await feedback_queue.start(
+                lambda payload: feedback.generate_feedback(orchestrator, payload), concurrency=1
+            )
+            try:
+                job = await job_finished(CONVERSATION_ID)
+            finally:
+                await feedback_queue.stop()
+            assert job["status"] == "done", job
+
+            response = await client.get(f"/api/feedback/{CONVERSATION_ID}")
+            assert response.status_code == 200
+            assert response.json()["conversation_id"] == CONVERSATION_ID
+            legacy = await client.get(f"/api/conversations/{CONVERSATION_ID}/feedback")
+            assert legacy.json() == response.json()
+
+    async def run():
+        try:
+            await main()
+        finally:
+            await close_database()
+
+    asyncio.run(run())
+
+
+def test_retry_reuses_generated_feedback(database, orchestrator, fake_redis, monkeypatch):
+    calls = []
+    get_final_feedback = orchestrator.get_final_feedback
+
+    async def counted(conversation_id):
+        calls.append(conversation_id)
+        return await get_final_feedback(conversation_id)
+
+    monkeypatch.setattr(orchestrator, "get_final_feedback", counted)
+
+    async def main():
+        await orchestrator.start_conversation(CONVERSATION_ID, SCENARIO, user_id=1)
+        await orchestrator.process_message(CONVERSATION_ID, "How are you holding up?")
+        payload = {"conversation_id": CONVERSATION_ID, "job_id": f"{CONVERSATION_ID}:1:1"}
+
+        # The first attempt generates feedback but cannot store it
+        await fake_redis.hdel(orchestrator._key(CONVERSATION_ID, "meta"), "user_id")
+        with pytest.raises(ValueError):
+            await feedback.generate_feedback(orchestrator, payload)
+        await fake_redis.hset(orchestrator._key(CONVERSATION_ID, "meta"), "user_id", 1)
+        await feedback.generate_feedback(orchestrator, payload)
+
+        assert calls == [CONVERSATION_ID]
+        assert not await fake_redis.exists(f"feedback:{payload['job_id']}:draft")
+
+    async def run():
+        try:
+            await main()
+        finally:
+            await close_database()
+
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+"""
+Job queue: ids are idempotency keys, failed jobs are retried, and a
+process's running jobs are requeued when it stops or its lease expires,
+but never while it is still alive.
+"""
+import asyncio
+import pytest
+from app.core.config import settings
+from app.services.jobs import JobQueue
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "JOB_RETRY_BACKOFF_SECONDS", 0)
+
+
+async def wait_for_status(queue: JobQueue, job_id: str, status: str):
+    for _ in range(100):
+        if (await queue.status(job_id))["status"] == status:
+            return
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Job {job_id} never reached {status}")
+
+
+def test_enqueue_is_idempotent(fake_redis):
+    async def main():
+        queue = JobQueue("test", redis_client=fake_redis)
+        await queue.enqueue("a", {"n": 1})
+        again = await queue.enqueue("a", {"n": 2})
+
+        assert again["status"] == "queued"
+        assert await fake_redis.llen(queue._key("queue")) == 1
+
+    asyncio.run(main())
+
+
+def test_failed_job_is_retried(fake_redis):
+    attempts = []
+
+    async def handler(payload):
+        attempts.append(payload)
+        if len(attempts) == 1:
+            raise RuntimeError("flaky")
+
+    async def main():
+        queue = JobQueue("test", redis_client=fake_redis, max_attempts=2)
+        await queue.enqueue("a", {"n": 1})
+        await queue.start(handler, concurrency=1)
+        try:
+            await wait_for_status(queue, "a", "done")
+        finally:
+            await queue.stop()
+
+        assert len(attempts) == 2
+        assert queue.stats["retried"] == 1 and queue.stats["completed"] == 1
+
+    asyncio.run(main())
+
+
+def test_jobs_of_an_expired_process_are_reclaimed(fake_redis):
+    started = asyncio.Event()
+    finished = []
+
+    async def stuck(payload):
+        started.set()
+        await asyncio.Event().wait()
+
+    async def handler(payload):
+        finished.append(payload["n"])
+
+    async def main():
+        crashed = JobQueue("test", redis_client=fake_redis)
+        await crashed.enqueue("a", {"n": 1})
+        await crashed.start(stuck, concurrency=1)
+        await started.wait()
+
+        # Still alive: another process leaves its job alone
+        alive_check = JobQueue("test", redis_client=fake_redis)
+        await alive_check._reclaim_expired()
+        assert alive_check.stats["reclaimed"] == 0
+        assert await fake_redis.llen(crashed._processing_key) == 1
+
+        # Dies without stop(); its lease runs out
+        for task in crashed._workers:
+            task.cancel()
+        await asyncio.gather(*crashed._workers, return_exceptions=True)
+        await fake_redis.delete(crashed._key("lease", crashed.worker_id))
+
+        survivor = JobQueue("test", redis_client=fake_redis)
+        await survivor.start(handler, concurrency=1)
+        try:
+            await wait_for_status(survivor, "a", "done")
+        finally:
+            await survivor.stop()
+
+        assert survivor.stats["reclaimed"] == 1
+        assert finished == [1]
+        assert not await fake_redis.exists(crashed._processing_key)
+
+    asyncio.run(main())
+
+
+def test_stop_requeues_running_jobs(fake_redis):
+    started = asyncio.Event()
+
+    async def stuck(payload):
+        started.set()
+        await asyncio.Event().wait()
+
+    async def main():
+        queue = JobQueue("test", redis_client=fake_redis)
+        await queue.enqueue("a", {"n": 1})
+        await queue.start(stuck, concurrency=1)
+        await started.wait()
+        await queue.stop()
+
+        assert await fake_redis.lrange(queue._key("queue"), 0, -1) == ["a"]
+        assert not await fake_redis.exists(queue._key("lease", queue.worker_id))
+        assert queue.worker_id not in await fake_redis.smembers(queue._key("workers"))
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+"""
+Write-behind flusher: conversations are upserted with their messages
+keyed by history position, a conversation whose rows fail is isolated
+in its own savepoint so the rest of the batch is stored, and one that
+keeps failing is dead-lettered. Needs TEST_DATABASE_URL.
+"""
+import asyncio
+import json
+from sqlalchemy import select
+from app.agents.orchestrator import (
+    PERSIST_ATTEMPTS_KEY,
+    PERSIST_DEAD_LETTER_KEY,
+    PERSIST_QUEUE_KEY
+)
+from app.core.database import SessionLocal, close_database
+from app.models import Conversation, ConversationMessage
+from app.services.persistence import ConversationFlusher
+from app.services.scenarios import CONTEXT_FIELDS, DEFAULT_SCENARIOS
+
+SCENARIO = {
+    key: value for key, value in DEFAULT_SCENARIOS[0].items() if key in CONTEXT_FIELDS
+}
+
+# No row in users, so this conversation's insert breaks the foreign key
+UNKNOWN_USER = 999
+
+
+def flusher_for(orchestrator) -> ConversationFlusher:
+    flusher = ConversationFlusher(batch_size=10, interval=60)
+    flusher.orchestrator = orchestrator
+    return flusher
+
+
+async def stored(conversation_id: int):
+    async with SessionLocal() as db:
+        conversation = await db.get(Conversation, conversation_id)
+        result = await db.execute(
+            select(ConversationMessage.position, ConversationMessage.content)
+            .where(ConversationMessage.conversation_id == conversation_id)
+            .order_by(ConversationMessage.position)
+        )
+        return conversation, result.all()
+
+
+def run(coro):
+    async def main():
+        try:
+            await coro
+        finally:
+            await close_database()
+
+    asyncio.run(main())
+
+
+def test_flush_upserts_conversation_and_rewrites_after_redo(database, orchestrator):
+    async def main():
+        flusher = flusher_for(orchestrator)
+        await orchestrator.start_conversation(4001, SCENARIO, user_id=1)
+        await orchestrator.process_message(4001, "The scans show the cancer has spread.")
+        await flusher.flush()
+
+        await orchestrator.process_message(4001, "What questions do you have?")
+        await orchestrator.end_conversation(4001)
+        await flusher.flush()
+        conversation, messages = await stored(4001)
+        assert conversation.status.value == "completed"
+        assert [position for position, _ in messages] == [0, 1, 2, 3]
+
+        await orchestrator.redo_last_turn(4001)
+        await orchestrator.process_message(4001, "How are you holding up?")
+        await flusher.flush()
+        _, messages = await stored(4001)
+        assert [position for position, _ in messages] == [0, 1, 2, 3]
+        assert messages[2][1] == "How are you holding up?"
+        assert await orchestrator.redis_client.zcard(PERSIST_QUEUE_KEY) == 0
+
+    run(main())
+
+
+def test_failing_conversation_does_not_block_batch(database, orchestrator):
+    async def main():
+        flusher = flusher_for(orchestrator)
+        await orchestrator.start_conversation(4002, SCENARIO, user_id=1)
+        await orchestrator.start_conversation(4003, SCENARIO, user_id=UNKNOWN_USER)
+
+        assert await flusher.flush() == 2
+
+        conversation, _ = await stored(4002)
+        assert conversation is not None
+        assert (await stored(4003))[0] is None
+        assert flusher.stats["failed_conversations"] == 1
+        assert await orchestrator.redis_client.hget(PERSIST_ATTEMPTS_KEY, 4003) == "1"
+        # Backed off: still queued, but not due yet
+        assert await orchestrator.pending_persistence(10) == []
+        assert await orchestrator.redis_client.zscore(PERSIST_QUEUE_KEY, 4003) is not None
+
+    run(main())
+
+
+def test_conversation_is_dead_lettered_after_max_attempts(database, orchestrator, monkeypatch):
+    monkeypatch.setattr("app.services.persistence.settings.PERSIST_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr("app.services.persistence.settings.PERSIST_RETRY_BACKOFF_SECONDS", 0)
+
+    async def main():
+        flusher = flusher_for(orchestrator)
+        await orchestrator.start_conversation(4004, SCENARIO, user_id=UNKNOWN_USER)
+
+        await flusher.flush()
+        await flusher.flush()
+
+        assert flusher.stats["dead_lettered"] == 1
+        assert await orchestrator.redis_client.zscore(PERSIST_QUEUE_KEY, 4004) is None
+        entry = json.loads(await orchestrator.redis_client.hget(PERSIST_DEAD_LETTER_KEY, 4004))
+        assert entry["attempts"] == 2
+        backlog = await orchestrator.persistence_backlog()
+        assert backlog["dead_letters"] == 1
+
+        # A later change queues it again
+        await orchestrator.process_message(4004, "How are you holding up?")
+        assert await orchestrator.redis_client.zscore(PERSIST_QUEUE_KEY, 4004) is not None
+
+    run(main())
@@ -0,0 +1,67 @@
+"""
+Response cache: deterministic calls are served after one store, sampled
+calls only once enough variants are collected, and hot calls never.
+"""
+import asyncio
+import pytest
+from app.agents.cache import ResponseCache
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def cache_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CACHE_ENABLED", True)
+
+
+def test_deterministic_result_is_served_from_both_tiers(fake_redis):
+    async def main():
+        cache = ResponseCache(redis_client=fake_redis)
+        key = cache.make_key("emotion", message="how are you")
+
+        assert await cache.get(key, temperature=0.0) is None
+        await cache.set(key, {"new_state": "sadness"}, temperature=0.0, ttl=60)
+        assert await cache.get(key, temperature=0.0) == {"new_state": "sadness"}
+        assert cache.stats["local_hits"] == 1
+
+        # Another process only shares Redis
+        other = ResponseCache(redis_client=fake_redis)
+        assert await other.get(key, temperature=0.0) == {"new_state": "sadness"}
+        assert other.stats["redis_hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_sampled_result_needs_every_variant(fake_redis):
+    async def main():
+        cache = ResponseCache(redis_client=fake_redis)
+        key = cache.make_key("reply", message="what happens now")
+        replies = [f"Reply {n}" for n in range(settings.LLM_CACHE_SAMPLED_VARIANTS)]
+
+        for reply in replies:
+            assert await cache.get(key, temperature=0.7) is None
+            await cache.set(key, reply, temperature=0.7, ttl=60)
+
+        assert await cache.get(key, temperature=0.7) in replies
+        assert await fake_redis.llen(key) == len(replies)
+
+    asyncio.run(main())
+
+
+def test_hot_calls_bypass_the_cache(fake_redis):
+    async def main():
+        cache = ResponseCache(redis_client=fake_redis)
+        key = cache.make_key("reply", message="hello")
+        hot = settings.LLM_CACHE_MAX_TEMPERATURE + 0.1
+
+        await cache.set(key, "Hello", temperature=hot, ttl=60)
+        assert await cache.get(key, temperature=hot) is None
+        assert cache.stats["bypassed"] == 1
+        assert not await fake_redis.exists(key)
+
+    asyncio.run(main())
+
+
+def test_keys_ignore_argument_order():
+    cache = ResponseCache(redis_client=object())
+    assert cache.make_key("reply", a=1, b=2) == cache.make_key("reply", b=2, a=1)
+    assert cache.make_key("reply", a=1) != cache.make_key("emotion", a=1)
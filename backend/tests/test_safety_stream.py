@@ -0,0 +1,96 @@
+"""
+Streaming safety check: each sentence is checked on its own as it is
+generated and released in order once approved; a flagged sentence ends
+the stream with the safe fallback, and a reply of several sentences
+gets one final whole-response check.
+"""
+import asyncio
+import pytest
+from app.agents.safety_agent import SafetyAgent, split_sentences
+
+CONTEXT = {"emotional_state": "denial", "scenario": {"id": 1}}
+
+REPLY = ["No, that can't be right. ", "She was fine last week. ", "Are you sure?"]
+
+
+@pytest.fixture
+def checks(monkeypatch):
+    """(text, preceding) of every check; text containing "UNSAFE" fails"""
+    calls = []
+
+    async def evaluate(self, response, context, preceding=""):
+        calls.append((response, preceding))
+        await asyncio.sleep(0)
+        if "UNSAFE" in response:
+            return {"safe": False, "issues": ["Gives false hope"]}
+        return {"safe": True, "issues": []}
+
+    monkeypatch.setattr(SafetyAgent, "_evaluate", evaluate)
+    return calls
+
+
+class Tokens:
+    """Reply streamed a word at a time, noting how far it was read"""
+
+    def __init__(self, sentences):
+        self.words = [word + " " for word in "".join(sentences).split()]
+        self.words[-1] = self.words[-1].rstrip()
+        self.read = 0
+        self.closed = False
+
+    async def __aiter__(self):
+        try:
+            for word in self.words:
+                # Like a model stream, give pending checks a chance to run
+                await asyncio.sleep(0)
+                self.read += 1
+                yield word
+        finally:
+            self.closed = True
+
+
+async def collect(tokens) -> list:
+    agent = SafetyAgent()
+    return [event async for event in agent.check_response_stream(tokens.__aiter__(), CONTEXT)]
+
+
+def test_split_sentences_keeps_unfinished_remainder():
+    assert split_sentences("It's 3.5 cm. Is that") == (["It's 3.5 cm. "], "Is that")
+    assert split_sentences("本当ですか。はい") == (["本当ですか。"], "はい")
+
+
+def test_sentences_are_released_in_order(checks):
+    events = asyncio.run(collect(Tokens(REPLY)))
+
+    sentences = [event["content"] for event in events if event["type"] == "sentence"]
+    assert "".join(sentences) == "".join(REPLY)
+    assert events[-1] == {
+        "type": "result", "safe": True, "issues": [], "modified_response": "".join(REPLY)
+    }
+    # One check per sentence with the text before it, then the whole reply
+    assert checks[0] == (REPLY[0], "")
+    assert checks[1] == (REPLY[1], REPLY[0])
+    assert checks[-1] == ("".join(REPLY), "")
+    assert len(checks) == len(REPLY) + 1
+
+
+def test_single_sentence_is_checked_once(checks):
+    events = asyncio.run(collect(Tokens(["I see."])))
+
+    assert events[-1]["safe"]
+    assert checks == [("I see.", "")]
+
+
+def test_flagged_sentence_stops_the_stream(checks):
+    tokens = Tokens(["Please listen to me. ", "UNSAFE she will be cured. "] + REPLY * 5)
+    events = asyncio.run(collect(tokens))
+
+    assert [event["type"] for event in events] == ["sentence", "result"]
+    result = events[-1]
+    assert not result["safe"]
+    assert result["issues"] == ["Gives false hope"]
+    assert result["released"] == "Please listen to me. "
+    assert result["modified_response"] != result["released"]
+    # Generation was abandoned as soon as the verdict came back
+    assert tokens.closed
+    assert tokens.read < len(tokens.words)
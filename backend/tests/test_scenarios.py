@@ -0,0 +1,67 @@
+"""
+Scenario endpoints serve prebuilt bodies with content ETags and answer
+304 only when If-None-Match names the current tag (or is *).
+"""
+import asyncio
+import httpx
+import pytest
+from app.api.scenarios import etag_matches
+from app.core.database import close_database
+from app.main import app
+from app.services.scenarios import scenario_catalog
+
+ETAG = '"0123456789abcdef"'
+
+
+@pytest.mark.parametrize("header", [
+    ETAG,
+    f'W/{ETAG}',
+    f'"other", {ETAG}',
+    f'"other",W/{ETAG}',
+    "*"
+])
+def test_matching_if_none_match(header):
+    assert etag_matches(header, ETAG)
+
+
+@pytest.mark.parametrize("header", [
+    "",
+    '"other"',
+    # A tag that merely contains ours is a different tag
+    '"0123456789abcdef0"',
+    '"x0123456789abcdef"'
+])
+def test_non_matching_if_none_match(header):
+    assert not etag_matches(header, ETAG)
+
+
+def test_scenario_list_revalidates(fake_redis, monkeypatch):
+    # No database here: the catalog falls back to the built-in scenarios
+    monkeypatch.setattr(scenario_catalog, "_checked_at", 0.0)
+
+    async def main():
+        try:
+            await fetch()
+        finally:
+            await close_database()
+
+    async def fetch():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get("/api/scenarios/")
+            assert first.status_code == 200
+            etag = first.headers["etag"]
+
+            cached = await client.get("/api/scenarios/", headers={"If-None-Match": etag})
+            assert cached.status_code == 304
+            assert cached.content == b""
+
+            stale = await client.get("/api/scenarios/", headers={"If-None-Match": '"stale"'})
+            assert stale.status_code == 200
+            assert stale.json() == first.json()
+
+            detail = await client.get("/api/scenarios/1")
+            assert detail.headers["etag"] != etag
+            assert (await client.get("/api/scenarios/99")).status_code == 404
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+"""
+Speech disk cache: audio is stored once a stream completes, served by
+key afterwards, kept under max_bytes by least-recent eviction, and the
+index survives a restart.
+"""
+import asyncio
+import pytest
+from app.services.tts_cache import SpeechCache
+
+AUDIO = [b"ID3" + b"\0" * 97, b"\xff" * 100]
+
+
+async def chunks(pieces, fail_after=None):
+    for index, piece in enumerate(pieces):
+        if index == fail_after:
+            raise ConnectionError("upstream went away")
+        yield piece
+
+
+async def store(cache: SpeechCache, key: str, pieces=AUDIO, fail_after=None) -> bytes:
+    received = b""
+    async for chunk in cache.fill(key, chunks(pieces, fail_after)):
+        received += chunk
+    return received
+
+
+def test_completed_stream_is_cached(tmp_path):
+    cache = SpeechCache(str(tmp_path), max_bytes=10_000)
+    key = cache.key("I see.", "nova", 1.0, "tts-1")
+    assert cache.lookup(key) is None
+
+    assert asyncio.run(store(cache, key)) == b"".join(AUDIO)
+
+    path = cache.lookup(key)
+    assert path.read_bytes() == b"".join(AUDIO)
+    assert cache.stats["hits"] == 1 and cache.stats["stores"] == 1
+    assert cache.key("I see.", "nova", 1.0, "tts-1") == key
+    assert cache.key("I see.", "shimmer", 1.0, "tts-1") != key
+
+
+def test_interrupted_stream_leaves_nothing(tmp_path):
+    cache = SpeechCache(str(tmp_path), max_bytes=10_000)
+    key = cache.key("I see.", "nova", 1.0, "tts-1")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(store(cache, key, fail_after=1))
+
+    assert cache.lookup(key) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_least_recently_used_is_evicted(tmp_path):
+    cache = SpeechCache(str(tmp_path), max_bytes=450)
+    keys = [cache.key(f"Line {n}", "nova", 1.0, "tts-1") for n in range(3)]
+    asyncio.run(store(cache, keys[0]))
+    asyncio.run(store(cache, keys[1]))
+    cache.lookup(keys[0])  # Now the most recent
+
+    asyncio.run(store(cache, keys[2]))
+
+    assert cache.lookup(keys[1]) is None
+    assert cache.lookup(keys[0]) is not None and cache.lookup(keys[2]) is not None
+    assert cache.get_stats()["bytes"] <= 450
+    assert cache.stats["evictions"] == 1
+
+
+def test_index_is_rebuilt_on_restart(tmp_path):
+    cache = SpeechCache(str(tmp_path), max_bytes=10_000)
+    key = cache.key("I see.", "nova", 1.0, "tts-1")
+    asyncio.run(store(cache, key))
+    (tmp_path / "leftover.part").write_bytes(b"partial")
+
+    restarted = SpeechCache(str(tmp_path), max_bytes=10_000)
+
+    assert restarted.lookup(key) is not None
+    assert restarted.get_stats()["bytes"] == len(b"".join(AUDIO))
+    assert not (tmp_path / "leftover.part").exists()
@@ -50,8 +50,22 @@ export default function ConversationPage() {
         setShowHint(true)
       } else if (data.type === 'system') {
         alert(data.content)
+      } else if (data.type === 'delta') {
+        // Grow the in-progress agent reply as tokens arrive
+        setMessages((prev) => {
+          const last = prev[prev.length - 1]
+          if (last && last.type === 'delta') {
+            return [...prev.slice(0, -1), { ...last, content: last.content + data.content }]
+          }
+          return [...prev, { role: 'agent', content: data.content, type: 'delta' }]
+        })
       } else {
-        setMessages((prev) => [...prev, data])
+        // The final frame replaces any streamed partial reply
+        setMessages((prev) => {
+          const last = prev[prev.length - 1]
+          const settled = last && last.type === 'delta' ? prev.slice(0, -1) : prev
+          return [...settled, data]
+        })
         if (data.emotional_state) {
           setCurrentEmotion(data.emotional_state)
         }
@@ -102,6 +116,7 @@ export default function ConversationPage() {
     wsRef.current.send(JSON.stringify({
       type: 'message',
       content: textToSend,
+      stream: true,
     }))
     
     setInputMessage('')
@@ -211,7 +226,15 @@ export default function ConversationPage() {
     }))
   }
 
-  const handleEndConversation = () => {
+  const handleEndConversation = async () => {
+    // Starts feedback generation in the background
+    try {
+      await fetch(`http://localhost:8000/api/conversations/end/${conversationId}`, {
+        method: 'POST',
+      })
+    } catch (error) {
+      console.error('Failed to end conversation:', error)
+    }
     router.push(`/feedback/${conversationId}`)
   }
 
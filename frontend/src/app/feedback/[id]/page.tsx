@@ -32,15 +32,20 @@ export default function FeedbackPage() {
   const fetchFeedback = async () => {
     try {
       const response = await fetch(
-        `http://localhost:8000/api/conversations/${conversationId}/feedback`
+        `http://localhost:8000/api/feedback/${conversationId}`
       )
-      const data = await response.json()
-      setFeedback(data)
+      if (response.status === 202) {
+        // Still being generated; check again shortly
+        setTimeout(fetchFeedback, 2000)
+        return
+      }
+      if (response.ok) {
+        setFeedback(await response.json())
+      }
     } catch (error) {
       console.error('Failed to fetch feedback:', error)
-    } finally {
-      setLoading(false)
     }
+    setLoading(false)
   }
 
   const getScoreColor = (score: number) => {